@@ -0,0 +1,33 @@
+"""added product search
+
+Revision ID: 5f2c8b6e9d10
+Revises: c4a9f1e07d35
+Create Date: 2026-10-17 12:58:44.120337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2c8b6e9d10'
+down_revision: Union[str, None] = 'c4a9f1e07d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Stored generated column, Postgres fills it for existing products while adding
+    op.add_column('product_table', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "to_tsvector('russian', coalesce(title, '')) || to_tsvector('english', coalesce(title, ''))", persisted=True), nullable=False))
+    op.create_index('ix_product_table_search_vector', 'product_table', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_product_table_title_trgm', 'product_table', ['title'], unique=False, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_table_title_trgm', table_name='product_table', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+    op.drop_index('ix_product_table_search_vector', table_name='product_table', postgresql_using='gin')
+    op.drop_column('product_table', 'search_vector')
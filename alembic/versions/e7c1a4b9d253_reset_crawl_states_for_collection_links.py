@@ -0,0 +1,30 @@
+"""reset crawl states for collection links
+
+Revision ID: e7c1a4b9d253
+Revises: d2b7f5a1c8e4
+Create Date: 2026-10-17 15:02:44.918357
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c1a4b9d253'
+down_revision: Union[str, None] = 'd2b7f5a1c8e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Collection products were never linked and unchanged pages are not parsed again,
+    # so the next crawl parses every page to fill collection_product_table
+    op.execute("DELETE FROM crawl_state_table")
+
+
+def downgrade() -> None:
+    # Lossy: deleted crawl states can't be restored. They are only a cache of page fetches,
+    # the next crawl fetches and parses every page and saves them again
+    pass
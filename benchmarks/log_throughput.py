@@ -0,0 +1,99 @@
+"""Requests/second of an endpoint logging like the api routes, with logging off, sync file logging and queued logging.
+
+Run: python -m benchmarks.log_throughput
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import logger
+from fastapp.middleware import RequestIdMiddleware
+
+REQUESTS_COUNT = 3000
+CONCURRENCY = 50
+DEBUG_LINES = 5
+ROUNDS = 5  # modes are measured in turns, best round is printed
+
+
+def create_app(py_logger: logging.Logger, lazy: bool) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestIdMiddleware)
+
+    @app.get("/")
+    async def endpoint():
+        user_ip = "127.0.0.1"
+        for i in range(DEBUG_LINES):
+            if lazy:
+                py_logger.debug("Step %s. IP: %s", i, user_ip)
+            else:
+                py_logger.debug(f"Step {i}. IP: {user_ip}")
+        return {"status": "success"}
+
+    return app
+
+
+def get_sync_logger(log_dir: str) -> logging.Logger:
+    # Previous behaviour: FileHandler at DEBUG written on the event loop thread
+    py_logger = logging.getLogger("benchmark.sync")
+    py_logger.setLevel(logging.DEBUG)
+    py_handler = logging.FileHandler(os.path.join(log_dir, "sync.log"), mode='a')
+    py_handler.setFormatter(logging.Formatter("[%(asctime)s][%(name)s][%(levelname)s]: %(message)s"))
+    py_logger.addHandler(py_handler)
+    return py_logger
+
+
+def get_queue_logger(name: str, level: int, debug_sample_rate: float = 1) -> logging.Logger:
+    py_logger = logger.get_logger(f"benchmark.{name}", file_name=f"benchmark_{name}")
+    py_logger.setLevel(level)
+    for log_filter in py_logger.handlers[0].filters:
+        log_filter.debug_sample_rate = debug_sample_rate
+    return py_logger
+
+
+async def measure(app: FastAPI) -> float:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def request() -> None:
+            async with semaphore:
+                await client.get("/")
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*[request() for _ in range(REQUESTS_COUNT)])
+        elapsed = time.perf_counter() - started_at
+
+    return REQUESTS_COUNT / elapsed
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as log_dir:
+        logger.config.LOG_PATH = log_dir
+
+        disabled_logger = logging.getLogger("benchmark.disabled")
+        disabled_logger.disabled = True
+        apps: dict[str, FastAPI] = {
+            "logging off": create_app(disabled_logger, lazy=True),
+            "sync file, debug, f-strings": create_app(get_sync_logger(log_dir), lazy=False),
+            "queue, debug": create_app(get_queue_logger("debug", logging.DEBUG), lazy=True),
+            "queue, debug sampled 10%": create_app(get_queue_logger("sampled", logging.DEBUG, 0.1), lazy=True),
+            "queue, info": create_app(get_queue_logger("info", logging.INFO), lazy=True),
+        }
+
+        results: dict[str, list[float]] = {name: [] for name in apps}
+        for _ in range(ROUNDS):
+            for name, app in apps.items():
+                results[name].append(await measure(app))
+
+        for name, requests_per_second in results.items():
+            print(f"{name}: {max(requests_per_second):.0f} requests/s")
+
+        logger.stop_logging()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Logins/second of password verification under concurrency, and event loop stalls meanwhile.
+
+Run: python -m benchmarks.login
+"""
+import asyncio
+import time
+
+from fastapp.passwords import PasswordHasher, calibrate
+
+PASSWORD = "password"
+LOGINS_COUNT = 100
+CONCURRENCY = 50
+
+
+async def watch_loop_lag(stop: asyncio.Event) -> float:
+    # Longest delay of a 1 ms sleep, shows how long other requests would wait
+    max_lag: float = 0
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        await asyncio.sleep(0.001)
+        max_lag = max(max_lag, time.perf_counter() - started_at - 0.001)
+
+    return max_lag
+
+
+async def verify_in_loop(hasher: PasswordHasher, password_hash: str) -> None:
+    # Hashing on the event loop thread, blocks everything else
+    hasher._verify(PASSWORD, password_hash)
+
+
+async def verify_pooled(hasher: PasswordHasher, password_hash: str) -> None:
+    await hasher.verify(PASSWORD, password_hash)
+
+
+async def measure(name: str, verify, hasher: PasswordHasher, password_hash: str) -> None:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def login() -> None:
+        async with semaphore:
+            await verify(hasher, password_hash)
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop_lag(stop))
+    await asyncio.sleep(0)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(LOGINS_COUNT)])
+    elapsed = time.perf_counter() - started_at
+
+    stop.set()
+    max_lag = await watcher
+    print(f"{name}: {LOGINS_COUNT / elapsed:.0f} logins/s, max event loop lag {max_lag * 1000:.0f} ms")
+
+
+async def main():
+    n = calibrate()
+
+    for worker_count in (1, 4):
+        hasher = PasswordHasher(worker_count=worker_count, n=n)
+        password_hash = await hasher.hash(PASSWORD)
+
+        if worker_count == 1:
+            await measure(f"in event loop (n={hasher.n})", verify_in_loop, hasher, password_hash)
+        await measure(f"pool of {worker_count} (n={hasher.n})", verify_pooled, hasher, password_hash)
+
+    legacy_hasher = PasswordHasher(worker_count=1)
+    await measure("legacy sha256 in pool", verify_pooled, legacy_hasher, "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""Messages/second of email delivery against a local aiosmtpd server.
+
+Run: python -m benchmarks.smtp (needs `pip install -r requirements-dev.txt`)
+"""
+import asyncio
+import time
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+
+from fastapp import sender
+
+HOST = "127.0.0.1"
+PORT = 8025
+MESSAGES_COUNT = 500
+
+
+class NullHandler:
+    async def handle_DATA(self, server, session, envelope):
+        return "250 Message accepted for delivery"
+
+
+def get_messages() -> list[tuple[str, str, str]]:
+    return [(f"user{i}@example.com", "Title", "Message") for i in range(MESSAGES_COUNT)]
+
+
+async def send_connection_per_message(messages: list[tuple[str, str, str]]) -> None:
+    # Previous behaviour: new connection for every message
+    for message in messages:
+        msg = sender.create_email_message(*message)
+        await aiosmtplib.send(msg, sender="sender@example.com", recipients=message[0], hostname=HOST, port=PORT)
+
+
+async def send_pooled(messages: list[tuple[str, str, str]], pool_size: int) -> None:
+    smtp_pool = sender.SMTPPool(size=pool_size, rate_limit=0, hostname=HOST,
+                                port=PORT, username=None, password=None, use_tls=False)
+    await asyncio.gather(*[smtp_pool.send_message(sender.create_email_message(*message)) for message in messages])
+    await smtp_pool.close()
+
+
+async def measure(name: str, coro) -> None:
+    start = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {MESSAGES_COUNT / elapsed:.0f} messages/s")
+
+
+async def main():
+    controller = Controller(NullHandler(), hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        await measure("connection per message", send_connection_per_message(get_messages()))
+        await measure("pool of 1 connection", send_pooled(get_messages(), 1))
+        await measure("pool of 3 connections", send_pooled(get_messages(), 3))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
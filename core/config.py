@@ -1,9 +1,18 @@
+import json
 import os
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Logging
+
+LOG_PATH = "logs"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", 1))  # share of debug records written
+LOG_QUEUE_SIZE = 10000  # records waiting for the writer thread, newer ones are dropped
+LOG_WRITE_BATCH_SIZE = 1000  # records written by the writer thread with one write
+
 # Database
 
 POSTGRESQL_USER = os.environ.get("POSTGRESQL_USER")
@@ -18,6 +27,11 @@ EMAIL_LOGIN = os.environ.get("EMAIL_LOGIN")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 EMAIL_SMTP_HOST = os.environ.get("EMAIL_SMTP_HOST")
 EMAIL_SMTP_PORT = os.environ.get("EMAIL_SMTP_PORT")
+EMAIL_SMTP_USE_TLS = True
+EMAIL_SMTP_TIMEOUT = 60
+EMAIL_SMTP_POOL_SIZE = 3  # connections per worker process
+EMAIL_RATE_LIMIT = 10  # messages per second per worker process, 0 - no limit
+EMAIL_BATCH_SIZE = 100  # messages per send_mails task
 
 # Tasks broker
 
@@ -25,10 +39,29 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 CELERY_BACKEND_URL = os.environ.get("CELERY_BACKEND_URL")
 CELERY_WORKER_COUNT = 3
 
+# Metrics
+
+# Directory of metrics files shared by worker processes (read by prometheus_client too), single process metrics if not set
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+CELERY_METRICS_PORT = os.environ.get("CELERY_METRICS_PORT")  # port of celery workers /metrics, not served if not set
+
+# Cache
+
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL")  # optional, in-process cache only if not set
+CATALOG_CACHE_MAX_ENTRIES = 1024
+CATALOG_CACHE_TTL_SECONDS = 60 * 60  # 1 hour
+CATALOG_CACHE_LOCAL_TTL_SECONDS = 30  # without any Redis the scraper version bump isn't seen by web workers, bounds staleness
+CATALOG_CACHE_VERSION_CHECK_SECONDS = 1
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+PRINCIPAL_CACHE_TTL_SECONDS = 30  # bounds staleness of other workers after user changes
+
 # User identification
 
-JWT_SECRET = os.environ.get("JWT_SECRET")
+JWT_SECRET = os.environ.get("JWT_SECRET")  # verifies tokens without kid, signs if JWT_KEYS is not set
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM")
+# Signing keys by kid as json: {"2024-09": "secret", ...}. Old keys are kept until tokens signed by them expire
+JWT_KEYS: dict[str, str] = json.loads(os.environ.get("JWT_KEYS") or "{}") or {"default": JWT_SECRET}
+JWT_KID = os.environ.get("JWT_KID") or next(iter(JWT_KEYS))  # kid of the signing key
 ACCESS_TOKEN_EXPIRES_MINUTES = 15
 REFRESH_TOKEN_EXPIRES_MINUTES = 15 * 24 * 60  # 15 days
 REFRESH_COOKIE_NAME = "refresh"
@@ -36,8 +69,27 @@ SUB = "sub"
 EXP = "exp"
 IAT = "iat"
 JTI = "jti"
+TYP = "typ"
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_REVOCATION_SYNC_SECONDS = 1
+TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS = 60
+TOKEN_REVOCATION_BLOOM_CAPACITY = 1_000_000
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
 JWT_EMAIL_PHONE_EXPIRES_MINUTES = 15
 
+PASSWORD_HASH_WORKER_COUNT = 4  # concurrent hashings, each takes about PASSWORD_HASH_TARGET_MS of cpu
+# scrypt cost, the same in every worker. Recommended n for the host: python -m fastapp.passwords
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", 2 ** 15))
+PASSWORD_HASH_TARGET_MS = 100  # latency the recommended n is calibrated to
+PASSWORD_SCRYPT_MIN_N = 2 ** 14
+PASSWORD_SCRYPT_MAX_N = 2 ** 20
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_SCRYPT_KEY_LENGTH = 32
+PASSWORD_SALT_LENGTH = 16
+
 VERIFICATION_CODE_LENGTH = 6
 VERIFICATION_CODE_ONLY_DIGITS = True
 VERIFICATION_CODE_EXPIRES_MINUTES = 15
@@ -53,10 +105,41 @@ SCRAPER_PAGE_LOAD_TIMEOUT = 5 * 60  # 5 minutes
 SCRAPER_PAGE_LOAD_MAX_TRYINGS = 3
 SCRAPER_PAGE_LOAD_MAX_COUNT = 100
 SCRAPER_SLEEP_ON_ERROR = 5  # 5 seconds
-
-# Media
+SCRAPER_MAX_CONCURRENT_REQUESTS = 16
+SCRAPER_MAX_CONCURRENT_REQUESTS_PER_HOST = 8
+# Pages are parsed in a process pool. Set to False to parse in the event loop (debugging).
+# Daemonic processes (celery prefork pool) can't start a process pool, a thread pool is used there.
+SCRAPER_PARSE_IN_PROCESS_POOL = True
+SCRAPER_PARSER_WORKER_COUNT = os.cpu_count()
+SCRAPER_PARSER_BACKEND = "selectolax"  # "selectolax" or "bs4" (fallback)
+# Crawl pipeline: fetch -> parse -> normalize -> write. Stages are connected by queues of this size,
+# so a slow stage makes the previous ones wait instead of holding the whole catalog in memory.
+SCRAPER_PIPELINE_QUEUE_SIZE = 32
+SCRAPER_NORMALIZE_WORKER_COUNT = 8
+SCRAPER_WRITE_BATCH_SIZE = 5000  # rows per COPY
+
+# Static and media
+
+STATIC_PATH = "fastapp/static"
+# Static files are copied here with fingerprinted names (name.<hash>.ext) and gzip/brotli variants
+STATIC_BUILD_PATH = "build/static"
+# Built at app startup, turn off if static is built at deploy: python -m fastapp.assets
+STATIC_BUILD_ON_STARTUP = True
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # 1 year, for fingerprinted and content addressed files
+# If nginx is in front, files are sent by it: app answers with X-Accel-Redirect to {prefix}/static/... and {prefix}/media/...
+# nginx needs internal locations for them, e.g. location /protected/static/ { internal; alias /app/build/static/; }
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX")  # e.g. "/protected"
 
 MEDIA_PATH = "media"
+MEDIA_URL = "/media"
+# Product images are downloaded by a pool of workers, bodies are written to disk in chunks
+SCRAPER_IMAGE_WORKER_COUNT = 8
+SCRAPER_IMAGE_CHUNK_SIZE = 64 * 1024
+# Thumbnails of product images, made in the parser process pool. Card image is 400px wide.
+# AVIF needs pillow-avif-plugin, without it only WebP is made.
+MEDIA_THUMBNAIL_WIDTHS = (200, 400, 800)
+MEDIA_THUMBNAIL_FORMATS = ("avif", "webp")
+MEDIA_THUMBNAIL_QUALITY = 75
 
 # Web
 
@@ -1,102 +1,133 @@
 import traceback
+import uuid
 
-from fastapi import APIRouter, Query, Depends, HTTPException, status
+from fastapi import APIRouter, Query, Depends, HTTPException, Request, Response, status
 from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core import config
 from fastapp.database import get_db
 from fastapp import dependencies, exceptions, schemas, crud
 from fastapp import models
+from fastapp.cache import get_cached_json_response
 from logger import get_logger
 
 py_logger = get_logger("v1/routes.py")
 
 router = APIRouter(prefix="/v1", tags=["v1"])
 
+collections_adapter = TypeAdapter(list[schemas.CollectionGet])
+products_adapter = TypeAdapter(list[schemas.ProductGet])
+
 
 @router.get("/collection", response_model=list[schemas.CollectionGet], status_code=status.HTTP_200_OK)
-async def get_collections(user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.CollectionGet]:
+async def get_collections(request: Request, user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> Response:
     try:
-        py_logger.debug(f"Getting collections. IP: {user_ip}")
-        collections: list[models.Collection] = await crud.get_collections(db)
+        py_logger.debug("Getting collections. IP: %s", user_ip)
+
+        async def build() -> tuple[bytes, dict]:
+            collections: list[models.Collection] = await crud.get_collections(db, load="collection_list")
+            return collections_adapter.dump_json(collections_adapter.validate_python(collections)), {}
 
-        return collections
+        return await get_cached_json_response(request, build)
+    except HTTPException:
+        raise
     except Exception as e:
-        py_logger.error(f"Unexpected error. IP: {user_ip}", exc_info=True)
+        py_logger.error("Unexpected error. IP: %s", user_ip, exc_info=True)
         raise exceptions.BadRequestException(detail=e)
 
 
 @router.get("/product", response_model=list[schemas.ProductGet], status_code=status.HTTP_200_OK)
-async def get_product(collection_vsrap_ids: list[int] | None = Query(default=None), search_text: str | None = None, page: int = 0, page_size: int = config.MAX_OBJECTS_PER_PAGE, user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.Product]:
+async def get_product(request: Request, collection_vsrap_ids: list[int] | None = Query(default=None), search_text: str | None = None, page: int = 0, page_size: int = config.MAX_OBJECTS_PER_PAGE, cursor: str | None = None, user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> Response:
+    """Products ordered by (price, vsrap_id).
+
+    Full page has X-Next-Cursor header, pass it as cursor to get the next page.
+    page is kept for compatibility and is ignored when cursor is set.
+    With search_text products are ordered by relevance and paginated by page.
+    """
     try:
         py_logger.debug(
-            f"Getting products ({page}, {page_size}). IP: {user_ip}")
+            "Getting products (%s, %s, %s). IP: %s", page, page_size, cursor, user_ip)
         if page_size > config.MAX_OBJECTS_PER_PAGE:
             py_logger.debug(
-                f"Page size is bigger than Max Objects Per Page. IP: {user_ip}", exc_info=True)
+                "Page size is bigger than Max Objects Per Page. IP: %s", user_ip, exc_info=True)
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail=f"Max page_size is {config.MAX_OBJECTS_PER_PAGE}"
             )
 
-        products: list[models.Product]
+        cursor_values: tuple | None = dependencies.decode_cursor(
+            cursor) if cursor else None
+
+        async def build() -> tuple[bytes, dict]:
+            products: list[models.Product]
 
-        if collection_vsrap_ids:
-            products: models.Product = await crud.get_products_by_collection_vsrap_id(db, collection_vsrap_ids, page, page_size, search_text)
-        else:
-            products = await crud.get_products(db, page=page, page_size=page_size, search_text=search_text)
+            if collection_vsrap_ids:
+                products: models.Product = await crud.get_products_by_collection_vsrap_id(db, collection_vsrap_ids, page, page_size, search_text, cursor_values, load="product_list")
+            else:
+                products = await crud.get_products(db, page=page, page_size=page_size, search_text=search_text, cursor=cursor_values, load="product_list")
 
-        return products
+            headers: dict = {}
+            if page_size and len(products) == page_size and not search_text:
+                headers["X-Next-Cursor"] = dependencies.encode_cursor(
+                    (products[-1].price, products[-1].vsrap_id))
+
+            return products_adapter.dump_json(products_adapter.validate_python(products)), headers
+
+        return await get_cached_json_response(request, build)
+    except HTTPException:
+        raise
     except Exception as e:
-        py_logger.error(f"Unexpected error. IP: {user_ip}", exc_info=True)
+        py_logger.error("Unexpected error. IP: %s", user_ip, exc_info=True)
         raise exceptions.BadRequestException(detail=e)
 
 
 @router.get("/user/combination", response_model=list[schemas.CombinationBase], status_code=status.HTTP_200_OK)
-async def get_user_combinations(user: models.User = Depends(dependencies.get_user_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.CombinationBase]:
-    py_logger.debug(f"Getting user_combinations. IP: {user_ip}")
-    combinations: list[models.Combination] = user.combinations
+async def get_user_combinations(user_id: uuid.UUID = Depends(dependencies.get_user_id_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.CombinationBase]:
+    py_logger.debug("Getting user_combinations. IP: %s", user_ip)
+    combinations: list[models.Combination] = await crud.get_user_combinations(db, user_id)
 
     return combinations
 
 
 @router.post("/user/combination", response_model=list[schemas.CombinationBase], status_code=status.HTTP_200_OK)
-async def add_user_combinations(combination_id: int, user: models.User = Depends(dependencies.get_user_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.CombinationBase]:
-    py_logger.debug(f"Adding user_combination. IP: {user_ip}")
+async def add_user_combinations(combination_id: int, user_id: uuid.UUID = Depends(dependencies.get_user_id_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> list[schemas.CombinationBase]:
+    py_logger.debug("Adding user_combination. IP: %s", user_ip)
     combination: models.Combination | None = await crud.get_combination_by_id(db, combination_id)
 
     if not combination:
-        py_logger.debug(f"Combination not found. IP: {user_ip}")
+        py_logger.debug("Combination not found. IP: %s", user_ip)
         raise exceptions.NotFoundException(detail="Combination not found")
 
-    
-    await crud.add_combination_to_user(db, combination.id, user.id)
-    await crud.update_user(db, user)
+    await crud.add_combination_to_user(db, combination.id, user_id)
 
-    return user.combinations
+    return await crud.get_user_combinations(db, user_id)
 
 
 @router.delete("/user/combination/{combination_id}", status_code=status.HTTP_200_OK)
-async def delete_user_combination(combination_id: int, user: models.User = Depends(dependencies.get_user_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> JSONResponse:
-    py_logger.debug(f"Removing user_combination. IP: {user_ip}")
+async def delete_user_combination(combination_id: int, user_id: uuid.UUID = Depends(dependencies.get_user_id_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    py_logger.debug("Removing user_combination. IP: %s", user_ip)
     combination: models.Combination | None = await crud.get_combination_by_id(db, combination_id)
 
     if not combination:
-        py_logger.debug(f"Combination notfound. IP: {user_ip}")
+        py_logger.debug("Combination notfound. IP: %s", user_ip)
         raise exceptions.NotFoundException(detail="Combination not found")
 
-    await crud.remove_combination_from_user(db, combination.id, user.id)
-    await crud.update_user(db, user)
+    await crud.remove_combination_from_user(db, combination.id, user_id)
 
     return JSONResponse({"status": "success"})
 
 
 @router.get("/user/products", response_model=list[schemas.Product], status_code=status.HTTP_200_OK)
-async def get_user_products(user: models.User = Depends(dependencies.get_user_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> JSONResponse:
-    py_logger.debug(f"Getting user_combination. IP: {user_ip}")
-    combinations: list[models.Combination] = user.combinations
-
-    products: list[models.Product] = await crud.get_products_by_combinations(db, combinations)
+async def get_user_products(page: int = 0, page_size: int = config.MAX_OBJECTS_PER_PAGE, user_id: uuid.UUID = Depends(dependencies.get_user_id_from_access_token), user_ip: str = Depends(dependencies.get_ip_from_request), db: AsyncSession = Depends(get_db)) -> JSONResponse:
+    py_logger.debug("Getting user_combination (%s, %s). IP: %s", page, page_size, user_ip)
+    if page_size > config.MAX_OBJECTS_PER_PAGE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Max page_size is {config.MAX_OBJECTS_PER_PAGE}"
+        )
+
+    products: list[models.Product] = await crud.get_user_products(db, user_id, page, page_size)
 
     return products
@@ -0,0 +1,228 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from collections.abc import AsyncIterator
+from functools import lru_cache
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.staticfiles import NotModifiedResponse, PathLike, StaticFiles
+from starlette.types import Scope
+
+from core import config
+from logger import get_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+py_logger = get_logger("assets.py")
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".html", ".svg", ".json", ".txt", ".map"}
+# Preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+FINGERPRINT_RE = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def get_fingerprinted_path(path: str, content: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def write_file(path: str, content: bytes) -> None:
+    # Several app workers build static at once, so file is replaced atomically
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == content:
+                return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_static(source_dir: str = config.STATIC_PATH, build_dir: str = config.STATIC_BUILD_PATH) -> dict[str, str]:
+    """Copies static files to build_dir under their own and fingerprinted names, with gzip (and brotli) variants.
+
+    Returns manifest {path: fingerprinted path}, it is saved to build_dir/manifest.json as well.
+    Run with `python -m fastapp.assets` to build static before deploy (nginx, CDN).
+    """
+    manifest: dict[str, str] = {}
+
+    for dir_path, _, file_names in os.walk(source_dir):
+        for file_name in file_names:
+            source_path: str = os.path.join(dir_path, file_name)
+            path: str = os.path.relpath(source_path, source_dir).replace(os.sep, "/")
+            with open(source_path, "rb") as f:
+                content: bytes = f.read()
+
+            manifest[path] = get_fingerprinted_path(path, content)
+
+            variants: dict[str, bytes] = {"": content}
+            if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+                variants[".gz"] = gzip.compress(content, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    variants[".br"] = brotli.compress(content, quality=11)
+
+            for build_path in (path, manifest[path]):
+                for suffix, variant in variants.items():
+                    write_file(os.path.join(build_dir, build_path + suffix), variant)
+
+    write_file(os.path.join(build_dir, "manifest.json"),
+               json.dumps(manifest, indent=2, sort_keys=True).encode())
+    py_logger.debug("Static built: %s files", len(manifest))
+    return manifest
+
+
+def load_manifest(build_dir: str = config.STATIC_BUILD_PATH) -> dict[str, str]:
+    """Manifest of the static built before, empty if it's not built."""
+    try:
+        with open(os.path.join(build_dir, "manifest.json"), "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        py_logger.warning("Static is not built: %s", build_dir)
+        return {}
+
+
+def get_accepted_encodings(accept_encoding: str) -> set[str]:
+    """Content codings of Accept-Encoding with non-zero weight. "*" stands for codings which are not listed."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        encoding, *params = [part.strip() for part in item.split(";")]
+        weight: float = 1
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0
+        if encoding:
+            weights[encoding.lower()] = weight
+
+    return {encoding for encoding, _ in ENCODINGS if weights.get(encoding, weights.get("*", 0)) > 0}
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Returns (start, end) of a single byte range, both inclusive.
+
+    None if range is not supported (then whole file is sent), ValueError if it's out of the file.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if match is None or not any(match.groups()):
+        return None
+
+    if match[1]:
+        start, end = int(match[1]), min(int(match[2]) if match[2] else size - 1, size - 1)
+    else:
+        start, end = max(size - int(match[2]), 0), size - 1
+        if not int(match[2]):
+            raise ValueError("Empty suffix range")
+
+    if start > end or start >= size:
+        raise ValueError("Range is out of file")
+
+    return start, end
+
+
+async def read_range(path: PathLike, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as file:
+        await file.seek(start)
+        remaining: int = end - start + 1
+        while remaining > 0:
+            chunk: bytes = await file.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@lru_cache(maxsize=4096)
+def get_encoded_path(full_path: str, suffix: str) -> str | None:
+    # Variants are made once by build_static, so existence is cached
+    encoded_path = full_path + suffix
+    return encoded_path if os.path.isfile(encoded_path) else None
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control, precompressed variants, Range requests and X-Accel-Redirect.
+
+    Fingerprinted files (name.<hash>.ext) are cached for STATIC_IMMUTABLE_MAX_AGE, with immutable=True all files are
+    (content addressed media). Other files are revalidated with ETag / If-Modified-Since.
+    With x_accel_redirect set (e.g. "/protected/static") app doesn't send files, nginx does from that internal location.
+    """
+
+    def __init__(self, *args, immutable: bool = False, x_accel_redirect: str | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immutable = immutable
+        self.x_accel_redirect = x_accel_redirect
+
+    def get_cache_control(self, full_path: str) -> str:
+        if self.immutable or FINGERPRINT_RE.search(full_path):
+            return f"public, max-age={config.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+
+        return "public, no-cache"
+
+    def file_response(self, full_path: PathLike, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        media_type: str = mimetypes.guess_type(full_path)[0] or "text/plain"
+        headers: dict[str, str] = {"Cache-Control": self.get_cache_control(full_path)}
+
+        # Compressed variant is not sent for Range requests, ranges are of the original file
+        if os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS and "range" not in request_headers:
+            headers["Vary"] = "Accept-Encoding"
+            accepted_encodings: set[str] = get_accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS:
+                encoded_path: str | None = get_encoded_path(full_path, suffix)
+                if encoding in accepted_encodings and encoded_path is not None:
+                    full_path, stat_result = encoded_path, os.stat(encoded_path)
+                    headers["Content-Encoding"] = encoding
+                    break
+
+        if self.x_accel_redirect:
+            path: str = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            return Response(status_code=status_code, media_type=media_type,
+                            headers={**headers, "X-Accel-Redirect": f"{self.x_accel_redirect}/{path}"})
+
+        response = FileResponse(full_path, status_code=status_code, headers=headers,
+                                media_type=media_type, stat_result=stat_result)
+        response.headers["Accept-Ranges"] = "bytes"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header: str | None = request_headers.get("range")
+        if_range: str | None = request_headers.get("if-range")
+        if range_header is None or status_code != 200 or (if_range and if_range not in (response.headers["etag"], response.headers["last-modified"])):
+            return response
+
+        size: int = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+        if byte_range is None:
+            return response
+
+        start, end = byte_range
+        range_headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+        range_headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+
+        if scope["method"] == "HEAD":
+            return Response(status_code=206, headers=range_headers)
+
+        return StreamingResponse(read_range(full_path, start, end), status_code=206, headers=range_headers)
+
+
+if __name__ == "__main__":
+    build_static()
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+
+from fastapi import Request, Response, status
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from core import config
+from fastapp import schemas
+from logger import get_logger
+
+py_logger = get_logger("cache.py")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+def get_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def if_none_match_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match condition (RFC 9110, 13.1.2): "*" or any listed ETag, compared weakly (W/ prefix ignored)."""
+    if if_none_match.strip() == "*":
+        return True
+
+    return etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def get_version_redis_url() -> str | None:
+    # Version key is tiny, so Redis broker of celery keeps it when there is no cache Redis
+    if config.CACHE_REDIS_URL:
+        return config.CACHE_REDIS_URL
+    if config.CELERY_BROKER_URL and config.CELERY_BROKER_URL.startswith(("redis://", "rediss://", "unix://")):
+        return config.CELERY_BROKER_URL
+    return None
+
+
+class CatalogCache:
+    """Read cache of serialized catalog responses.
+
+    Entries live in an in-process LRU and, if redis url is set, in Redis (shared by all workers).
+    The scraper bumps cache version after writing new data, which drops all entries.
+    Version is kept in version_redis_url (cache Redis or Redis broker), so web workers see bumps of celery workers.
+    Without any Redis other processes can't see the new version, so entries expire after local_ttl.
+    """
+    VERSION_KEY = "catalog:version"
+
+    def __init__(self, redis_url: str | None = config.CACHE_REDIS_URL, version_redis_url: str | None = get_version_redis_url(),
+                 max_entries: int = config.CATALOG_CACHE_MAX_ENTRIES, ttl: int = config.CATALOG_CACHE_TTL_SECONDS,
+                 local_ttl: int = config.CATALOG_CACHE_LOCAL_TTL_SECONDS,
+                 version_check_interval: float = config.CATALOG_CACHE_VERSION_CHECK_SECONDS):
+        self.redis: aioredis.Redis | None = aioredis.from_url(
+            redis_url) if redis_url else None
+        if version_redis_url == redis_url:
+            self.version_redis: aioredis.Redis | None = self.redis
+        else:
+            self.version_redis = aioredis.from_url(version_redis_url) if version_redis_url else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.local_ttl = ttl if self.version_redis is not None else min(ttl, local_ttl)
+        self.version_check_interval = version_check_interval
+        self.version: str = "0"
+        self._version_checked_at: float = 0
+        # key: (expire time, response)
+        self.entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+
+    def _set_version(self, version: str) -> None:
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    async def get_version(self) -> str:
+        now = time.monotonic()
+        if self.version_redis is None or now - self._version_checked_at < self.version_check_interval:
+            return self.version
+
+        try:
+            version: bytes | None = await self.version_redis.get(self.VERSION_KEY)
+            self._set_version(version.decode() if version else "0")
+            self._version_checked_at = now
+        except RedisError:
+            py_logger.error("Error while getting catalog version", exc_info=True)
+
+        return self.version
+
+    async def bump_version(self) -> None:
+        if self.version_redis is not None:
+            try:
+                self._set_version(str(await self.version_redis.incr(self.VERSION_KEY)))
+                return
+            except RedisError:
+                py_logger.error("Error while bumping catalog version", exc_info=True)
+
+        self._set_version(str(int(self.version) + 1))
+
+    def _redis_key(self, version: str, key: str) -> str:
+        return f"catalog:{version}:{key}"
+
+    async def get(self, key: str) -> CachedResponse | None:
+        version = await self.get_version()
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        if self.redis is None:
+            return None
+
+        try:
+            data: bytes | None = await self.redis.get(self._redis_key(version, key))
+        except RedisError:
+            py_logger.error("Error while getting catalog cache", exc_info=True)
+            return None
+
+        if data is None:
+            return None
+
+        data: dict = json.loads(data)
+        cached_response = CachedResponse(body=data["body"].encode(), etag=data["etag"], headers=data["headers"])
+        self._set_local(key, cached_response)
+        return cached_response
+
+    def _set_local(self, key: str, cached_response: CachedResponse) -> None:
+        self.entries[key] = (time.monotonic() + self.local_ttl, cached_response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def set(self, key: str, cached_response: CachedResponse, version: str) -> None:
+        # Response built from data of an older version is not cached
+        if version != self.version:
+            return
+
+        self._set_local(key, cached_response)
+
+        if self.redis is not None:
+            data = {**asdict(cached_response), "body": cached_response.body.decode()}
+            try:
+                await self.redis.set(self._redis_key(version, key), json.dumps(data), ex=self.ttl)
+            except RedisError:
+                py_logger.error("Error while setting catalog cache", exc_info=True)
+
+
+catalog_cache = CatalogCache()
+
+
+class PrincipalCache:
+    """Short-lived cache of authenticated users, keyed by token sub and jti.
+
+    Entries live in an in-process LRU and, if redis url is set, in Redis.
+    Invalidation drops entries of the user here and in Redis. Other processes may keep
+    their local entries until ttl expires, so ttl is kept short.
+    """
+
+    def __init__(self, redis_url: str | None = config.CACHE_REDIS_URL, max_entries: int = config.PRINCIPAL_CACHE_MAX_ENTRIES,
+                 ttl: int = config.PRINCIPAL_CACHE_TTL_SECONDS):
+        self.redis: aioredis.Redis | None = aioredis.from_url(
+            redis_url) if redis_url else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (sub, jti): (expire time, principal)
+        self.entries: OrderedDict[tuple[str, str], tuple[float, schemas.Principal]] = OrderedDict()
+
+    def _redis_key(self, sub: str, jti: str) -> str:
+        return f"principal:{sub}:{jti}"
+
+    def _redis_user_key(self, sub: str) -> str:
+        # Set of the user principal keys
+        return f"principal:{sub}"
+
+    def _set_local(self, sub: str, jti: str, principal: schemas.Principal) -> None:
+        self.entries[(sub, jti)] = (time.monotonic() + self.ttl, principal)
+        self.entries.move_to_end((sub, jti))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, sub: str, jti: str) -> schemas.Principal | None:
+        entry = self.entries.get((sub, jti))
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end((sub, jti))
+                return entry[1]
+            del self.entries[(sub, jti)]
+
+        if self.redis is None:
+            return None
+
+        try:
+            data: bytes | None = await self.redis.get(self._redis_key(sub, jti))
+        except RedisError:
+            py_logger.error("Error while getting principal cache", exc_info=True)
+            return None
+
+        if data is None:
+            return None
+
+        principal = schemas.Principal.model_validate_json(data)
+        self._set_local(sub, jti, principal)
+        return principal
+
+    async def set(self, sub: str, jti: str, principal: schemas.Principal) -> None:
+        self._set_local(sub, jti, principal)
+
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(self._redis_key(sub, jti), principal.model_dump_json(), ex=self.ttl)
+                    pipe.sadd(self._redis_user_key(sub), jti)
+                    pipe.expire(self._redis_user_key(sub), self.ttl)
+                    await pipe.execute()
+            except RedisError:
+                py_logger.error("Error while setting principal cache", exc_info=True)
+
+    async def invalidate(self, sub: str, jti: str) -> None:
+        """Drops principal of one token (logout)."""
+        self.entries.pop((sub, jti), None)
+
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._redis_key(sub, jti))
+            except RedisError:
+                py_logger.error("Error while invalidating principal cache", exc_info=True)
+
+    async def invalidate_user(self, user_id: uuid.UUID | str) -> None:
+        """Drops principals of all tokens of the user (user or subscriptions changed)."""
+        sub = str(user_id)
+        for key in [key for key in self.entries if key[0] == sub]:
+            del self.entries[key]
+
+        if self.redis is not None:
+            try:
+                jtis: set[bytes] = await self.redis.smembers(self._redis_user_key(sub))
+                await self.redis.delete(self._redis_user_key(sub),
+                                        *(self._redis_key(sub, jti.decode()) for jti in jtis))
+            except RedisError:
+                py_logger.error("Error while invalidating principal cache", exc_info=True)
+
+
+principal_cache = PrincipalCache()
+
+
+def get_request_cache_key(request: Request) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+async def get_cached_json_response(request: Request, build: Callable[[], Awaitable[tuple[bytes, dict[str, str]]]]) -> Response:
+    """Returns cached json response of the request or builds it with build() -> (body, headers).
+
+    Responses carry ETag and If-None-Match with the same ETag is answered with 304.
+    """
+    key = get_request_cache_key(request)
+    cached_response = await catalog_cache.get(key)
+
+    if cached_response is None:
+        version = catalog_cache.version
+        body, headers = await build()
+        cached_response = CachedResponse(body=body, etag=get_etag(body), headers=headers)
+        await catalog_cache.set(key, cached_response, version)
+
+    headers = {"ETag": cached_response.etag, "Cache-Control": "no-cache", **cached_response.headers}
+
+    if_none_match: str | None = request.headers.get("if-none-match")
+    if if_none_match and if_none_match_matches(if_none_match, cached_response.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=cached_response.body, media_type="application/json", headers=headers)
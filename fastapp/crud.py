@@ -1,27 +1,37 @@
 import datetime
 import uuid
+from typing import Any
 
-from sqlalchemy import insert, select, delete, or_, and_
+from sqlalchemy import Boolean, case, cast, column, insert, select, table, text, update, delete, func, literal, literal_column, tuple_, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import contains_eager, selectinload
 from sqlalchemy.sql._typing import _ColumnExpressionArgument
 
 from fastapp import models
 from core import config
 from . import dependencies, schemas
+from .cache import principal_cache
+from .passwords import password_hasher
 
 
-async def upsert(db: AsyncSession, model: models.Base, rows, index_elements: list[str] = ["vsrap_id"], need_return: bool = False):
+def get_upsert_columns(table) -> list[str]:
+    # Columns written from scraped data: not primary key, timestamps or computed by Postgres
+    return [c.name for c in table.c
+            if c not in list(table.primary_key.columns) and c.name not in ("created_at", "updated_at") and c.computed is None]
+
+
+async def upsert(db: AsyncSession, model: models.Base, rows, index_elements: list[str] = ["vsrap_id"], need_return: bool = False) -> list | None:
     table = model.__table__
 
     stmt = pg_insert(table).values(rows)
 
-    update_cols = [c.name for c in table.c
-                   if c not in list(table.primary_key.columns)]
+    set_ = {k: getattr(stmt.excluded, k) for k in get_upsert_columns(table)}
+    set_["updated_at"] = datetime.datetime.now()
 
     on_conflict_stmt = stmt.on_conflict_do_update(
         index_elements=index_elements,
-        set_={k: getattr(stmt.excluded, k) for k in update_cols}
+        set_=set_
     )
 
     if need_return:
@@ -30,15 +40,31 @@ async def upsert(db: AsyncSession, model: models.Base, rows, index_elements: lis
     return_model = await db.execute(on_conflict_stmt)
 
     if need_return:
-        return await return_model.fetchall()
+        return return_model.fetchall()
 
     return None
 
 
+# Loading profiles. Relationships needed by an endpoint are loaded with a fixed number of queries
+# (one per relationship), so responses don't lazy load them row by row.
+
+LOAD_PROFILES: dict[str, tuple] = {
+    "collection_list": (selectinload(models.Collection.products),),
+    "product_list": (selectinload(models.Product.collections), selectinload(models.Product.combinations)),
+    "user": (selectinload(models.User.combinations),),
+    "code": (selectinload(models.Code.user),),
+}
+
+
+def get_load_options(load: str | None) -> tuple:
+    return LOAD_PROFILES[load] if load else ()
+
+
 # Collection
 
-async def get_collections(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool] | None = None) -> list[models.Collection]:
-    select_collections_stmt = select(models.Collection)
+async def get_collections(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool] | None = None, load: str | None = None) -> list[models.Collection]:
+    select_collections_stmt = select(models.Collection).options(
+        *get_load_options(load))
 
     if whereclause is not None:
         select_collections_stmt = select_collections_stmt.where(whereclause)
@@ -72,46 +98,118 @@ async def upsert_collections(db: AsyncSession, collections_json: list[dict], nee
 
 # Product
 
-async def get_products(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool] | None = None, page: int = 0, page_size: int | None = None, search_text: str | None = None, join_collection: bool = False) -> list[models.Product]:
-    select_products_stmt = select(models.Product)
+def get_products_search(search_text: str) -> tuple[_ColumnExpressionArgument[bool], _ColumnExpressionArgument[float]]:
+    """Returns (whereclause, rank) of product search.
+
+    Products match by full text (russian and english stemming), by case insensitive substring
+    or by trigram word similarity (typos). All of them use GIN indexes.
+    """
+    tsquery = func.websearch_to_tsquery(literal_column("'russian'::regconfig"), search_text).op(
+        "||")(func.websearch_to_tsquery(literal_column("'english'::regconfig"), search_text))
+
+    whereclause = or_(
+        models.Product.search_vector.op("@@")(tsquery),
+        models.Product.title.icontains(search_text, autoescape=True),
+        literal(search_text).op("<%")(models.Product.title),
+    )
+    rank = func.greatest(
+        func.ts_rank(models.Product.search_vector, tsquery),
+        func.word_similarity(search_text, models.Product.title),
+    )
+
+    return whereclause, rank
+
+
+async def get_products(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool] | None = None, page: int = 0, page_size: int | None = None, search_text: str | None = None, cursor: tuple[int, int] | None = None, load: str | None = None) -> list[models.Product]:
+    """Returns products ordered by (price, vsrap_id) or by search rank if search_text is set.
 
-    if join_collection:
-        select_products_stmt = select_products_stmt.join(
-            models.Product.collections).distinct()
+    With cursor (price, vsrap_id) of the last product of the previous page, next page is found by index (keyset pagination),
+    otherwise page is used as offset. Ranked search results are paginated by page only.
+    """
+    select_products_stmt = select(models.Product).options(
+        *get_load_options(load))
 
     if whereclause is not None:
         select_products_stmt = select_products_stmt.where(whereclause)
 
-    if search_text is not None:
+    if search_text:
+        search_whereclause, rank = get_products_search(search_text)
         select_products_stmt = select_products_stmt.where(
-            models.Product.title.contains(search_text))
+            search_whereclause).order_by(rank.desc(), models.Product.vsrap_id)
+        cursor = None
+    else:
+        select_products_stmt = select_products_stmt.order_by(
+            models.Product.price, models.Product.vsrap_id)
+
+    if cursor is not None:
+        select_products_stmt = select_products_stmt.where(
+            tuple_(models.Product.price, models.Product.vsrap_id) > tuple_(*cursor))
 
     if page_size:
-        select_products_stmt = select_products_stmt.offset(
-            page_size * page).limit(page_size)
+        if cursor is None:
+            select_products_stmt = select_products_stmt.offset(
+                page_size * page)
+        select_products_stmt = select_products_stmt.limit(page_size)
 
     products: list[models.Product] = (await db.scalars(select_products_stmt)).all()
 
     return products
 
 
-async def get_products_by_collection_vsrap_id(db: AsyncSession, collection_vsrap_ids: list[int], page: int = 0, page_size: int | None = None, search_text: str | None = None) -> list[models.Product]:
-    whereclause = (
+async def get_products_by_collection_vsrap_id(db: AsyncSession, collection_vsrap_ids: list[int], page: int = 0, page_size: int | None = None, search_text: str | None = None, cursor: tuple[int, int] | None = None, load: str | None = None) -> list[models.Product]:
+    # Subquery instead of join, so products don't need DISTINCT
+    collection_products_stmt = select(models.collection_product_table.c.product_id).join(
+        models.Collection, models.Collection.id == models.collection_product_table.c.collection_id
+    ).where(
         models.Collection.vsrap_id.in_(collection_vsrap_ids)
     )
 
-    return await get_products(db, whereclause, page, page_size, search_text, join_collection=True)
+    whereclause = (
+        models.Product.id.in_(collection_products_stmt)
+    )
 
+    return await get_products(db, whereclause, page, page_size, search_text, cursor, load)
 
-async def get_products_by_combinations(db: AsyncSession, combinations: list[models.Combination], page: int = 0, page_size: int | None = None) -> list[models.Product]:
-    product_vsrap_ids: list[int] = [
-        combination.product_vsrap_id for combination in combinations]
 
-    whereclause = (
-        models.Product.vsrap_id.in_(product_vsrap_ids)
-    )
+async def get_user_products(db: AsyncSession, user_id: int, page: int = 0, page_size: int | None = None) -> list[models.Product]:
+    """Returns products of the user subscriptions with only subscribed combinations attached, ordered by (price, vsrap_id).
 
-    return await get_products(db, whereclause, page, page_size)
+    One statement: page of product ids is selected in subquery and joined with the subscriptions and collections.
+    """
+    combination_onclause = (
+        models.Combination.product_vsrap_id == models.Product.vsrap_id)
+    subscription_onclause = (
+        models.user_combination_table.c.combination_id == models.Combination.id)
+
+    product_ids_stmt = select(models.Product.id).join(
+        models.Combination, combination_onclause
+    ).join(
+        models.user_combination_table, subscription_onclause
+    ).where(
+        models.user_combination_table.c.user_id == user_id
+    ).group_by(models.Product.id).order_by(models.Product.price, models.Product.vsrap_id)
+
+    if page_size:
+        product_ids_stmt = product_ids_stmt.offset(
+            page * page_size).limit(page_size)
+
+    select_products_stmt = select(models.Product).join(
+        models.Combination, combination_onclause
+    ).join(
+        models.user_combination_table, subscription_onclause
+    ).outerjoin(models.Product.collections).where(
+        models.user_combination_table.c.user_id == user_id,
+        models.Product.id.in_(product_ids_stmt)
+    ).options(
+        contains_eager(models.Product.combinations),
+        contains_eager(models.Product.collections)
+    ).order_by(
+        models.Product.price, models.Product.vsrap_id, models.Combination.combination_number
+    ).execution_options(populate_existing=True)
+
+    products: list[models.Product] = (await db.scalars(select_products_stmt)).unique().all()
+
+    return products
 
 
 async def get_products_by_id(db: AsyncSession, products_ids: list[int], page: int = 0, page_size: int | None = None) -> list[models.Product]:
@@ -148,26 +246,316 @@ async def upsert_combinations(db: AsyncSession, combinations_json: list[dict], n
 
     return combinations
 
+# Combination Event
+
+
+async def create_combination_events(db: AsyncSession, events_json: list[dict]) -> None:
+    create_events_stmt = pg_insert(models.CombinationEvent).values(
+        events_json).on_conflict_do_nothing(index_elements=["event_key"])
+
+    await db.execute(create_events_stmt)
+
+
+async def get_not_notified_combination_events_ids(db: AsyncSession) -> list[uuid.UUID]:
+    # Rows are locked, so events logged meanwhile aren't marked without fan-out
+    select_events_stmt = select(models.CombinationEvent.id).where(
+        models.CombinationEvent.notified_at == None
+    ).with_for_update(skip_locked=True)
+
+    events_ids: list[uuid.UUID] = list((await db.execute(select_events_stmt)).scalars().all())
+
+    return events_ids
+
+
+async def mark_combination_events_notified(db: AsyncSession, events_ids: list[uuid.UUID]) -> None:
+    mark_events_stmt = update(models.CombinationEvent).where(
+        models.CombinationEvent.id.in_(events_ids)
+    ).values(notified_at=datetime.datetime.now())
+
+    await db.execute(mark_events_stmt)
+
+# Notification
+
+
+async def create_notifications(db: AsyncSession, events_ids: list[uuid.UUID]) -> None:
+    """Fans out events to all subscribers of their combinations with one INSERT ... SELECT."""
+    table = models.Notification.__table__
+    now = datetime.datetime.now()
+
+    subscribers_stmt = select(
+        func.gen_random_uuid(),
+        literal(now).label("created_at"),
+        models.user_combination_table.c.user_id,
+        models.CombinationEvent.id
+    ).join(
+        models.user_combination_table,
+        models.user_combination_table.c.combination_id == models.CombinationEvent.combination_id
+    ).where(
+        models.CombinationEvent.id.in_(events_ids)
+    )
+
+    create_notifications_stmt = pg_insert(table).from_select(
+        [table.c.id, table.c.created_at, table.c.user_id, table.c.event_id], subscribers_stmt
+    ).on_conflict_do_nothing(index_elements=["user_id", "event_id"])
+
+    await db.execute(create_notifications_stmt)
+
+
+async def get_not_sent_notifications(db: AsyncSession) -> list:
+    """Returns rows (notification_id, email, event type, old price, new price, size, product title, product url)."""
+    select_notifications_stmt = select(
+        models.Notification.id,
+        models.User.email,
+        models.CombinationEvent.type,
+        models.CombinationEvent.old_price,
+        models.CombinationEvent.new_price,
+        models.Combination.size,
+        models.Product.title,
+        models.Product.vsrap_url,
+    ).join(
+        models.User, models.User.id == models.Notification.user_id
+    ).join(
+        models.CombinationEvent, models.CombinationEvent.id == models.Notification.event_id
+    ).join(
+        models.Combination, models.Combination.id == models.CombinationEvent.combination_id
+    ).join(
+        models.Product, models.Product.vsrap_id == models.Combination.product_vsrap_id
+    ).where(
+        models.Notification.sent_at == None,
+        models.User.email != None,
+        models.User.is_verified_email == True
+    ).order_by(models.User.email)
+
+    notifications: list = (await db.execute(select_notifications_stmt)).all()
+
+    return notifications
+
+
+async def mark_notifications_sent(db: AsyncSession, notifications_ids: list[uuid.UUID]) -> None:
+    mark_notifications_stmt = update(models.Notification).where(
+        models.Notification.id.in_(notifications_ids)
+    ).values(sent_at=datetime.datetime.now())
+
+    await db.execute(mark_notifications_stmt)
+
+# Crawl Staging
+# Rows of the crawl are copied into temp tables (COPY) and merged with set-based statements in one transaction.
+# Staging tables are dropped on commit.
+
+product_stage = table("product_stage", *[column(name, models.Product.__table__.c[name].type)
+                                         for name in get_upsert_columns(models.Product.__table__)])
+combination_stage = table("combination_stage", *[column(name, models.Combination.__table__.c[name].type)
+                                                 for name in get_upsert_columns(models.Combination.__table__)])
+collection_product_stage = table("collection_product_stage", column("collection_id", models.Collection.id.type),
+                                 column("product_vsrap_id", models.Product.vsrap_id.type))
+
+
+async def create_crawl_stage(db: AsyncSession) -> None:
+    for stage, model in ((product_stage, models.Product), (combination_stage, models.Combination)):
+        await db.execute(text(
+            f"CREATE TEMP TABLE {stage.name} ON COMMIT DROP AS SELECT {', '.join(stage.c.keys())} FROM {model.__tablename__} WITH NO DATA"))
+    await db.execute(text(
+        f"CREATE TEMP TABLE {collection_product_stage.name} (collection_id uuid NOT NULL, product_vsrap_id integer NOT NULL) ON COMMIT DROP"))
+
+
+async def copy_to_stage(db: AsyncSession, stage, records: list[tuple]) -> None:
+    """Copies records (tuples in stage columns order) with asyncpg COPY, in the session transaction."""
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        stage.name, records=records, columns=stage.c.keys())
+
+
+async def merge_stage(db: AsyncSession, model: models.Base, stage, index_elements: list[str] = ["vsrap_id"], keep_if_empty: dict[str, Any] = {}) -> tuple[list[tuple], list[tuple]]:
+    """INSERT ... SELECT of the stage into model table, changed rows only.
+    Returns index_elements values of (inserted, updated) rows, unchanged rows are in neither of them.
+
+    Stage may have the same row more than once (product in several collections), only one of them is written.
+    Saved values of keep_if_empty columns ({column: empty value}) are not replaced by empty ones (e.g. image failed to download).
+    """
+    table = model.__table__
+    now = datetime.datetime.now()
+    update_cols = stage.c.keys()
+
+    stage_rows = select(
+        func.gen_random_uuid(), literal(now).label("created_at"), *stage.c
+    ).distinct(*[stage.c[k] for k in index_elements])
+
+    stmt = pg_insert(table).from_select(
+        [table.c.id, table.c.created_at, *[table.c[k] for k in update_cols]], stage_rows)
+
+    set_ = {k: func.coalesce(func.nullif(getattr(stmt.excluded, k), literal(keep_if_empty[k], table.c[k].type)), table.c[k])
+            if k in keep_if_empty else getattr(stmt.excluded, k) for k in update_cols}
+
+    written = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={**set_, "updated_at": now},
+        where=or_(*[table.c[k].is_distinct_from(set_[k])
+                    for k in update_cols if k not in index_elements])
+    ).returning(literal_column("xmax = 0", Boolean).label("inserted"), *[table.c[k] for k in index_elements]).cte("written")
+
+    inserted_keys: list[tuple] = []
+    updated_keys: list[tuple] = []
+    for inserted, *key in (await db.execute(select(written))).all():
+        (inserted_keys if inserted else updated_keys).append(tuple(key))
+
+    return inserted_keys, updated_keys
+
+
+async def create_staged_combination_events(db: AsyncSession) -> int:
+    """Compares staged combinations with the saved ones (before merge) and logs restock and price change events.
+
+    Event is bound to the state it was found from, so a retried crawl doesn't log it twice.
+    """
+    table = models.CombinationEvent.__table__
+    combination = models.Combination
+
+    event_type = case(
+        (and_(combination_stage.c.in_stock, combination.in_stock == False), "restock"),
+        (combination_stage.c.price != combination.price, "price_change")
+    )
+    changes = select(
+        event_type.label("type"), combination.id.label("combination_id"),
+        func.coalesce(combination.updated_at, combination.created_at).label("state_at"),
+        combination.price.label("old_price"), combination_stage.c.price.label("new_price")
+    ).distinct(combination.id).join(
+        combination_stage, combination_stage.c.vsrap_id == combination.vsrap_id
+    ).subquery()
+
+    events_stmt = select(
+        func.gen_random_uuid(), literal(datetime.datetime.now()).label("created_at"),
+        func.concat_ws(":", changes.c.type, changes.c.combination_id, func.to_char(
+            changes.c.state_at, 'YYYY-MM-DD"T"HH24:MI:SS.US')),
+        cast(changes.c.type, table.c.type.type), changes.c.combination_id, changes.c.old_price, changes.c.new_price
+    ).where(changes.c.type != None)
+
+    created = pg_insert(table).from_select(
+        [table.c.id, table.c.created_at, table.c.event_key, table.c.type,
+            table.c.combination_id, table.c.old_price, table.c.new_price], events_stmt
+    ).on_conflict_do_nothing(index_elements=["event_key"]).returning(table.c.id).cte("created")
+
+    return (await db.execute(select(func.count()).select_from(created))).scalar_one()
+
+
+async def mark_staged_combinations_out_of_stock(db: AsyncSession, pruned_collections_ids: list[uuid.UUID]) -> None:
+    """Marks out of stock combinations that are not on the pages anymore.
+
+    Products removed from listings of pruned_collections_ids (collections crawled completely) are marked as well,
+    unless they are linked to a collection that wasn't crawled completely, so their restock is found later.
+    Must be called before merge_staged_collection_products deletes their links.
+    """
+    table = models.collection_product_table
+    other_link = table.alias("other_link")
+
+    # Combinations of scraped products that are not on the page anymore are out of stock
+    staged_product_combination = and_(
+        models.Combination.product_vsrap_id.in_(select(product_stage.c.vsrap_id)),
+        models.Combination.vsrap_id.not_in(select(combination_stage.c.vsrap_id))
+    )
+
+    vanished_products_vsrap_ids = select(models.Product.vsrap_id).join(
+        table, table.c.product_id == models.Product.id
+    ).where(
+        table.c.collection_id.in_(pruned_collections_ids),
+        models.Product.vsrap_id.not_in(select(product_stage.c.vsrap_id)),
+        ~select(other_link.c.product_id).where(
+            other_link.c.product_id == models.Product.id,
+            other_link.c.collection_id.not_in(pruned_collections_ids)
+        ).exists()
+    )
+
+    mark_combinations_stmt = update(models.Combination).where(
+        or_(staged_product_combination,
+            models.Combination.product_vsrap_id.in_(vanished_products_vsrap_ids)),
+        models.Combination.in_stock == True
+    ).values(in_stock=False, updated_at=datetime.datetime.now())
+
+    await db.execute(mark_combinations_stmt)
+
+
+async def merge_staged_collection_products(db: AsyncSession, pruned_collections_ids: list[uuid.UUID]) -> tuple[int, int]:
+    """Links staged products to their collections. Returns (linked, unlinked) rows count.
+
+    Links of pruned_collections_ids that are not staged are deleted, so only collections crawled completely must be passed.
+    """
+    table = models.collection_product_table
+
+    staged_links = select(
+        collection_product_stage.c.collection_id, models.Product.id.label("product_id")
+    ).join(
+        models.Product, models.Product.vsrap_id == collection_product_stage.c.product_vsrap_id
+    )
+
+    linked = pg_insert(table).from_select(
+        [table.c.collection_id, table.c.product_id], staged_links.distinct()
+    ).on_conflict_do_nothing().returning(table.c.product_id).cte("linked")
+
+    staged_link = staged_links.where(
+        collection_product_stage.c.collection_id == table.c.collection_id,
+        models.Product.id == table.c.product_id
+    ).exists()
+
+    unlinked = delete(table).where(
+        table.c.collection_id.in_(pruned_collections_ids),
+        ~staged_link
+    ).returning(table.c.product_id).cte("unlinked")
+
+    linked_count, unlinked_count = (await db.execute(select(
+        select(func.count()).select_from(linked).scalar_subquery(),
+        select(func.count()).select_from(unlinked).scalar_subquery()
+    ))).one()
+
+    return linked_count, unlinked_count
+
+
+# Crawl State
+
+async def get_crawl_states(db: AsyncSession) -> list[models.CrawlState]:
+    select_crawl_states_stmt = select(models.CrawlState)
+    crawl_states: list[models.CrawlState] = (await db.scalars(select_crawl_states_stmt)).all()
+
+    return crawl_states
+
+
+async def upsert_crawl_states(db: AsyncSession, crawl_states_json: list[dict]) -> None:
+    await upsert(db, models.CrawlState, crawl_states_json, index_elements=["url"])
+
 # User Combination
 
+async def get_user_combinations(db: AsyncSession, user_id: uuid.UUID) -> list[models.Combination]:
+    select_combinations_stmt = select(models.Combination).join(
+        models.user_combination_table, models.user_combination_table.c.combination_id == models.Combination.id
+    ).where(models.user_combination_table.c.user_id == user_id)
+    combinations: list[models.Combination] = (await db.scalars(select_combinations_stmt)).all()
+
+    return combinations
+
+
 async def add_combination_to_user(db: AsyncSession, combination_id: uuid.UUID, user_id: uuid.UUID) -> None:
-    add_combination_to_user_stmt = insert(models.user_combination_table).values(user_id=user_id, combination_id=combination_id)
+    add_combination_to_user_stmt = pg_insert(models.user_combination_table).values(
+        user_id=user_id, combination_id=combination_id).on_conflict_do_nothing()
 
     await db.execute(add_combination_to_user_stmt)
+    await db.commit()
+
 
 async def remove_combination_from_user(db: AsyncSession, combination_id: uuid.UUID, user_id: uuid.UUID) -> None:
-    remove_combination_from_user = delete(models.user_combination_table).where(user_id=user_id, combination_id=combination_id)
+    remove_combination_from_user = delete(models.user_combination_table).where(
+        models.user_combination_table.c.user_id == user_id,
+        models.user_combination_table.c.combination_id == combination_id
+    )
 
     await db.execute(remove_combination_from_user)
-    
+    await db.commit()
+
 # User
 
 async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
-    password_hash = dependencies.hash_password(user.password)
+    password_hash = await password_hasher.hash(user.password)
 
     new_user = models.User(
         email=user.email, phone_number=user.phone_number, password_hash=password_hash)
-    await db.add(new_user)
+    db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
 
@@ -182,17 +570,18 @@ async def get_users(db: AsyncSession, user_id: int | None = None) -> list[models
     return users
 
 
-async def get_user(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool]) -> models.User | None:
-    select_user_stmt = select(models.User).where(whereclause)
+async def get_user(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool], load: str | None = None) -> models.User | None:
+    select_user_stmt = select(models.User).where(
+        whereclause).options(*get_load_options(load))
     user: models.User = (await db.scalars(select_user_stmt)).one_or_none()
 
     return user
 
 
-async def get_user_by_id(db: AsyncSession, user_id: int) -> models.User | None:
+async def get_user_by_id(db: AsyncSession, user_id: int, load: str | None = None) -> models.User | None:
     whereclause = (models.User.id == user_id)
 
-    return await get_user(db, whereclause)
+    return await get_user(db, whereclause, load)
 
 
 async def get_user_by_email_or_by_phone_number(db: AsyncSession, email: str | None = None, phone_number: str | None = None) -> models.User | None:
@@ -210,19 +599,21 @@ async def get_user_by_email_or_by_phone_number(db: AsyncSession, email: str | No
     return await get_user(db, whereclause)
 
 
-async def get_user_by_email_and_password_hash(db: AsyncSession, email: str, password_hash: str, is_verified: bool = False) -> models.User | None:
+async def get_user_by_email(db: AsyncSession, email: str, is_verified: bool = False) -> models.User | None:
     whereclause = and_(
         models.User.email == email,
-        models.User.is_verified_email == is_verified,
-        models.User.password_hash == password_hash
+        models.User.is_verified_email == is_verified
     )
 
     return await get_user(db, whereclause)
 
 
-async def update_user(db: AsyncSession, user: models.User) -> models.User:
+async def update_user(db: AsyncSession, user: models.User, attribute_names: list[str] | None = None) -> models.User:
+    # attribute_names - relationships to load again after commit expired them
+    user_id: uuid.UUID = user.id
     await db.commit()
-    await db.refresh(user)
+    await principal_cache.invalidate_user(user_id)
+    await db.refresh(user, attribute_names)
 
 
 async def update_user_email(db: AsyncSession, user: models.User, email: str) -> models.User:
@@ -236,9 +627,12 @@ async def update_user_phone_number(db: AsyncSession, user: models.User, phone_nu
 
 
 async def delete_user(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool]) -> None:
-    delete_users_stmt = delete(models.User).where(whereclause)
-    await db.execute(delete_users_stmt)
+    # Tokens of deleted users must not be authenticated by cached principals
+    delete_users_stmt = delete(models.User).where(whereclause).returning(models.User.id)
+    users_ids: list[uuid.UUID] = (await db.scalars(delete_users_stmt)).all()
     await db.commit()
+    for user_id in users_ids:
+        await principal_cache.invalidate_user(user_id)
 
 
 async def delete_user_by_email(db: AsyncSession, email: str, is_verified: bool = False) -> None:
@@ -274,7 +668,7 @@ async def delete_expired_users(db: AsyncSession) -> None:
 # Code
 
 async def get_code(db: AsyncSession, whereclause: _ColumnExpressionArgument[bool], join_user: bool = False) -> models.Code | None:
-    get_code_stmt = select(models.Code)
+    get_code_stmt = select(models.Code).options(*get_load_options("code"))
 
     if join_user:
         get_code_stmt = get_code_stmt.join(models.User)
@@ -301,7 +695,7 @@ async def get_code_by_phone_number(db: AsyncSession, code: str, phone_number: st
         models.User.phone_number == phone_number
     )
 
-    return await get_code(db, whereclause)
+    return await get_code(db, whereclause, True)
 
 
 async def create_code(db: AsyncSession, user: models.User, code_type: str) -> str:
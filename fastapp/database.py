@@ -4,6 +4,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, async_session, async_sessionmaker, AsyncSession
 
 from core import config
+from fastapp.metrics import instrument_engine
 
 SQLALCHEMY_SYNC_DATABASE_URL = f"postgresql+psycopg2://{config.POSTGRESQL_USER}:{config.POSTGRESQL_PASSWORD}@{config.POSTGRESQL_HOST}:{config.POSTGRESQL_PORT}/{config.POSTGRESQL_DATABASE}"
 SQLALCHEMY_ASYNC_DATABASE_URL = f"postgresql+asyncpg://{config.POSTGRESQL_USER}:{config.POSTGRESQL_PASSWORD}@{config.POSTGRESQL_HOST}:{config.POSTGRESQL_PORT}/{config.POSTGRESQL_DATABASE}"
@@ -19,6 +20,7 @@ class DatabaseSessionManager:
         self.engine = create_async_engine(
             SQLALCHEMY_ASYNC_DATABASE_URL, pool_size=100, max_overflow=0, pool_pre_ping=False
         )
+        instrument_engine(self.engine)
 
         self.session_maker = async_sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine
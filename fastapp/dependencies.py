@@ -1,10 +1,10 @@
 import uuid
+import json
+import base64
 import random
 import string
-import hashlib
 from datetime import timedelta, datetime, timezone
 
-import aiohttp
 import jwt
 from fastapi import Depends, HTTPException, Header, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,6 +13,8 @@ from fastapp import exceptions
 from core import config
 from fastapp.database import get_db
 from . import crud, models, schemas
+from .cache import principal_cache
+from .tokens import keyset, revocation_list, token_decoder
 from logger import get_logger
 
 py_logger = get_logger("dependencies")
@@ -27,13 +29,6 @@ def generate_random_string(length: int = 128, only_digits: bool = False) -> str:
     return ''.join(random.choice(chars) for _ in range(length))
 
 
-def hash_password(password: str) -> str:
-    password_bytes = password.encode('utf-8')
-    hash_object = hashlib.sha256(password_bytes)
-
-    return hash_object.hexdigest()
-
-
 def _get_utc_now():
     current_utc_time = datetime.now(timezone.utc)
 
@@ -46,10 +41,10 @@ def _create_access_token(payload: dict, minutes: int | None = None) -> schemas.J
     )
 
     payload[config.EXP] = expire
+    payload[config.TYP] = config.ACCESS_TOKEN_TYPE
 
     token = schemas.JwtTokenCreate(
-        token=jwt.encode(payload, config.JWT_SECRET,
-                         algorithm=config.JWT_ALGORITHM),
+        token=keyset.encode(payload),
         payload=payload,
         expire=expire,
     )
@@ -61,10 +56,10 @@ def _create_refresh_token(payload: dict) -> schemas.JwtTokenCreate:
     expire = _get_utc_now() + timedelta(minutes=config.REFRESH_TOKEN_EXPIRES_MINUTES)
 
     payload[config.EXP] = expire
+    payload[config.TYP] = config.REFRESH_TOKEN_TYPE
 
     token = schemas.JwtTokenCreate(
-        token=jwt.encode(payload, config.JWT_SECRET,
-                         algorithm=config.JWT_ALGORITHM),
+        token=keyset.encode(payload),
         expire=expire,
         payload=payload,
     )
@@ -72,8 +67,9 @@ def _create_refresh_token(payload: dict) -> schemas.JwtTokenCreate:
     return token
 
 
-def create_token_pair(user: models.User) -> schemas.TokenPair:
-    payload = {config.SUB: str(user.id), config.JTI: str(
+def _create_token_pair(sub: str) -> schemas.TokenPair:
+    # Both tokens of the pair share jti, so revoking it revokes the pair
+    payload = {config.SUB: sub, config.JTI: str(
         uuid.uuid4()), config.IAT: _get_utc_now()}
 
     return schemas.TokenPair(
@@ -82,20 +78,47 @@ def create_token_pair(user: models.User) -> schemas.TokenPair:
     )
 
 
-def decode_access_token(token: str) -> dict:
-    payload = jwt.decode(token, config.JWT_SECRET,
-                         algorithms=[config.JWT_ALGORITHM])
+def create_token_pair(user: models.User) -> schemas.TokenPair:
+    return _create_token_pair(str(user.id))
+
+
+async def decode_access_token(token: str) -> dict:
+    payload = await token_decoder.decode(token, config.ACCESS_TOKEN_TYPE)
 
     return payload
 
 
-def refresh_token_state(token: str) -> schemas.JwtTokenGet:
-    payload = jwt.decode(token, config.JWT_SECRET,
-                         algorithms=[config.JWT_ALGORITHM])
+async def _revoke_token_pair(payload: dict) -> bool:
+    """Returns False if the pair is revoked already. Tokens issued before jti can't be revoked."""
+    jti: str = payload.get(config.JTI, "")
 
-    access_token = _create_access_token(payload=payload)
+    revoked: bool = await revocation_list.revoke(jti) if jti else True
+    await principal_cache.invalidate(payload[config.SUB], jti)
+    return revoked
 
-    return access_token
+
+async def refresh_token_state(token: str) -> schemas.TokenPair:
+    """Issues a new token pair for the refresh token. The old pair is revoked, so the refresh token works once."""
+    try:
+        payload = await token_decoder.decode(token, config.REFRESH_TOKEN_TYPE)
+    except jwt.exceptions.InvalidTokenError:
+        raise exceptions.AuthFailedException(detail="Invalid refresh_token")
+
+    # Concurrent refreshes with the same token pass decoding, only the one which revoked the pair gets a new one
+    if not await _revoke_token_pair(payload):
+        raise exceptions.AuthFailedException(detail="Invalid refresh_token")
+
+    return _create_token_pair(payload[config.SUB])
+
+
+async def revoke_refresh_token(token: str) -> None:
+    """Revokes the token pair of the refresh token (on logout)."""
+    try:
+        payload = await token_decoder.decode(token, config.REFRESH_TOKEN_TYPE)
+    except jwt.exceptions.InvalidTokenError:
+        return
+
+    await _revoke_token_pair(payload)
 
 
 def add_refresh_token_cookie(response: Response, token: str):
@@ -116,7 +139,7 @@ def remove_refresh_token_from_cookie(response: Response):
     )
 
 
-async def get_user_from_access_token(authorization: str | None = Header(None), db: AsyncSession = Depends(get_db)) -> int:
+async def get_access_token_payload(authorization: str | None = Header(None)) -> dict:
     if not authorization:
         raise exceptions.AuthFailedException(
             detail="Authorization header missing")
@@ -128,13 +151,15 @@ async def get_user_from_access_token(authorization: str | None = Header(None), d
     access_token = authorization.split(" ")[1]
 
     try:
-        user_info = decode_access_token(access_token)
-    except jwt.exceptions.DecodeError:
+        return await decode_access_token(access_token)
+    except jwt.exceptions.InvalidTokenError:
         raise exceptions.AuthFailedException(detail="Invalid access_token")
 
-    user_id: uuid.UUID = user_info[config.SUB]
 
-    user = await crud.get_user_by_id(db, user_id)
+async def get_user_from_access_token(payload: dict = Depends(get_access_token_payload), db: AsyncSession = Depends(get_db)) -> models.User:
+    user_id: uuid.UUID = payload[config.SUB]
+
+    user = await crud.get_user_by_id(db, user_id, load="user")
 
     if not user:
         raise exceptions.AuthFailedException(detail="Invalid access_token")
@@ -142,29 +167,46 @@ async def get_user_from_access_token(authorization: str | None = Header(None), d
     return user
 
 
-def get_ip_from_request(request: Request) -> str:
-    return request.client.host
+async def get_principal_from_access_token(payload: dict = Depends(get_access_token_payload), db: AsyncSession = Depends(get_db)) -> schemas.Principal:
+    """Authenticated user without relationships. Cached by token sub and jti, so most requests don't query the db."""
+    sub: str = payload[config.SUB]
+    jti: str = payload.get(config.JTI, "")
+
+    principal: schemas.Principal | None = await principal_cache.get(sub, jti)
+
+    if principal is None:
+        user = await crud.get_user_by_id(db, sub)
+
+        if not user:
+            raise exceptions.AuthFailedException(detail="Invalid access_token")
+
+        principal = schemas.Principal.model_validate(user)
+        await principal_cache.set(sub, jti, principal)
+
+    return principal
+
+
+async def get_user_id_from_access_token(principal: schemas.Principal = Depends(get_principal_from_access_token)) -> uuid.UUID:
+    return principal.id
 
 
-async def download_file(url: str, file_name: str, file_dir: str = "other") -> str | None:
+def encode_cursor(values: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
     try:
-        file_ext: str = url.split(".")[-1]
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    try:
-                        file_path = f"{config.MEDIA_PATH}/{file_dir}/{file_name}.{file_ext}"
-                        data = await response.read()
-
-                        with open(file_path, 'wb') as f:
-                            f.write(data)
-
-                        return file_dir
-                    except Exception as e:
-                        print(f"Error while downloading {url}. Error: {e}")
-                else:
-                    print(
-                        f"Error with response {url}. Response status: {response.status}")
-
-    except Exception as e:
-        print(f"Error while getting {url}. Error: {e}")
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise exceptions.BadRequestException(detail="Invalid cursor")
+
+    # (price, vsrap_id): integer columns, out of range values would fail in the database. bool is an int in python
+    if not isinstance(values, list) or len(values) != 2 or not all(
+            type(value) is int and -2**31 <= value < 2**31 for value in values):
+        raise exceptions.BadRequestException(detail="Invalid cursor")
+
+    return tuple(values)
+
+
+def get_ip_from_request(request: Request) -> str:
+    return request.client.host
@@ -0,0 +1,54 @@
+from itertools import groupby
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import config
+from core.celeryconfig import celery_app
+from . import crud
+from logger import get_logger
+
+py_logger = get_logger("events.py")
+
+
+def get_notification_line(notification) -> str:
+    title = f"{notification.title} ({notification.size})" if notification.size else notification.title
+
+    if notification.type == "restock":
+        return f"{title} is back in stock. Price: {notification.new_price} RUB\n{notification.vsrap_url}"
+
+    return f"{title} price changed: {notification.old_price} -> {notification.new_price} RUB\n{notification.vsrap_url}"
+
+
+async def notify_subscribers(db: AsyncSession) -> int:
+    """Sends not notified events to subscribers, one message per user.
+
+    Events and notifications are kept in tables, so the stage can be replayed after failures:
+    already sent (user, event) pairs are skipped.
+    """
+    py_logger.debug("Creating notifications")
+    events_ids: list = await crud.get_not_notified_combination_events_ids(db)
+    if len(events_ids) > 0:
+        await crud.create_notifications(db, events_ids)
+        await crud.mark_combination_events_notified(db, events_ids)
+        await db.commit()
+
+    notifications: list = await crud.get_not_sent_notifications(db)
+    py_logger.debug("Got notifications %s - obj", len(notifications))
+
+    message_title = f"Refilled on {config.PROJECT_TITLE}"
+    messages: list[list[str]] = []
+    for email, user_notifications in groupby(notifications, key=lambda notification: notification.email):
+        message_body = "\n\n".join(get_notification_line(
+            notification) for notification in user_notifications)
+        messages.append([email, message_title, message_body])
+
+    for i in range(0, len(messages), config.EMAIL_BATCH_SIZE):
+        celery_app.send_task("fastapp.tasks.celery_tasks.send_mails", args=[
+                             messages[i:i + config.EMAIL_BATCH_SIZE]])
+
+    if len(notifications) > 0:
+        await crud.mark_notifications_sent(db, [notification.id for notification in notifications])
+        await db.commit()
+
+    py_logger.info("Notifications sent to %s users", len(messages))
+    return len(messages)
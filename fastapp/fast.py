@@ -1,12 +1,18 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, Depends
 from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from core import config
 from fastapp import models, dependencies
 from fastapp.api.routes import router as api_router
+from fastapp.assets import CachedStaticFiles, build_static, load_manifest
 from fastapp.database import engine
+from fastapp.metrics import MetricsMiddleware, metrics_response
+from fastapp.middleware import RequestIdMiddleware
 from logger import get_logger
 
 py_logger = get_logger("fast.py")
@@ -14,29 +20,61 @@ py_logger = get_logger("fast.py")
 py_logger.debug("Creating all metadata")
 models.Base.metadata.create_all(bind=engine)
 
+# Static path: fingerprinted path, filled at startup
+static_manifest: dict[str, str] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.STATIC_BUILD_ON_STARTUP:
+        py_logger.debug("Building static")
+        static_manifest.update(await asyncio.to_thread(build_static, config.STATIC_PATH, config.STATIC_BUILD_PATH))
+    else:
+        static_manifest.update(await asyncio.to_thread(load_manifest, config.STATIC_BUILD_PATH))
+    yield
+
+
 py_logger.debug("Starting FastAPI")
 app = FastAPI(
     title=config.PROJECT_TITLE,
     docs_url="/api/docs",
     openapi_url="/api/openapi.json",
+    lifespan=lifespan,
 )
 
+py_logger.debug("Adding middlewares")
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 py_logger.debug("Including router")
 app.include_router(api_router, prefix="/api")
 
 # load static and templates
+os.makedirs(config.MEDIA_PATH, exist_ok=True)
+
 py_logger.debug("Including static")
-app.mount("/static", StaticFiles(directory="fastapp/static"), name="static")
+# Build directory is made at startup
+app.mount("/static", CachedStaticFiles(directory=config.STATIC_BUILD_PATH, check_dir=False, x_accel_redirect=config.X_ACCEL_REDIRECT_PREFIX and
+                                       f"{config.X_ACCEL_REDIRECT_PREFIX}/static"), name="static")
+app.mount(config.MEDIA_URL, CachedStaticFiles(directory=config.MEDIA_PATH, immutable=True, x_accel_redirect=config.X_ACCEL_REDIRECT_PREFIX and
+                                              f"{config.X_ACCEL_REDIRECT_PREFIX}/media"), name="media")
 py_logger.debug("Including templates")
 templates = Jinja2Templates(directory="fastapp/templates")
+# Templates link static by fingerprinted names: url_for('static', path=asset('css/main.css'))
+templates.env.globals["asset"] = lambda path: static_manifest.get(path, path)
 
 py_logger.debug("Started FastAPI")
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_main(request: Request, user_ip: str = Depends(dependencies.get_ip_from_request)):
-    py_logger.debug(f"Getting main page. IP: {user_ip}")
+    py_logger.debug("Getting main page. IP: %s", user_ip)
 
     return templates.TemplateResponse(
         request=request, name="main.html", context={'title': app.title}
     )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics_response()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from core import config
+from . import schemas
+from .parse import PageParser
+from .metrics import SCRAPER_BYTES
+from .pipeline import Stage
+from .scheduler import CrawlScheduler
+from .thumbnails import make_thumbnails
+from logger import get_logger
+
+py_logger = get_logger("images.py")
+
+
+@dataclass
+class ProductImage:
+    url: str
+    # {format: [{"url": ..., "width": ...}]}
+    variants: dict[str, list[dict]] = field(default_factory=dict)
+
+
+@dataclass
+class ImageStats:
+    downloaded: int = 0
+    not_modified: int = 0  # HTTP 304, file is on disk already
+    duplicated: int = 0  # downloaded, but the same file is on disk already
+    failed: int = 0
+
+
+def get_image_ext(url: str) -> str:
+    ext: str = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,5}", ext) else ".jpg"
+
+
+def get_image_path(content_hash: str, ext: str, file_dir: str = "product") -> str:
+    # Path relative to MEDIA_PATH and MEDIA_URL, files are spread over 256 subdirectories
+    return f"{file_dir}/{content_hash[:2]}/{content_hash}{ext}"
+
+
+def get_image_url(image_path: str) -> str:
+    return f"{config.MEDIA_URL}/{image_path}"
+
+
+class ImageDownloader:
+    """Downloads product images with the scraper session.
+
+    Downloads are queued (bounded) and run by worker_count workers, apart from page parsing.
+    Bodies are streamed to disk in chunks with file writes in a thread, files are named by content sha256,
+    so the same image is stored once. Images are requested with ETag/Last-Modified of the previous crawl
+    (crawl state of the image url) and not downloaded again if server answers 304.
+    Requests go through scheduler limits and retries, pass the scheduler of the pages to share them.
+    With parser set, thumbnails of every image are made in its process pool after download.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, crawl_states: dict[str, schemas.CrawlStateCreate] | None = None,
+                 worker_count: int = config.SCRAPER_IMAGE_WORKER_COUNT, file_dir: str = "product", parser: PageParser | None = None,
+                 scheduler: CrawlScheduler | None = None):
+        self.session = session
+        self.parser = parser
+        self.scheduler = scheduler or CrawlScheduler()
+        self.crawl_states: dict[str, schemas.CrawlStateCreate] = crawl_states or {}
+        # url: state to save with the crawl data
+        self.new_crawl_states: dict[str, schemas.CrawlStateCreate] = {}
+        self.file_dir = file_dir
+        self.stats = ImageStats()
+        self.stage = Stage("images", self._handle, worker_count)
+        # url: image url, same url is downloaded once per crawl
+        self._results: dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self) -> "ImageDownloader":
+        self.stage.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stage.stop()
+        py_logger.info("Crawl stage %s. %s", self.stage.stats, self.stats)
+
+    async def download(self, url: str) -> ProductImage:
+        """Returns media urls of the image and its thumbnails. Raises exception if image can't be downloaded."""
+        if url not in self._results:
+            self._results[url] = asyncio.get_running_loop().create_future()
+            await self.stage.put((url, self._results[url]))
+
+        return await asyncio.shield(self._results[url])
+
+    async def _handle(self, job: tuple[str, asyncio.Future]) -> None:
+        url, future = job
+        try:
+            image_path: str = await self._download(url)
+            variants: dict[str, list[dict]] = {}
+            if self.parser is not None:
+                try:
+                    variants = await self.parser.run(make_thumbnails, image_path)
+                except Exception:
+                    py_logger.error("Error while making thumbnails of %s", url, exc_info=True)
+            future.set_result(ProductImage(url=get_image_url(image_path), variants=variants))
+        except Exception as e:
+            self.stats.failed += 1
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def _download(self, url: str) -> str:
+        # Returns image path relative to MEDIA_PATH
+        ext: str = get_image_ext(url)
+        crawl_state: schemas.CrawlStateCreate | None = self.crawl_states.get(url)
+        image_path: str | None = None
+        headers: dict = {}
+
+        if crawl_state and crawl_state.content_hash:
+            image_path = get_image_path(crawl_state.content_hash, ext, self.file_dir)
+            # File can be removed from disk, then it is downloaded again
+            if await asyncio.to_thread(os.path.exists, os.path.join(config.MEDIA_PATH, image_path)):
+                if crawl_state.etag:
+                    headers["If-None-Match"] = crawl_state.etag
+                if crawl_state.last_modified:
+                    headers["If-Modified-Since"] = crawl_state.last_modified
+
+        async def get() -> str:
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304 and image_path:
+                    self.stats.not_modified += 1
+                    return image_path
+
+                response.raise_for_status()
+                content_hash, duplicated = await self._save(response, ext)
+
+                self.new_crawl_states[url] = schemas.CrawlStateCreate(
+                    url=url, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"), content_hash=content_hash,
+                    changed_at=datetime.now() if crawl_state is None or crawl_state.content_hash != content_hash else crawl_state.changed_at)
+
+            self.stats.downloaded += 1
+            self.stats.duplicated += duplicated
+            return get_image_path(content_hash, ext, self.file_dir)
+
+        return await self.scheduler.request(url, get)
+
+    async def _save(self, response: aiohttp.ClientResponse, ext: str) -> tuple[str, bool]:
+        """Streams body to temporary file and moves it to its content address. Returns (content hash, file existed)."""
+        tmp_dir: str = os.path.join(config.MEDIA_PATH, self.file_dir, "tmp")
+        await asyncio.to_thread(os.makedirs, tmp_dir, exist_ok=True)
+        tmp_path: str = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+
+        content_hash = hashlib.sha256()
+        file = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in response.content.iter_chunked(config.SCRAPER_IMAGE_CHUNK_SIZE):
+                content_hash.update(chunk)
+                SCRAPER_BYTES.labels("image").inc(len(chunk))
+                await asyncio.to_thread(file.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(file.close)
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        await asyncio.to_thread(file.close)
+
+        image_path: str = os.path.join(config.MEDIA_PATH, get_image_path(
+            content_hash.hexdigest(), ext, self.file_dir))
+        return content_hash.hexdigest(), await asyncio.to_thread(self._move, tmp_path, image_path)
+
+    @staticmethod
+    def _move(tmp_path: str, image_path: str) -> bool:
+        if os.path.exists(image_path):
+            os.remove(tmp_path)
+            return True
+
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        os.replace(tmp_path, image_path)
+        return False
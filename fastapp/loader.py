@@ -0,0 +1,114 @@
+import json
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core import config
+from . import crud, models, schemas
+from .metrics import SCRAPER_ROWS_CHANGED
+from .pipeline import StageStats
+from logger import get_logger
+
+py_logger = get_logger("loader.py")
+
+
+@dataclass
+class LoadStats:
+    # vsrap_ids of changed rows, rows written with the same data are left out
+    products_inserted: list[int] = field(default_factory=list)
+    products_updated: list[int] = field(default_factory=list)
+    combinations_inserted: list[int] = field(default_factory=list)
+    combinations_updated: list[int] = field(default_factory=list)
+    events: int = 0
+    linked: int = 0
+    unlinked: int = 0
+
+
+@dataclass
+class CrawlLoader:
+    """Writes crawl data in one transaction.
+
+    Rows are buffered and copied into temp staging tables (asyncpg COPY) every SCRAPER_WRITE_BATCH_SIZE rows,
+    while the crawl goes on. merge() writes them into product, combination and collection_product tables
+    by set-based statements. Nothing is visible to other sessions until the caller commits.
+    """
+    db: AsyncSession
+    batch_size: int = config.SCRAPER_WRITE_BATCH_SIZE
+    stats: LoadStats = field(default_factory=LoadStats)
+    write_stats: StageStats = field(default_factory=lambda: StageStats("write"))
+
+    def __post_init__(self):
+        # stage: records to copy
+        self.buffers: dict = {crud.product_stage: [], crud.combination_stage: [], crud.collection_product_stage: []}
+
+    async def start(self) -> None:
+        await crud.create_crawl_stage(self.db)
+        self.write_stats = StageStats("write")
+
+    @staticmethod
+    def get_record(row: schemas.BaseConfigModel, stage) -> tuple:
+        values: dict = row.model_dump(include=set(stage.c.keys()))
+        # asyncpg takes json columns as text
+        return tuple(json.dumps(value) if isinstance(value, (dict, list)) else value
+                     for value in (values[name] for name in stage.c.keys()))
+
+    async def add(self, collection: models.Collection, products_combinations: schemas.CollectionProductCombination) -> None:
+        for product in products_combinations.products:
+            self.buffers[crud.product_stage].append(
+                self.get_record(product, crud.product_stage))
+            self.buffers[crud.collection_product_stage].append(
+                (collection.id, product.vsrap_id))
+
+        for combination in products_combinations.combinations:
+            self.buffers[crud.combination_stage].append(
+                self.get_record(combination, crud.combination_stage))
+
+        if sum(len(records) for records in self.buffers.values()) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        started_at = time.monotonic()
+        rows_count: int = 0
+
+        for stage, records in self.buffers.items():
+            if len(records) > 0:
+                await crud.copy_to_stage(self.db, stage, records)
+                rows_count += len(records)
+                records.clear()
+
+        if rows_count:
+            self.write_stats.count(started_at, items=rows_count)
+
+    async def merge(self, pruned_collections_ids: list) -> LoadStats:
+        """Merges staged rows. Stale product links of pruned_collections_ids (collections crawled completely) are deleted."""
+        await self.flush()
+        py_logger.info("Crawl stage %s", self.write_stats)
+
+        # Events compare staged rows with the saved ones, so they are found before the merge
+        self.stats.events = await crud.create_staged_combination_events(self.db)
+
+        products_inserted, products_updated = await crud.merge_stage(
+            self.db, models.Product, crud.product_stage, keep_if_empty={"image_url": "", "image_variants": {}})
+        self.stats.products_inserted = [vsrap_id for vsrap_id, in products_inserted]
+        self.stats.products_updated = [vsrap_id for vsrap_id, in products_updated]
+        combinations_inserted, combinations_updated = await crud.merge_stage(
+            self.db, models.Combination, crud.combination_stage)
+        self.stats.combinations_inserted = [vsrap_id for vsrap_id, in combinations_inserted]
+        self.stats.combinations_updated = [vsrap_id for vsrap_id, in combinations_updated]
+        await crud.mark_staged_combinations_out_of_stock(self.db, pruned_collections_ids)
+
+        self.stats.linked, self.stats.unlinked = await crud.merge_staged_collection_products(
+            self.db, pruned_collections_ids)
+
+        for table, action, rows in [("product", "inserted", len(self.stats.products_inserted)),
+                                    ("product", "updated", len(self.stats.products_updated)),
+                                    ("combination", "inserted", len(self.stats.combinations_inserted)),
+                                    ("combination", "updated", len(self.stats.combinations_updated)),
+                                    ("combination_event", "inserted", self.stats.events),
+                                    ("collection_product", "inserted", self.stats.linked),
+                                    ("collection_product", "deleted", self.stats.unlinked)]:
+            SCRAPER_ROWS_CHANGED.labels(table, action).inc(rows)
+
+        py_logger.debug("Crawl merged: %s", self.stats)
+        return self.stats
@@ -0,0 +1,136 @@
+import atexit
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import config
+
+# With PROMETHEUS_MULTIPROC_DIR set (uvicorn and celery workers) metrics of every process are written
+# to files of the directory and collected from there. The directory must be emptied before start.
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time of handling http requests", ["method", "route", "status"])
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Http requests being handled", ["method", "route"], multiprocess_mode="livesum")
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Time of db statements execution", ["operation"])
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Connections of the db pool by state", ["state"], multiprocess_mode="livesum")
+
+SCRAPER_PAGES = Counter(
+    "scraper_pages", "Pages requested by the scraper by result", ["result"])
+SCRAPER_BYTES = Counter(
+    "scraper_bytes", "Bytes of pages and images downloaded by the scraper", ["kind"])
+SCRAPER_RETRIES = Counter(
+    "scraper_retries", "Failed page and image requests retried or given up")
+SCRAPER_PARSE_DURATION = Histogram(
+    "scraper_parse_duration_seconds", "Time of parsing functions", ["function"])
+SCRAPER_STAGE_ITEMS = Counter(
+    "scraper_stage_items", "Items handled by crawl pipeline stages", ["stage", "result"])
+SCRAPER_STAGE_BUSY = Counter(
+    "scraper_stage_busy_seconds", "Time spent in crawl pipeline stage handlers", ["stage"])
+SCRAPER_ROWS_CHANGED = Counter(
+    "scraper_rows_changed", "Rows written by crawl merge", ["table", "action"])
+
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Time of celery tasks", ["task", "state"])
+
+
+def get_registry() -> CollectorRegistry:
+    if not config.PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(get_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
+@atexit.register
+def _mark_process_dead() -> None:
+    # Live gauges of exited process are dropped
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def get_route_path(scope: Scope) -> str:
+    # Route template (/api/v1/collection/{collection_id}/product), so paths don't make a label value each
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Observes duration of http requests per route."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method: str = scope["method"]
+        route: str = get_route_path(scope)
+        status_code: int = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(
+                time.perf_counter() - started_at)
+            in_progress.dec()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Observes statements time and pool connections of the engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        started_at: float = conn.info["query_started_at"].pop()
+        operation: str = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context) -> None:
+        # after_cursor_execute isn't called for failed statements
+        if context.connection is not None and context.connection.info.get("query_started_at"):
+            context.connection.info["query_started_at"].pop()
+
+    def update_pool_connections(*args) -> None:
+        pool = sync_engine.pool
+        DB_POOL_CONNECTIONS.labels("checked_out").set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels("checked_in").set(pool.checkedin())
+        DB_POOL_CONNECTIONS.labels("overflow").set(max(pool.overflow(), 0))
+        DB_POOL_CONNECTIONS.labels("size").set(pool.size())
+
+    for event_name in ("connect", "checkout", "checkin", "close"):
+        event.listen(sync_engine, event_name, update_pool_connections)
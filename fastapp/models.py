@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime, timedelta
 
-from sqlalchemy import Column, Table, ForeignKey
-from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy import DDL, Column, Computed, Index, Table, ForeignKey, UniqueConstraint, event, text, true
+from sqlalchemy.dialects.postgresql import ENUM, JSONB, TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from core import config
@@ -16,26 +16,37 @@ class Base(DeclarativeBase):
         onupdate=datetime.now(), nullable=True)
 
 
+# Trigram indexes (product search) need pg_trgm
+event.listen(Base.metadata, "before_create", DDL(
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
 collection_product_table = Table(
     "collection_product_table",
     Base.metadata,
     Column("collection_id", ForeignKey(
-        "collection_table.id", ondelete="CASCADE")),
-    Column("product_id", ForeignKey("product_table.id", ondelete="CASCADE")),
+        "collection_table.id", ondelete="CASCADE"), primary_key=True),
+    Column("product_id", ForeignKey(
+        "product_table.id", ondelete="CASCADE"), primary_key=True, index=True),
     extend_existing=True
 )
 
 user_combination_table = Table(
     "user_combination_table",
     Base.metadata,
-    Column("user_id", ForeignKey("user_table.id", ondelete="CASCADE")),
+    # Primary key starts with combination_id (subscribers of combination), user_id has its own index
     Column("combination_id", ForeignKey(
-        "combination_table.id", ondelete="CASCADE")),
+        "combination_table.id", ondelete="CASCADE"), primary_key=True),
+    Column("user_id", ForeignKey(
+        "user_table.id", ondelete="CASCADE"), primary_key=True, index=True),
 )
 
 
 class Code(Base):
     __tablename__ = "code_table"
+    __table_args__ = (
+        Index("ix_code_table_code_user_id", "code", "user_id"),
+    )
 
     user_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("user_table.id", ondelete="CASCADE"))
@@ -48,6 +59,16 @@ class Code(Base):
 
 class User(Base):
     __tablename__ = "user_table"
+    __table_args__ = (
+        # Login and register lookups
+        Index("ix_user_table_email_is_verified_email",
+              "email", "is_verified_email"),
+        Index("ix_user_table_phone_number_is_verified_phone_number",
+              "phone_number", "is_verified_phone_number"),
+        # Cleanup of unverified users, verified users have no expire_datetime
+        Index("ix_user_table_expire_datetime", "expire_datetime",
+              postgresql_where=text("expire_datetime IS NOT NULL")),
+    )
 
     email: Mapped[str] = mapped_column(nullable=True)
     is_verified_email: Mapped[bool] = mapped_column(default=False)
@@ -68,11 +89,20 @@ class Collection(Base):
     vsrap_url: Mapped[str]
     title: Mapped[str]
     products: Mapped[list["Product"]] = relationship(
-        secondary=collection_product_table, back_populates="collections", lazy="dynamic")
+        secondary=collection_product_table, back_populates="collections")
 
 
 class Product(Base):
     __tablename__ = "product_table"
+    __table_args__ = (
+        # Keyset pagination order
+        Index("ix_product_table_price_vsrap_id", "price", "vsrap_id"),
+        # Search
+        Index("ix_product_table_search_vector",
+              "search_vector", postgresql_using="gin"),
+        Index("ix_product_table_title_trgm", "title", postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}),
+    )
 
     vsrap_id: Mapped[int] = mapped_column(unique=True)
     vsrap_url: Mapped[str]
@@ -81,6 +111,12 @@ class Product(Base):
     limited: Mapped[bool] = mapped_column(default=False)
     price: Mapped[int]  # currency: RUB
     image_url: Mapped[str]
+    # Thumbnails: {format: [{"url": ..., "width": ...}]}
+    image_variants: Mapped[dict] = mapped_column(
+        JSONB, default=dict, server_default=text("'{}'::jsonb"))
+    # Full text search of title in russian and english, kept up to date by Postgres
+    search_vector: Mapped[str] = mapped_column(TSVECTOR, Computed(
+        "to_tsvector('russian', coalesce(title, '')) || to_tsvector('english', coalesce(title, ''))", persisted=True), deferred=True)
     collections: Mapped[list["Collection"]] = relationship(
         secondary=collection_product_table, back_populates="products")
     combinations: Mapped[list["Combination"]
@@ -94,8 +130,46 @@ class Combination(Base):
     combination_number: Mapped[int]
     size: Mapped[str] = mapped_column(nullable=True)
     price: Mapped[int]  # currency: RUB
+    in_stock: Mapped[bool] = mapped_column(default=True, server_default=true())
     product_vsrap_id: Mapped[int] = mapped_column(
-        ForeignKey("product_table.vsrap_id", ondelete="CASCADE"))
+        ForeignKey("product_table.vsrap_id", ondelete="CASCADE"), index=True)
     product: Mapped["Product"] = relationship(back_populates="combinations")
     users: Mapped[list["User"]] = relationship(
         secondary=user_combination_table, back_populates="combinations")
+
+
+class CombinationEvent(Base):
+    __tablename__ = "combination_event_table"
+
+    # Same change found again (crawl retries) has the same key, so it's logged once
+    event_key: Mapped[str] = mapped_column(unique=True)
+    type: Mapped[ENUM] = mapped_column(
+        ENUM("restock", "price_change", name="combination_event_type_enum"))
+    combination_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("combination_table.id", ondelete="CASCADE"))
+    combination: Mapped["Combination"] = relationship()
+    old_price: Mapped[int] = mapped_column(nullable=True)
+    new_price: Mapped[int]
+    notified_at: Mapped[datetime] = mapped_column(nullable=True)
+
+
+class Notification(Base):
+    __tablename__ = "notification_table"
+    __table_args__ = (UniqueConstraint("user_id", "event_id"),)
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("user_table.id", ondelete="CASCADE"))
+    event_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("combination_event_table.id", ondelete="CASCADE"))
+    sent_at: Mapped[datetime] = mapped_column(nullable=True)
+
+
+class CrawlState(Base):
+    __tablename__ = "crawl_state_table"
+
+    url: Mapped[str] = mapped_column(unique=True)
+    etag: Mapped[str] = mapped_column(nullable=True)
+    last_modified: Mapped[str] = mapped_column(nullable=True)
+    content_hash: Mapped[str] = mapped_column(nullable=True)  # sha256
+    page_count: Mapped[int] = mapped_column(nullable=True)
+    changed_at: Mapped[datetime] = mapped_column(nullable=True)
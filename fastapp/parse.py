@@ -0,0 +1,358 @@
+import asyncio
+import multiprocessing
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache
+from typing import TypeVar
+
+from bs4 import BeautifulSoup
+
+from core import config
+from . import schemas
+from .metrics import SCRAPER_PARSE_DURATION
+from logger import get_logger
+
+py_logger = get_logger("parse.py")
+
+
+SHOP_BASE_URL = config.SHOP_BASE_URL
+
+T = TypeVar("T")
+
+
+@dataclass
+class CollectionItem:
+    element_id: str  # bx_..._{vsrap_id}
+    href: str
+    title: str
+
+
+@dataclass
+class ProductCard:
+    vsrap_id: int
+    href: str
+    title: str
+    price: int | None = None
+    pre_order: bool = False
+    limited: bool = False
+    image_src: str | None = None
+    sku_item_id: int | None = None
+    sizes: list[str] = field(default_factory=list)
+
+
+class HtmlParser(ABC):
+    """Base of parser backends.
+
+    Backends only extract raw fields (collection items, product cards), schemas are built here,
+    so every backend returns identical schemas for the same page.
+    """
+    name: str = ""
+
+    @abstractmethod
+    def collection_items(self, html: bytes) -> Iterator[CollectionItem]:
+        ...
+
+    @abstractmethod
+    def product_cards(self, html: bytes) -> tuple[list[ProductCard], int]:
+        """Returns product cards and pages count of the catalog page."""
+
+    @abstractmethod
+    def product_price(self, html: bytes) -> int | None:
+        ...
+
+    def parse_collections(self, html: bytes) -> list[schemas.CollectionCreate]:
+        py_logger.debug("Validating collections")
+        collections: list[schemas.CollectionCreate] = []
+
+        for collection_item in self.collection_items(html):
+            try:
+                vsrap_id: int = int(collection_item.element_id.split("_")[2])
+                vsrap_url: str = SHOP_BASE_URL + collection_item.href
+                title: str = collection_item.title.replace(
+                    "	", "").replace("\n", "")
+
+                collection = schemas.CollectionCreate(
+                    vsrap_id=vsrap_id, vsrap_url=vsrap_url, title=title)
+
+                collections.append(collection)
+            except Exception as e:
+                py_logger.error("Unexpected error", exc_info=True)
+
+        py_logger.debug("Collections validated")
+        return collections
+
+    def parse_products_page(self, html: bytes) -> schemas.ProductsPage:
+        py_logger.debug("Validating products_combinations")
+        products_page = schemas.ProductsPage()
+
+        product_cards, products_page.pages = self.product_cards(html)
+
+        for product_card in product_cards:
+            vsrap_id: int = product_card.vsrap_id
+            vsrap_url: str = SHOP_BASE_URL + product_card.href
+            price: int = product_card.price or 0
+
+            if product_card.sku_item_id is not None:
+                data_item_id = product_card.sku_item_id
+                vsrap_id = data_item_id
+                for i, combination_size in enumerate(product_card.sizes):
+                    combination_vsrap_id = data_item_id + i + 1
+                    combination_number = i + 1
+
+                    combination = schemas.CombinationCreate(
+                        vsrap_id=combination_vsrap_id, combination_number=combination_number, size=combination_size, price=price, product_vsrap_id=vsrap_id)
+                    products_page.combinations.append(combination)
+
+            if product_card.price is None:
+                # Price is taken from the product page later
+                products_page.missing_price_urls[vsrap_id] = vsrap_url
+
+            if product_card.image_src:
+                products_page.image_download_urls[vsrap_id] = SHOP_BASE_URL + \
+                    product_card.image_src
+
+            product = schemas.ProductCreate(vsrap_id=vsrap_id, vsrap_url=vsrap_url, title=product_card.title,
+                                            pre_order=product_card.pre_order, limited=product_card.limited, price=price, image_url="")
+            products_page.products.append(product)
+
+        py_logger.debug("Products_combinations validated")
+        return products_page
+
+
+class BeautifulSoupParser(HtmlParser):
+    name = "bs4"
+
+    def collection_items(self, html: bytes) -> Iterator[CollectionItem]:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        for collection in soup.findAll("div", {"class": "grid-list__item"}):
+            try:
+                yield CollectionItem(
+                    element_id=collection["id"],
+                    href=collection.find(
+                        "a", {"class": "ui-card__link"})["href"],
+                    title=collection.find(
+                        "div", {"class": "brands-list__image-wrapper"}).text,
+                )
+            except Exception as e:
+                py_logger.error("Unexpected error", exc_info=True)
+
+    def product_cards(self, html: bytes) -> tuple[list[ProductCard], int]:
+        soup = BeautifulSoup(html, 'html.parser')
+        product_cards: list[ProductCard] = []
+
+        for product_info in soup.findAll("div", {"class": "catalog-block__inner"}):
+            product_card = ProductCard(
+                vsrap_id=int(product_info.find(
+                    "div", {"class": "catalog-block__info"})["data-id"]),
+                href=product_info.find("a")["href"],
+                title=product_info.find(
+                    "div", {"class": "catalog-block__info-title"}).find("span").text,
+                pre_order=product_info.find(
+                    "div", {"class": "sticker__item--preorder"}) is not None,
+                limited=product_info.find(
+                    "div", {"class": "sticker__item--limited"}) is not None,
+            )
+
+            price_info = product_info.find("meta", {"itemprop": "price"})
+            if price_info is not None:
+                product_card.price = int(price_info["content"])
+
+            image_info = product_info.find("img", {"class": "img-responsive"})
+            if image_info is not None:
+                product_card.image_src = image_info.get("data-src")
+
+            combinations_info: BeautifulSoup | None = product_info.find(
+                "div", {"class": "sku-props"})
+            if combinations_info:
+                product_card.sku_item_id = int(
+                    combinations_info["data-item-id"])
+                product_card.sizes = [combination_info["data-title"] for combination_info in combinations_info.findAll(
+                    "div", {"class": "sku-props__value"})]
+
+            product_cards.append(product_card)
+
+        pages = len(soup.findAll(
+            "a", {"class": "module-pagination__item"})) + 1
+
+        return product_cards, pages
+
+    def product_price(self, html: bytes) -> int | None:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        try:
+            return int(soup.find("meta", {"itemprop": "price"})["content"])
+        except (TypeError, KeyError, ValueError):
+            return None
+
+
+class SelectolaxParser(HtmlParser):
+    """Lexbor backed parser. Product card fields are extracted in one pass over the card nodes."""
+    name = "selectolax"
+
+    COLLECTION_SELECTOR = "div.grid-list__item"
+    COLLECTION_LINK_SELECTOR = "a.ui-card__link"
+    COLLECTION_TITLE_SELECTOR = "div.brands-list__image-wrapper"
+    PRODUCT_CARD_SELECTOR = "div.catalog-block__inner"
+    PAGINATION_SELECTOR = "a.module-pagination__item"
+    PRICE_SELECTOR = "meta[itemprop=price]"
+    SKU_VALUE_SELECTOR = "div.sku-props__value"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+
+        self.html_parser = LexborHTMLParser
+
+    def collection_items(self, html: bytes) -> Iterator[CollectionItem]:
+        tree = self.html_parser(html)
+
+        for collection in tree.css(self.COLLECTION_SELECTOR):
+            try:
+                yield CollectionItem(
+                    element_id=collection.attributes["id"],
+                    href=collection.css_first(
+                        self.COLLECTION_LINK_SELECTOR).attributes["href"],
+                    title=collection.css_first(
+                        self.COLLECTION_TITLE_SELECTOR).text(),
+                )
+            except Exception as e:
+                py_logger.error("Unexpected error", exc_info=True)
+
+    def product_card(self, product_info) -> ProductCard:
+        vsrap_id: int | None = None
+        href: str | None = None
+        title: str | None = None
+        product_card = ProductCard(vsrap_id=0, href="", title="")
+        # Only the first image counts, even without data-src (like find() of bs4)
+        image_seen: bool = False
+
+        for node in product_info.traverse():
+            attributes: dict = node.attributes
+            tag: str = node.tag
+
+            if tag == "a":
+                if href is None:
+                    href = attributes["href"]
+                continue
+
+            if tag == "meta":
+                if product_card.price is None and attributes.get("itemprop") == "price":
+                    product_card.price = int(attributes["content"])
+                continue
+
+            classes: list[str] = (attributes.get("class") or "").split()
+            if not classes:
+                continue
+
+            if tag == "img":
+                if not image_seen and "img-responsive" in classes:
+                    image_seen = True
+                    product_card.image_src = attributes.get("data-src")
+            elif tag == "div":
+                if vsrap_id is None and "catalog-block__info" in classes:
+                    vsrap_id = int(attributes["data-id"])
+                elif title is None and "catalog-block__info-title" in classes:
+                    title = node.css_first("span").text()
+                elif "sticker__item--preorder" in classes:
+                    product_card.pre_order = True
+                elif "sticker__item--limited" in classes:
+                    product_card.limited = True
+                elif product_card.sku_item_id is None and "sku-props" in classes:
+                    product_card.sku_item_id = int(attributes["data-item-id"])
+                    # Sizes are values inside the first sku-props only
+                    product_card.sizes = [value.attributes["data-title"]
+                                          for value in node.css(self.SKU_VALUE_SELECTOR)]
+
+        product_card.vsrap_id = int(vsrap_id)
+        product_card.href = href
+        product_card.title = title
+        return product_card
+
+    def product_cards(self, html: bytes) -> tuple[list[ProductCard], int]:
+        tree = self.html_parser(html)
+
+        product_cards: list[ProductCard] = [self.product_card(
+            product_info) for product_info in tree.css(self.PRODUCT_CARD_SELECTOR)]
+        pages = len(tree.css(self.PAGINATION_SELECTOR)) + 1
+
+        return product_cards, pages
+
+    def product_price(self, html: bytes) -> int | None:
+        tree = self.html_parser(html)
+
+        try:
+            return int(tree.css_first(self.PRICE_SELECTOR).attributes["content"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+
+PARSER_BACKENDS: dict[str, type[HtmlParser]] = {
+    BeautifulSoupParser.name: BeautifulSoupParser,
+    SelectolaxParser.name: SelectolaxParser,
+}
+
+
+@cache
+def get_html_parser(backend: str = config.SCRAPER_PARSER_BACKEND) -> HtmlParser:
+    try:
+        return PARSER_BACKENDS[backend]()
+    except ImportError:
+        py_logger.warning(
+            f"Parser backend '{backend}' is not installed. Using '{BeautifulSoupParser.name}'")
+        return BeautifulSoupParser()
+
+
+# Parsing functions. They take raw page bytes and return plain schemas, so they can run in a process pool.
+
+def parse_collections(html: bytes) -> list[schemas.CollectionCreate]:
+    return get_html_parser().parse_collections(html)
+
+
+def parse_products_page(html: bytes) -> schemas.ProductsPage:
+    return get_html_parser().parse_products_page(html)
+
+
+def parse_product_price(html: bytes) -> int | None:
+    return get_html_parser().product_price(html)
+
+
+def create_executor(in_process_pool: bool, worker_count: int | None) -> Executor | None:
+    if not in_process_pool:
+        return None
+
+    # Daemonic processes (celery prefork pool workers) can't have children, functions run in threads there
+    if multiprocessing.current_process().daemon:
+        py_logger.info("Daemonic process, parsing in a thread pool instead of a process pool")
+        return ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="parser")
+
+    return ProcessPoolExecutor(max_workers=worker_count)
+
+
+class PageParser:
+    """Runs parsing functions in a process pool, so parsing doesn't block downloads.
+
+    In daemonic processes (celery prefork pool) a thread pool is used instead.
+    With in_process_pool=False pages are parsed right in the event loop (useful for debugging).
+    """
+
+    def __init__(self, in_process_pool: bool = config.SCRAPER_PARSE_IN_PROCESS_POOL, worker_count: int | None = config.SCRAPER_PARSER_WORKER_COUNT):
+        self.executor: Executor | None = create_executor(in_process_pool, worker_count)
+
+    async def parse(self, parse_func: Callable[[bytes], T], html: bytes) -> T:
+        return await self.run(parse_func, html)
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Runs any CPU bound function (picklable, as well as its args) in the pool."""
+        # Time in the pool queue is included
+        with SCRAPER_PARSE_DURATION.labels(func.__name__).time():
+            if self.executor is None:
+                return func(*args)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,111 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import config
+from logger import get_logger
+
+py_logger = get_logger("passwords.py")
+
+SCRYPT_PREFIX = "scrypt"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=config.PASSWORD_SCRYPT_KEY_LENGTH)
+
+
+def _hash_legacy(password: str) -> str:
+    # Unsalted sha256 of users registered before scrypt
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+def is_legacy_hash(password_hash: str) -> bool:
+    return not password_hash.startswith(f"{SCRYPT_PREFIX}$")
+
+
+def calibrate(target_ms: float = config.PASSWORD_HASH_TARGET_MS, min_n: int = config.PASSWORD_SCRYPT_MIN_N,
+              max_n: int = config.PASSWORD_SCRYPT_MAX_N, r: int = config.PASSWORD_SCRYPT_R, p: int = config.PASSWORD_SCRYPT_P) -> int:
+    """Returns the smallest n taking at least target_ms on this host. Offline tool, n is set by PASSWORD_SCRYPT_N."""
+    n = min_n
+    while n < max_n:
+        started_at = time.perf_counter()
+        _scrypt("calibration", os.urandom(16), n, r, p)
+        if (time.perf_counter() - started_at) * 1000 >= target_ms:
+            break
+        n *= 2
+
+    return n
+
+
+class PasswordHasher:
+    """scrypt password hashing off the event loop.
+
+    Hashes are "scrypt$n$r$p$salt$key", so the cost can grow without breaking old hashes.
+    Work runs in a thread pool of worker_count threads (scrypt releases the GIL), which bounds
+    cpu and memory spent on logins.
+    """
+
+    def __init__(self, worker_count: int = config.PASSWORD_HASH_WORKER_COUNT, n: int = config.PASSWORD_SCRYPT_N,
+                 r: int = config.PASSWORD_SCRYPT_R, p: int = config.PASSWORD_SCRYPT_P):
+        self.executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="password")
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _hash(self, password: str) -> str:
+        salt = os.urandom(config.PASSWORD_SALT_LENGTH)
+        key = _scrypt(password, salt, self.n, self.r, self.p)
+
+        return "$".join([SCRYPT_PREFIX, str(self.n), str(self.r), str(self.p), _b64encode(salt), _b64encode(key)])
+
+    def _verify(self, password: str, password_hash: str) -> tuple[bool, bool]:
+        if is_legacy_hash(password_hash):
+            return hmac.compare_digest(_hash_legacy(password), password_hash), True
+
+        try:
+            _, n, r, p, salt, key = password_hash.split("$")
+            n, r, p = int(n), int(r), int(p)
+            key = _b64decode(key)
+            salt = _b64decode(salt)
+        except ValueError:
+            py_logger.error("Invalid password hash format")
+            return False, False
+
+        is_valid = hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+        # Only raised cost is applied
+        return is_valid, n < self.n or (r, p) != (self.r, self.p)
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._hash, password)
+
+    async def verify(self, password: str, password_hash: str | None) -> tuple[bool, bool]:
+        """Returns (is_valid, needs_rehash). Legacy hashes and hashes of lower cost need rehash.
+
+        Without password_hash (unknown user) a hash is computed anyway, so response time doesn't tell users apart.
+        """
+        if password_hash is None:
+            await self.hash(password)
+            return False, False
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._verify, password, password_hash)
+
+
+password_hasher = PasswordHasher()
+
+
+if __name__ == "__main__":
+    print(f"PASSWORD_SCRYPT_N={calibrate()}  # {config.PASSWORD_HASH_TARGET_MS} ms per hash, "
+          f"r={config.PASSWORD_SCRYPT_R}, p={config.PASSWORD_SCRYPT_P}")
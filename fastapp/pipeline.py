@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from core import config
+from .metrics import SCRAPER_STAGE_BUSY, SCRAPER_STAGE_ITEMS
+from logger import get_logger
+
+py_logger = get_logger("pipeline.py")
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    failed: int = 0
+    busy_seconds: float = 0  # time spent in handlers, summed over workers
+    started_at: float = field(default_factory=time.monotonic)
+
+    def count(self, started_at: float, items: int = 1, failed: bool = False) -> None:
+        busy_seconds = time.monotonic() - started_at
+        self.items += items
+        self.failed += failed
+        self.busy_seconds += busy_seconds
+
+        SCRAPER_STAGE_ITEMS.labels(self.name, "failed" if failed else "done").inc(items)
+        SCRAPER_STAGE_BUSY.labels(self.name).inc(busy_seconds)
+
+    @property
+    def throughput(self) -> float:
+        # Items per second since the stage was started
+        elapsed = time.monotonic() - self.started_at
+        return self.items / elapsed if elapsed else 0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.items} items ({self.failed} failed), {self.throughput:.1f} items/s, busy {self.busy_seconds:.1f}s"
+
+
+class Stage:
+    """Workers handling items of a bounded queue.
+
+    put() waits while the queue is full, so the producer slows down to the stage speed.
+    Errors of handler are logged and the item is dropped.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[None]], worker_count: int,
+                 queue_size: int = config.SCRAPER_PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.worker_count = worker_count
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats(name)
+        self.workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self.stats = StageStats(self.name)
+        self.workers = [asyncio.create_task(self._worker())
+                        for _ in range(self.worker_count)]
+
+    async def put(self, item: Any) -> None:
+        await self.queue.put(item)
+
+    async def join(self) -> None:
+        await self.queue.join()
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self.queue.get()
+            started_at = time.monotonic()
+            try:
+                await self.handler(item)
+                self.stats.count(started_at)
+            except Exception:
+                py_logger.error("Unexpected error on %s stage", self.name, exc_info=True)
+                self.stats.count(started_at, failed=True)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TypeVar
+from urllib.parse import urlsplit
+
+from core import config
+from . import models
+from .metrics import SCRAPER_RETRIES
+from .pipeline import StageStats
+from logger import get_logger
+
+py_logger = get_logger("scheduler.py")
+
+T = TypeVar("T")
+
+
+@dataclass(order=True)
+class PageJob:
+    priority: tuple
+    sequence: int
+    collection: models.Collection = field(compare=False)
+    page: int = field(compare=False)
+
+
+@dataclass
+class CrawlScheduler:
+    """Priority queue of collection pages with global and per-host request limits.
+
+    Job is finished by done(job), not by return of the handler, so the pages it reveals
+    can be queued by a later pipeline stage before run() sees the queue empty.
+    Every request of the crawl (pages and images) goes through request(), so limits and retries are shared.
+    """
+    max_concurrency: int = config.SCRAPER_MAX_CONCURRENT_REQUESTS
+    max_concurrency_per_host: int = config.SCRAPER_MAX_CONCURRENT_REQUESTS_PER_HOST
+    max_tries: int = config.SCRAPER_PAGE_LOAD_MAX_TRYINGS
+    sleep_on_error: float = config.SCRAPER_SLEEP_ON_ERROR
+
+    def __post_init__(self):
+        self.queue: asyncio.PriorityQueue[PageJob] = asyncio.PriorityQueue()
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._sequence = itertools.count()
+        self.stats = StageStats("fetch")
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        host: str = urlsplit(url).netloc
+        host_limit = self._host_limits.setdefault(
+            host, asyncio.Semaphore(self.max_concurrency_per_host))
+
+        # Host slot is taken first, so requests waiting for a busy host don't hold global slots of other hosts
+        async with host_limit, self._global_limit:
+            yield
+
+    async def request(self, url: str, send: Callable[[], Awaitable[T]]) -> T:
+        """Runs send() within limits of the url, up to max_tries times. Error of the last try is raised."""
+        for i in range(self.max_tries):
+            try:
+                async with self.limit(url):
+                    return await send()
+            except Exception:
+                py_logger.debug("Error while requesting %s", url, exc_info=True)
+                SCRAPER_RETRIES.inc()
+                if i == self.max_tries - 1:
+                    raise
+                # Slot of the host is free while waiting
+                await asyncio.sleep(self.sleep_on_error)
+
+    def put(self, collection: models.Collection, page: int, priority: float = 0) -> None:
+        # Pages of one collection keep their order, collections keep the given priority
+        job = PageJob(priority=(priority, page), sequence=next(self._sequence),
+                      collection=collection, page=page)
+        self.queue.put_nowait(job)
+
+    def done(self, job: PageJob) -> None:
+        self.queue.task_done()
+
+    async def run(self, handler: Callable[[PageJob], Awaitable[None]], worker_count: int | None = None) -> None:
+        """Handles jobs until every queued job is done."""
+        worker_count = worker_count or self.max_concurrency
+        self.stats = StageStats("fetch")
+        workers = [asyncio.create_task(self._worker(handler))
+                   for _ in range(worker_count)]
+
+        try:
+            await self.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, handler: Callable[[PageJob], Awaitable[None]]) -> None:
+        while True:
+            job = await self.queue.get()
+            started_at = time.monotonic()
+            try:
+                await handler(job)
+                self.stats.count(started_at)
+            except Exception:
+                py_logger.error(
+                    f"Unexpected error on page {job.page} of {job.collection.vsrap_url}", exc_info=True)
+                self.stats.count(started_at, failed=True)
+                self.done(job)
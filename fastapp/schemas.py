@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -13,7 +14,7 @@ class BaseConfigModel(BaseModel):
 
 
 class BaseCustomModel(BaseConfigModel):
-    id: int
+    id: uuid.UUID
     created_at: datetime
     updated_at: datetime | None = None
 
@@ -46,6 +47,11 @@ class UserLogin(UserBase):
 class UserVerify(UserGet):
     code: str
 
+
+class Principal(UserGet):
+    # Authenticated user, as cached between requests
+    id: uuid.UUID
+
 # Jwt & Token Models
 
 
@@ -89,6 +95,11 @@ class Collection(CollectionGet, BaseCustomModel):
 # Product Models
 
 
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+
+
 class ProductBase(BaseConfigModel):
     vsrap_id: int
     vsrap_url: str
@@ -97,6 +108,8 @@ class ProductBase(BaseConfigModel):
     limited: bool = False
     price: int
     image_url: str
+    # Thumbnails for srcset, {format: [variant]}, format is "avif" or "webp"
+    image_variants: dict[str, list[ImageVariant]] = {}
 
 
 class ProductGet(ProductBase):
@@ -123,6 +136,7 @@ class CombinationBase(BaseConfigModel):
     combination_number: int
     size: str | None = None
     price: int
+    in_stock: bool = True
     product_vsrap_id: int
 
 
@@ -140,3 +154,27 @@ class CollectionProductCombination(BaseConfigModel):
     collection: models.Collection | None = None
     products: list["ProductCreate"] = []
     combinations: list["CombinationCreate"] = []
+    # Products of the page left out, their price wasn't found
+    dropped_vsrap_ids: list[int] = []
+
+# Crawl State Models
+
+
+class CrawlStateCreate(BaseConfigModel):
+    url: str
+    etag: str | None = None
+    last_modified: str | None = None
+    content_hash: str | None = None
+    page_count: int | None = None
+    changed_at: datetime | None = None
+
+# Parsing Models
+
+
+class ProductsPage(BaseConfigModel):
+    products: list["ProductCreate"] = []
+    combinations: list["CombinationCreate"] = []
+    pages: int = 1
+    # product vsrap_id: url
+    image_download_urls: dict[int, str] = {}
+    missing_price_urls: dict[int, str] = {}
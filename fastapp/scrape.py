@@ -1,14 +1,22 @@
 
 import asyncio
-import traceback
-from dataclasses import dataclass
+import hashlib
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime
 
 import aiohttp
-from bs4 import BeautifulSoup
 
 from fastapp.database import get_db
 from core import config
-from . import dependencies, schemas, crud, models
+from . import schemas, crud, models, parse, events
+from .cache import catalog_cache
+from .images import ImageDownloader, ProductImage
+from .loader import CrawlLoader, LoadStats
+from .metrics import SCRAPER_BYTES, SCRAPER_PAGES
+from .parse import PageParser
+from .pipeline import Stage
+from .scheduler import CrawlScheduler, PageJob
 from logger import get_logger
 
 py_logger = get_logger("scrape.py")
@@ -18,239 +26,356 @@ SHOP_BASE_URL = config.SHOP_BASE_URL
 
 
 @dataclass
-class Scraper:
-    session: aiohttp.ClientSession
+class FetchedPage:
+    url: str
+    body: bytes | None = None  # None if page is not modified
+    changed: bool = True
 
-    async def validate_collections(self, soup: BeautifulSoup) -> list[schemas.CollectionCreate]:
-        py_logger.debug("Validating collections")
-        collections: list[schemas.CollectionCreate] = []
 
-        soup_collections: list[BeautifulSoup] = soup.findAll(
-            "div", {"class": "grid-list__item"})
+@dataclass
+class CrawlStats:
+    changed: int = 0
+    not_modified: int = 0  # HTTP 304
+    same_hash: int = 0
+    failed: int = 0
 
-        for collection in soup_collections:
-            try:
-                vsrap_id: int = int(collection["id"].split("_")[2])
-                vsrap_url: str = SHOP_BASE_URL + \
-                    collection.find("a", {"class": "ui-card__link"})["href"]
-                title: str = collection.find("div", {
-                                             "class": "brands-list__image-wrapper"}).text.replace("	", "").replace("\n", "")
+    @property
+    def hits(self) -> int:
+        return self.not_modified + self.same_hash
 
-                collection = schemas.CollectionCreate(
-                    vsrap_id=vsrap_id, vsrap_url=vsrap_url, title=title)
+    @property
+    def misses(self) -> int:
+        return self.changed
 
-                collections.append(collection)
-            except Exception as e:
-                py_logger.error("Unexpected error", exc_info=True)
 
-        py_logger.debug("Collections validated")
-        return collections
+@dataclass
+class CollectionCrawl:
+    collection: models.Collection
+    last_queued_page: int = 1
+    # Changed pages taken by the consumer with all their products
+    written_pages: int = 0
+    # Pages after SCRAPER_PAGE_LOAD_MAX_COUNT are not crawled
+    truncated: bool = False
+    # Pages which crawl state is saved with the crawl data
+    crawl_state_urls: list[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        # All pages were fetched and parsed, so crawled products are the whole collection
+        return not self.truncated and self.written_pages == self.last_queued_page
+
+
+@dataclass
+class Scraper:
+    session: aiohttp.ClientSession
+    scheduler: CrawlScheduler = field(default_factory=CrawlScheduler)
+    parser: PageParser = field(default_factory=PageParser)
+    # url: state of the previous crawl
+    crawl_states: dict[str, schemas.CrawlStateCreate] = field(
+        default_factory=dict)
+    # url: state to save after page data is written
+    new_crawl_states: dict[str, schemas.CrawlStateCreate] = field(
+        default_factory=dict)
+    stats: CrawlStats = field(default_factory=CrawlStats)
+    images: ImageDownloader | None = None
+    collection_crawls: dict[int, CollectionCrawl] = field(
+        default_factory=dict)
+
+    async def fetch(self, url: str, conditional: bool = False) -> FetchedPage | None:
+        """Gets page. With conditional=True unchanged pages (HTTP 304 or same content hash) are returned without body."""
+        crawl_state: schemas.CrawlStateCreate | None = self.crawl_states.get(
+            url) if conditional else None
+        headers: dict = {}
+        if crawl_state and crawl_state.etag:
+            headers["If-None-Match"] = crawl_state.etag
+        if crawl_state and crawl_state.last_modified:
+            headers["If-Modified-Since"] = crawl_state.last_modified
+
+        async def get() -> tuple[int, bytes, str | None, str | None]:
+            py_logger.debug("Getting url: %s", url)
+            async with self.session.get(url, headers=headers) as resp:
+                if resp.status == 304:
+                    return resp.status, b"", None, None
+
+                resp.raise_for_status()
+                return resp.status, await resp.read(), resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+        try:
+            status, body, etag, last_modified = await self.scheduler.request(url, get)
+        except Exception:
+            py_logger.error("Failed to get url: %s", url)
+            self.stats.failed += 1
+            SCRAPER_PAGES.labels("failed").inc()
+            return None
+
+        if status == 304:
+            self.stats.not_modified += 1
+            SCRAPER_PAGES.labels("not_modified").inc()
+            return FetchedPage(url=url, changed=False)
+
+        SCRAPER_BYTES.labels("page").inc(len(body))
+
+        if not conditional:
+            SCRAPER_PAGES.labels("fetched").inc()
+            return FetchedPage(url=url, body=body)
+
+        content_hash: str = hashlib.sha256(body).hexdigest()
+        changed: bool = crawl_state is None or crawl_state.content_hash != content_hash
+
+        new_crawl_state = schemas.CrawlStateCreate(url=url, etag=etag, last_modified=last_modified, content_hash=content_hash,
+                                                   page_count=crawl_state.page_count if crawl_state else None,
+                                                   changed_at=datetime.now() if changed else crawl_state.changed_at)
+        self.new_crawl_states[url] = new_crawl_state
+
+        if not changed:
+            self.stats.same_hash += 1
+            SCRAPER_PAGES.labels("same_hash").inc()
+            return FetchedPage(url=url, changed=False)
+
+        self.stats.changed += 1
+        SCRAPER_PAGES.labels("changed").inc()
+        return FetchedPage(url=url, body=body)
+
+    def get_collection_priority(self, collection: models.Collection) -> float:
+        # Recently changed collections are crawled first (lower value - higher priority)
+        crawl_state: schemas.CrawlStateCreate | None = self.crawl_states.get(
+            self.get_collection_page_url(collection, 1))
+        changed_at = (crawl_state and crawl_state.changed_at) or collection.updated_at or collection.created_at
+        return -changed_at.timestamp() if changed_at else 0
 
     async def get_collections(self) -> list[schemas.CollectionCreate]:
         py_logger.debug("Getting collections")
         url = f"{SHOP_BASE_URL}/brands/"
-        for i in range(config.SCRAPER_PAGE_LOAD_MAX_TRYINGS):
-            try:
-                py_logger.debug(f"Getting url: {url}")
-                async with self.session.get(url) as resp:
-                    res = await resp.text()
-                    soup = BeautifulSoup(res, 'html.parser')
+        page = await self.fetch(url)
+        if page is None:
+            return []
 
-                    collections = await self.validate_collections(soup)
-                    return collections
-
-            except Exception as e:
-                py_logger.error("Unexpected error", exc_info=True)
-                await asyncio.sleep(config.SCRAPER_SLEEP_ON_ERROR)
-        return []
+        collections = await self.parser.parse(parse.parse_collections, page.body)
+        return collections
 
-    async def validate_products_combinations(self, soup: BeautifulSoup) -> schemas.CollectionProductCombination:
+    async def validate_products_page(self, products_page: schemas.ProductsPage) -> schemas.CollectionProductCombination:
+        """Completes parsed page with data from other urls: missing prices and images."""
         py_logger.debug("Validating products_combinations")
+        missing_price_ids: list[int] = list(products_page.missing_price_urls)
+        # Without image downloader products are saved without images
+        image_ids: list[int] = list(products_page.image_download_urls) if self.images is not None else []
+
+        missing_prices, product_images = await asyncio.gather(
+            asyncio.gather(*[self.get_product_price(products_page.missing_price_urls[vsrap_id])
+                             for vsrap_id in missing_price_ids]),
+            asyncio.gather(*[self.images.download(products_page.image_download_urls[vsrap_id])
+                             for vsrap_id in image_ids], return_exceptions=True),
+        )
+        prices: dict[int, int | None] = dict(zip(missing_price_ids, missing_prices))
+        images: dict[int, ProductImage] = {vsrap_id: image for vsrap_id, image in zip(image_ids, product_images)
+                                           if isinstance(image, ProductImage)}
+
         products: list[schemas.ProductCreate] = []
         combinations: list[schemas.CombinationCreate] = []
-
-        soup_products: list[BeautifulSoup] = soup.findAll(
-            "div", {"class": "catalog-block__inner"})
-
-        for product_info in soup_products:
-            vsrap_id = int(product_info.find(
-                "div", {"class": "catalog-block__info"})["data-id"])
-            vsrap_url: str = SHOP_BASE_URL + product_info.find("a")["href"]
-            title: str = product_info.find(
-                "div", {"class": "catalog-block__info-title"}).find("span").text
-            try:
-                price = int(product_info.find(
-                    "meta", {"itemprop": "price"})["content"])
-            except TypeError:
-                product_soup = await self.get_product_page_soup(vsrap_url)
-                price = int(product_soup.find(
-                    "meta", {"itemprop": "price"})["content"])
-
-            pre_order: bool = True if product_info.find(
-                "div", {"class": "sticker__item--preorder"}) != None else False
-            limited: bool = True if product_info.find(
-                "div", {"class": "sticker__item--limited"}) != None else False
-            image_url: str = ""
-            try:
-                image_download_url = SHOP_BASE_URL + \
-                    product_info.find(
-                        "img", {"class": "img-responsive"})["data-src"]
-                image_url = await dependencies.download_file(image_download_url, str(vsrap_id), "product")
-            except (TypeError, KeyError):
-                pass
-            except Exception as e:
-                traceback.print_exc()
-
-            combinations_info: BeautifulSoup | None = product_info.find(
-                "div", {"class": "sku-props"})
-            if combinations_info:
-                data_item_id = int(combinations_info["data-item-id"])
-                vsrap_id = data_item_id
-                for i, combination_info in enumerate(combinations_info.findAll("div", {"class": "sku-props__value"})):
-                    combination_vsrap_id = data_item_id + i + 1
-                    combination_number = i + 1
-                    combination_size: str = combination_info["data-title"]
-
-                    combination = schemas.CombinationCreate(
-                        vsrap_id=combination_vsrap_id, combination_number=combination_number, size=combination_size, price=price, product_vsrap_id=vsrap_id)
-                    combinations.append(combination)
-
-            product = schemas.ProductCreate(vsrap_id=vsrap_id, vsrap_url=vsrap_url, title=title,
-                                            pre_order=pre_order, limited=limited, price=price, image_url=image_url)
-            products.append(product)
+        dropped_vsrap_ids: list[int] = []
+
+        for product in products_page.products:
+            image: ProductImage = images.get(product.vsrap_id, ProductImage(url=""))
+            update: dict = {"image_url": image.url, "image_variants": image.variants}
+            if product.vsrap_id in prices:
+                if prices[product.vsrap_id] is None:
+                    py_logger.error(
+                        "Price not found: %s", product.vsrap_url)
+                    dropped_vsrap_ids.append(product.vsrap_id)
+                    continue
+                update["price"] = prices[product.vsrap_id]
+            products.append(schemas.ProductCreate.model_validate(
+                {**product.model_dump(), **update}))
+
+        product_prices: dict[int, int] = {
+            product.vsrap_id: product.price for product in products}
+        for combination in products_page.combinations:
+            if combination.product_vsrap_id in product_prices:
+                combinations.append(combination.model_copy(
+                    update={"price": product_prices[combination.product_vsrap_id]}))
 
         py_logger.debug("Products_combinations validated")
-        return schemas.CollectionProductCombination(products=products, combinations=combinations)
-
-    async def get_products_combinations(self, collection: models.Collection) -> schemas.CollectionProductCombination:
-        py_logger.debug("Getting products_combinations")
-        collection_products_combinations = schemas.CollectionProductCombination(
-            collection=collection)
-        is_last_page = False
-        pagen_2 = 1
-
-        while not is_last_page and pagen_2 < config.SCRAPER_PAGE_LOAD_MAX_COUNT:
-            for i in range(config.SCRAPER_PAGE_LOAD_MAX_TRYINGS):
-                try:
-                    url = f"{collection.vsrap_url}?PAGEN_2={pagen_2}&AJAX_REQUEST=Y&ajax_get=Y&bitrix_include_areas=N&BLOCK=goods-list-inner"
-                    py_logger.debug(f"Getting url: {url}")
-                    async with self.session.get(url) as resp:
-                        res = await resp.text()
-                        soup = BeautifulSoup(res, 'html.parser')
-
-                        products_combinations = await self.validate_products_combinations(soup)
-
-                        collection_products_combinations.products += products_combinations.products
-                        collection_products_combinations.combinations += products_combinations.combinations
-
-                        pages = len(soup.findAll(
-                            "a", {"class": "module-pagination__item"})) + 1
-                        if pagen_2 >= pages:
-                            is_last_page = True
-
-                        break
-
-                except Exception as e:
-                    py_logger.debug("Unexpected error", exc_info=True)
-                    await asyncio.sleep(config.SCRAPER_SLEEP_ON_ERROR)
-            pagen_2 += 1
-
-        py_logger.debug("Got products_combinations")
-        return collection_products_combinations
-
-    async def get_product_page_soup(self, vsrap_url: str) -> BeautifulSoup:
-        py_logger.debug("Getting product_page_soup")
-        for i in range(config.SCRAPER_PAGE_LOAD_MAX_TRYINGS):
+        return schemas.CollectionProductCombination(products=products, combinations=combinations, dropped_vsrap_ids=dropped_vsrap_ids)
+
+    def get_collection_page_url(self, collection: models.Collection, page: int) -> str:
+        return f"{collection.vsrap_url}?PAGEN_2={page}&AJAX_REQUEST=Y&ajax_get=Y&bitrix_include_areas=N&BLOCK=goods-list-inner"
+
+    async def crawl_products(self, collections: list[models.Collection]) -> AsyncIterator[tuple[models.Collection, schemas.CollectionProductCombination]]:
+        """Crawls all pages of the collections, yields products and combinations page by page.
+
+        Pages go through fetch -> parse -> normalize stages connected by bounded queues, so only pages
+        in flight are held in memory. Next page is fetched only when the consumer took the previous ones.
+        First page of every collection is queued by collection priority, the following
+        pages are queued as soon as pagination shows them, so they are fetched in parallel.
+        Unchanged pages are not parsed, their page count is taken from the crawl state.
+        """
+        py_logger.debug("Crawling products")
+        output: asyncio.Queue = asyncio.Queue(
+            maxsize=config.SCRAPER_PIPELINE_QUEUE_SIZE)
+
+        async def fetch_page(job: PageJob) -> None:
+            url: str = self.get_collection_page_url(job.collection, job.page)
+            page = await self.fetch(url, conditional=True)
+            if page is None:
+                self.scheduler.done(job)
+                return
+
+            await parse_stage.put((job, page))
+
+        async def parse_page(item: tuple[PageJob, FetchedPage]) -> None:
+            job, page = item
+            crawl: CollectionCrawl = self.collection_crawls[job.collection.id]
             try:
-                url = vsrap_url
-                py_logger.debug(f"Getting url: {url}")
-                async with self.session.get(url) as resp:
-                    res = await resp.text()
-                    soup = BeautifulSoup(res, 'html.parser')
-                    return soup
-
-            except Exception as e:
-                py_logger.debug("Unexpected error", exc_info=True)
-                await asyncio.sleep(config.SCRAPER_SLEEP_ON_ERROR)
+                if page.changed:
+                    products_page: schemas.ProductsPage = await self.parser.parse(parse.parse_products_page, page.body)
+                    self.new_crawl_states[page.url].page_count = products_page.pages
+                    page_count: int = products_page.pages
+                else:
+                    crawl.crawl_state_urls.append(page.url)
+                    page_count: int = self.crawl_states[page.url].page_count or 1
+
+                pages = min(page_count, config.SCRAPER_PAGE_LOAD_MAX_COUNT - 1)
+                if pages < page_count:
+                    crawl.truncated = True
+                for page_number in range(crawl.last_queued_page + 1, pages + 1):
+                    self.scheduler.put(crawl.collection, page_number, job.priority[0])
+                crawl.last_queued_page = max(crawl.last_queued_page, pages)
+
+                if page.changed:
+                    await normalize_stage.put((crawl, page.url, products_page))
+            finally:
+                # Pages it reveals are queued already
+                self.scheduler.done(job)
+
+        async def normalize_page(item: tuple[CollectionCrawl, str, schemas.ProductsPage]) -> None:
+            crawl, url, products_page = item
+            products_combinations = await self.validate_products_page(products_page)
+            await output.put((crawl, url, products_combinations))
+
+        parse_stage = Stage("parse", parse_page,
+                            config.SCRAPER_PARSER_WORKER_COUNT or 1)
+        normalize_stage = Stage("normalize", normalize_page,
+                                config.SCRAPER_NORMALIZE_WORKER_COUNT)
+
+        async def crawl_pages() -> None:
+            try:
+                await self.scheduler.run(fetch_page)
+                # All pages are parsed when scheduler is done
+                await normalize_stage.join()
+            finally:
+                await output.put(None)
+
+        for collection in sorted(collections, key=self.get_collection_priority):
+            self.collection_crawls[collection.id] = CollectionCrawl(collection)
+            self.scheduler.put(
+                collection, 1, self.get_collection_priority(collection))
+
+        parse_stage.start()
+        normalize_stage.start()
+        crawl_task = asyncio.create_task(crawl_pages())
+        try:
+            while (item := await output.get()) is not None:
+                crawl, url, products_combinations = item
+                yield crawl.collection, products_combinations
+                if products_combinations.dropped_vsrap_ids:
+                    # Dropped products didn't vanish: the collection isn't complete and the page is crawled again
+                    continue
+                # Consumer has the page data now
+                crawl.written_pages += 1
+                crawl.crawl_state_urls.append(url)
+
+            await crawl_task
+        finally:
+            crawl_task.cancel()
+            await asyncio.gather(crawl_task, return_exceptions=True)
+            await parse_stage.stop()
+            await normalize_stage.stop()
+            for stats in (self.scheduler.stats, parse_stage.stats, normalize_stage.stats):
+                py_logger.info("Crawl stage %s", stats)
+
+    async def get_product_price(self, vsrap_url: str) -> int | None:
+        py_logger.debug("Getting product price")
+        page = await self.fetch(vsrap_url)
+        if page is None:
+            return None
+
+        return await self.parser.parse(parse.parse_product_price, page.body)
 
 
 async def update_base():
     py_logger.info("Starting scraping. Creating session.")
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(config.SCRAPER_PAGE_LOAD_TIMEOUT)) as session:
-        py_logger.debug("Getting db.")
-        async for db_session in get_db():
-            async with db_session as db:
-                py_logger.debug("Starting 'Scraper'")
-                scraper = Scraper(session)
-
-                py_logger.debug("Getting collections")
-                collections: list[schemas.CollectionCreate] = await scraper.get_collections()
-                py_logger.debug(f"Got collections {len(collections)} - obj")
-
-                collections_json = [collection.model_dump(
-                    mode='json') for collection in collections]
-
-                collections_ids: list[list] = await crud.upsert_collections(db, collections_json, need_return=True)
-                await db.commit()
-                # collections_ids: [(id_2,), (id_1,)...] So we need to convert it to list[int]
-                collections_ids: list[int] = [collection_info[0]
-                                              for collection_info in collections_ids]
-                collections: list[models.Collection] = await crud.get_collections_by_id(db, collections_ids)
-                py_logger.debug("Collections updated")
-
-                py_logger.debug("Getting products info")
-                product_tasks = [scraper.get_products_combinations(
-                    collection) for collection in collections]
-                products_info: list[schemas.CollectionProductCombination] = await asyncio.gather(*product_tasks)
-                products_count: int = sum(
-                    [len(product_info.products) for product_info in products_info])
-                py_logger.debug(f"Got products info {products_count} - obj")
-
-                for ind, product_info in enumerate(products_info):
-                    try:
-                        collection: models.Collection = product_info.collection
-                        schema_products: list[schemas.ProductCreate] = product_info.products
-                        schema_combinations: list[schemas.CombinationCreate] = product_info.combinations
-                        py_logger.debug(f"Collection - {collection.title}")
-
-                        py_logger.debug(
-                            f"Products len - {len(schema_products)}")
-                        if len(schema_products) > 0:
-                            try:
-                                products_json: list[dict] = [product.model_dump(
-                                    mode='json') for product in schema_products]
-                                products_ids: list[list] = await crud.upsert_products(db, products_json, need_return=True)
-                                # products_ids: [(id_2,), (id_1,)...] So we need to convert it to list[int]
-                                products_ids: list[int] = [
-                                    product_info[0] for product_info in products_ids]
-                                await db.commit()
-                                py_logger.debug(f"Products updated")
-
-                            except Exception as e:
-                                py_logger.error(
-                                    f"Unexpected error", exc_info=True)
-
-                            model_products: list[models.Product] = crud.get_products_by_id(
-                                db, products_ids)
-                            collection.products += model_products
-
-                        py_logger.debug(
-                            f"Combinations len - {len(schema_combinations)}")
-                        if len(schema_combinations) > 0:
-                            try:
-                                combinations: list[schemas.CombinationCreate] = [
-                                    combination for combination in schema_combinations]
-                                combinations_json: list[dict] = [combination.model_dump(
-                                    mode='json') for combination in combinations]
-                                await crud.upsert_combinations(db, combinations_json)
-                                await db.commit()
-                                py_logger.debug("Combinations updated")
-
-                            except Exception as e:
-                                py_logger.error(
-                                    f"Unexpected error", exc_info=True)
+    parser = PageParser()
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(config.SCRAPER_PAGE_LOAD_TIMEOUT)) as session:
+            py_logger.debug("Getting db.")
+            async for db_session in get_db():
+                async with db_session as db:
+                    py_logger.debug("Starting 'Scraper'")
+                    crawl_states: dict[str, schemas.CrawlStateCreate] = {
+                        crawl_state.url: schemas.CrawlStateCreate.model_validate(crawl_state) for crawl_state in await crud.get_crawl_states(db)}
+                    # Page and image crawl states are kept in one table, urls differ
+                    # Pages and images share request limits of the host
+                    scheduler = CrawlScheduler()
+                    images = ImageDownloader(session, crawl_states=crawl_states, parser=parser, scheduler=scheduler)
+                    scraper = Scraper(session, scheduler=scheduler, parser=parser, images=images, crawl_states=crawl_states)
+
+                    py_logger.debug("Getting collections")
+                    collections: list[schemas.CollectionCreate] = await scraper.get_collections()
+                    py_logger.debug("Got collections %s - obj", len(collections))
+
+                    collections_json = [collection.model_dump(
+                        mode='json') for collection in collections]
+
+                    collections_ids: list[list] = await crud.upsert_collections(db, collections_json, need_return=True)
+                    await db.commit()
+                    # collections_ids: [(id_2,), (id_1,)...] So we need to convert it to list[int]
+                    collections_ids: list[int] = [collection_info[0]
+                                                  for collection_info in collections_ids]
+                    collections: list[models.Collection] = await crud.get_collections_by_id(db, collections_ids)
+                    py_logger.debug("Collections updated")
+
+                    # Whole crawl is written in one transaction, rows are copied to staging tables while the crawl goes on
+                    loader = CrawlLoader(db)
+                    await loader.start()
+
+                    py_logger.debug("Crawling products")
+                    async with images:
+                        async for collection, products_combinations in scraper.crawl_products(collections):
+                            await loader.add(collection, products_combinations)
+
+                    collection_crawls: list[CollectionCrawl] = list(
+                        scraper.collection_crawls.values())
+                    load_stats: LoadStats = await loader.merge(
+                        [crawl.collection.id for crawl in collection_crawls if crawl.complete])
+
+                    # Crawl state is saved with page data, so pages of a failed crawl are crawled again
+                    crawl_states_json: list[dict] = [scraper.new_crawl_states[url].model_dump()
+                                                     for crawl in collection_crawls for url in crawl.crawl_state_urls
+                                                     if url in scraper.new_crawl_states]
+                    crawl_states_json += [crawl_state.model_dump()
+                                          for crawl_state in images.new_crawl_states.values()]
+                    if len(crawl_states_json) > 0:
+                        await crud.upsert_crawl_states(db, crawl_states_json)
+                    await db.commit()
+                    py_logger.info(
+                        "Products inserted %s, updated %s. Combinations inserted %s, updated %s. "
+                        "Collection products linked %s, unlinked %s. Combination events %s",
+                        len(load_stats.products_inserted), len(load_stats.products_updated),
+                        len(load_stats.combinations_inserted), len(load_stats.combinations_updated),
+                        load_stats.linked, load_stats.unlinked, load_stats.events)
+
+                    # Catalog responses cached before the crawl are outdated now
+                    await catalog_cache.bump_version()
 
+                    try:
+                        await events.notify_subscribers(db)
                     except Exception as e:
-                        py_logger.error(f"Unexpected error", exc_info=True)
-
-                py_logger.info("All data updated")
+                        py_logger.error("Unexpected error", exc_info=True)
+
+                    stats: CrawlStats = scraper.stats
+                    py_logger.info(
+                        "Crawl pages: hits %s (not modified %s, same hash %s), misses %s, failed %s",
+                        stats.hits, stats.not_modified, stats.same_hash, stats.misses, stats.failed)
+                    py_logger.info("All data updated")
+    finally:
+        parser.close()
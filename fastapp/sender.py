@@ -1,3 +1,5 @@
+import asyncio
+import time
 from email.message import EmailMessage
 
 import aiosmtplib
@@ -9,32 +11,130 @@ from logger import get_logger
 py_logger = get_logger("sender.py")
 
 
-async def send_email(receiver_email: str, title: str, message: str) -> dict:
-    sender_email: str = config.EMAIL_LOGIN
+class RateLimiter:
+    """Lets at most `rate` calls per second through (0 - no limit)."""
+
+    def __init__(self, rate: float = config.EMAIL_RATE_LIMIT):
+        self.interval: float = 1 / rate if rate else 0
+        self._next_time: float = 0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_time > now:
+                await asyncio.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time) + self.interval
+
+
+class SMTPPool:
+    """Persistent SMTP connections reused between messages.
+
+    Connections are opened lazily and reopened when server drops them.
+    Messages are sent over `size` connections at most, with a shared rate limit.
+    """
+
+    def __init__(self, size: int = config.EMAIL_SMTP_POOL_SIZE, rate_limit: float = config.EMAIL_RATE_LIMIT,
+                 hostname: str | None = config.EMAIL_SMTP_HOST, port: int | None = config.EMAIL_SMTP_PORT,
+                 username: str | None = None, password: str | None = config.EMAIL_PASSWORD, use_tls: bool = config.EMAIL_SMTP_USE_TLS):
+        self.loop = asyncio.get_running_loop()
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.clients: asyncio.Queue[aiosmtplib.SMTP] = asyncio.Queue()
+
+        for _ in range(size):
+            self.clients.put_nowait(aiosmtplib.SMTP(
+                hostname=hostname, port=int(port) if port else None, username=username, password=password,
+                use_tls=use_tls, timeout=config.EMAIL_SMTP_TIMEOUT))
+
+    async def send_message(self, msg: EmailMessage) -> None:
+        client: aiosmtplib.SMTP = await self.clients.get()
+        try:
+            for attempt in range(2):
+                try:
+                    if not client.is_connected:
+                        # Logs in too, if username and password are set
+                        await client.connect()
+
+                    await self.rate_limiter.wait()
+                    await client.send_message(msg)
+                    return
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError):
+                    py_logger.debug("SMTP connection lost. Reconnecting", exc_info=True)
+                    client.close()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # State of the session is unknown (e.g. timeout in the middle of DATA), next message connects again
+                    client.close()
+                    raise
+        finally:
+            self.clients.put_nowait(client)
+
+    async def close(self) -> None:
+        while not self.clients.empty():
+            client = self.clients.get_nowait()
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+
+
+_smtp_pool: SMTPPool | None = None
 
+
+def get_smtp_pool() -> SMTPPool:
+    """Returns SMTP pool of the worker process. Connections are bound to event loop, so pool is created again if loop changed."""
+    global _smtp_pool
+
+    if _smtp_pool is None or _smtp_pool.loop is not asyncio.get_running_loop():
+        username: str = config.EMAIL_LOGIN.split("@")[0]
+        _smtp_pool = SMTPPool(username=username)
+
+    return _smtp_pool
+
+
+def create_email_message(receiver_email: str, title: str, message: str) -> EmailMessage:
     msg = EmailMessage()
-    msg["From"] = sender_email
+    msg["From"] = config.EMAIL_LOGIN
     msg["To"] = receiver_email
     msg["Subject"] = title
     msg.set_content(message)
 
-    username: str = sender_email.split("@")[0]
-
-    py_logger.debug(f"Sending mail to {receiver_email}")
-    await aiosmtplib.send(
-        msg,
-        sender=sender_email,
-        recipients=receiver_email,
-        hostname=config.EMAIL_SMTP_HOST,
-        port=config.EMAIL_SMTP_PORT,
-        username=username,
-        password=config.EMAIL_PASSWORD,
-        use_tls=True
-    )
+    return msg
+
+
+async def send_email(receiver_email: str, title: str, message: str) -> dict:
+    msg = create_email_message(receiver_email, title, message)
+
+    py_logger.debug("Sending mail to %s", receiver_email)
+    await get_smtp_pool().send_message(msg)
     py_logger.debug("Mail successfully sended")
     return {"status": "success"}
 
 
+async def send_emails(messages: list[tuple[str, str, str]]) -> dict:
+    """Sends (receiver_email, title, message) messages concurrently over the pooled connections."""
+    smtp_pool = get_smtp_pool()
+
+    py_logger.debug("Sending %s mails", len(messages))
+    results = await asyncio.gather(*[smtp_pool.send_message(create_email_message(*message)) for message in messages],
+                                   return_exceptions=True)
+
+    failed: list[str] = []
+    for message, result in zip(messages, results):
+        if isinstance(result, Exception):
+            py_logger.error(
+                "Error while sending mail to %s", message[0], exc_info=result)
+            failed.append(message[0])
+
+    py_logger.debug("Mails sended: %s, failed: %s", len(messages) - len(failed), len(failed))
+    return {"status": "success", "failed": failed}
+
+
 async def send_phone_number(phone_number: str, title: str, message: str) -> dict:
     py_logger.debug("Send phone number. Unavailable now")
     raise exceptions.UnAvailable()
@@ -13,6 +13,7 @@ const search_products_input = document.querySelector(".search_products_input");
 
 let product_page = 0;
 let product_page_size = 10;
+let product_cursor = null;
 let last_products_length = 0;
 let search_text = ""
 let last_get_products_by_scroll_time = 0;
@@ -94,6 +95,10 @@ async function get_products(search_text, collection_ids) {
 
     url += "page=" + product_page + "&page_size=" + product_page_size;
 
+    if (product_page > 0 && product_cursor) {
+        url += "&cursor=" + product_cursor;
+    }
+
     if (search_text) {
         url += "&search_text=" + search_text;
     }
@@ -107,6 +112,7 @@ async function get_products(search_text, collection_ids) {
     })
 
     products_list = await res.json()
+    product_cursor = res.headers.get("X-Next-Cursor");
 
     return products_list
 }
@@ -121,6 +127,15 @@ function validate_products(products_list) {
 
         product_element.style.display = "block";
         product_element.querySelector(".product_image").src = product_info["image_url"];
+        ["avif", "webp"].forEach(image_format => {
+            const variants = product_info["image_variants"][image_format] || [];
+            const source = product_element.querySelector(".product_image_" + image_format);
+            if (variants.length) {
+                source.srcset = variants.map(variant => variant["url"] + " " + variant["width"] + "w").join(", ");
+            } else {
+                source.remove();
+            }
+        });
         product_element.setAttribute("vsrap_id", product_info["vsrap_id"]);
 
         product_element.querySelector(".product_title").innerHTML = product_info["title"];
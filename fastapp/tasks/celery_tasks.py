@@ -1,11 +1,9 @@
-import asyncio
-
-from sqlalchemy.orm import Session
-
-from fastapp import sender, crud, exceptions
+from fastapp import sender, crud, events, exceptions
 from core.celeryconfig import celery_app
 from fastapp.scrape import update_base
-from fastapp.database import engine, get_db_non_gen
+from fastapp.database import get_db
+from fastapp.tasks.runtime import async_task
+from fastapp.tasks import metrics  # noqa: F401, connects celery signals
 from logger import get_logger
 
 
@@ -13,14 +11,26 @@ py_logger = get_logger("celery_tasks.py")
 
 
 @celery_app.task()
-def send_mail(receiver_email: str, title: str, message: str):
+@async_task
+async def send_mail(receiver_email: str, title: str, message: str):
     try:
         py_logger.debug("Sending mail.")
-        asyncio.run(sender.send_email(receiver_email, title, message))
+        await sender.send_email(receiver_email, title, message)
     except Exception:
         py_logger.error("Error while sending email", exc_info=True)
 
 
+@celery_app.task()
+@async_task
+async def send_mails(messages: list[list[str]]):
+    """Sends [receiver_email, title, message] messages over pooled connections."""
+    try:
+        py_logger.debug("Sending mails.")
+        await sender.send_emails([tuple(message) for message in messages])
+    except Exception:
+        py_logger.error("Error while sending emails", exc_info=True)
+
+
 @celery_app.task()
 def send_phone_message(phone_number: str, title: str, message: str):
     py_logger.debug("Sending phone_number. Unavailable.")
@@ -28,14 +38,26 @@ def send_phone_message(phone_number: str, title: str, message: str):
 
 
 @celery_app.task()
-def start_scraper():
+@async_task
+async def start_scraper():
     py_logger.debug("Staring scraping.")
-    asyncio.run(update_base(engine))
+    await update_base()
     py_logger.debug("Scraped.")
 
 
 @celery_app.task()
-def clear_unverified_users(db: Session = get_db_non_gen()):
+@async_task
+async def notify_subscribers():
+    py_logger.debug("Sending not sent notifications.")
+    async for db in get_db():
+        await events.notify_subscribers(db)
+    py_logger.debug("Notifications sent.")
+
+
+@celery_app.task()
+@async_task
+async def clear_unverified_users():
     py_logger.debug("Deleting expired users.")
-    crud.delete_expired_users(db)
+    async for db in get_db():
+        await crud.delete_expired_users(db)
     py_logger.debug("Expired users deleted.")
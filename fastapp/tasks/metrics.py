@@ -0,0 +1,41 @@
+import os
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown, worker_ready
+from prometheus_client import multiprocess, start_http_server
+
+from core import config
+from fastapp.metrics import CELERY_TASK_DURATION, get_registry
+from logger import get_logger
+
+py_logger = get_logger("tasks/metrics.py")
+
+# task id: start time
+_task_started_at: dict[str, float] = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id: str, **kwargs) -> None:
+    _task_started_at[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observe_task(task_id: str, task, state: str | None = None, **kwargs) -> None:
+    started_at: float | None = _task_started_at.pop(task_id, None)
+    if started_at is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started_at)
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs) -> None:
+    # Served by the main worker process, metrics of pool processes are collected from PROMETHEUS_MULTIPROC_DIR
+    if config.CELERY_METRICS_PORT:
+        py_logger.info("Serving metrics on port %s", config.CELERY_METRICS_PORT)
+        start_http_server(int(config.CELERY_METRICS_PORT), registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_process_dead(**kwargs) -> None:
+    if config.PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import threading
+from collections.abc import Callable, Coroutine
+from typing import Any, TypeVar
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from fastapp import sender
+from fastapp.database import sessionmanager
+from logger import get_logger
+
+py_logger = get_logger("runtime.py")
+
+T = TypeVar("T")
+
+
+class AsyncRuntime:
+    """One event loop per worker process, running in a background thread.
+
+    Tasks schedule coroutines onto it, so connection pools (db, smtp, http) live as long as the process
+    instead of being created and closed by asyncio.run on every task.
+    """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.is_running:
+                return
+
+            py_logger.debug("Starting async runtime")
+            self.loop = asyncio.new_event_loop()
+            started = threading.Event()
+            self.loop.call_soon(started.set)
+            self.thread = threading.Thread(
+                target=self.loop.run_forever, name="async-runtime", daemon=True)
+            self.thread.start()
+            started.wait()
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        if not self.is_running:
+            self.start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _close_pools(self) -> None:
+        if sender._smtp_pool is not None:
+            await sender._smtp_pool.close()
+        await sessionmanager.close()
+
+    def stop(self) -> None:
+        if not self.is_running:
+            return
+
+        py_logger.debug("Stopping async runtime")
+        try:
+            self.run(self._close_pools())
+        except Exception:
+            py_logger.error("Error while closing pools", exc_info=True)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+
+
+runtime = AsyncRuntime()
+
+
+def async_task(func: Callable[..., Coroutine[Any, Any, T]]) -> Callable[..., T]:
+    """Makes sync function of the coroutine function, that runs it on the worker event loop.
+
+    Usage:
+        @celery_app.task()
+        @async_task
+        async def task(): ...
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        return runtime.run(func(*args, **kwargs))
+
+    return wrapper
+
+
+@worker_process_init.connect
+def start_runtime(**kwargs) -> None:
+    # Connections inherited from the parent process must not be reused after fork
+    sessionmanager.engine.sync_engine.dispose(close=False)
+    runtime.start()
+
+
+@worker_process_shutdown.connect
+def stop_runtime(**kwargs) -> None:
+    runtime.stop()
@@ -0,0 +1,58 @@
+import os
+
+from core import config
+
+try:
+    # Registers AVIF format in Pillow
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+def get_thumbnail_path(image_path: str, width: int, image_format: str) -> str:
+    # Thumbnails are named by the content addressed original, so they are made once too
+    return f"{os.path.splitext(image_path)[0]}_{width}.{image_format}"
+
+
+def make_thumbnails(image_path: str, widths: tuple[int, ...] = config.MEDIA_THUMBNAIL_WIDTHS,
+                    formats: tuple[str, ...] = config.MEDIA_THUMBNAIL_FORMATS) -> dict[str, list[dict]]:
+    """Makes thumbnails of the image (path relative to MEDIA_PATH) in given widths and formats.
+
+    Returns {format: [{"url": ..., "width": ...}]}, widths ascending. Image is not upscaled, so widths
+    bigger than the image are left out (image width is used if all of them are bigger).
+    Existing thumbnails are not made again. Runs in a worker process.
+    """
+    from PIL import Image
+
+    Image.init()
+    image_formats: list[str] = [image_format for image_format in formats
+                                if image_format.upper() in Image.SAVE]
+    variants: dict[str, list[dict]] = {image_format: [] for image_format in image_formats}
+
+    with Image.open(os.path.join(config.MEDIA_PATH, image_path)) as image:
+        thumbnail_widths: list[int] = sorted({min(width, image.width) for width in widths})
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for width in thumbnail_widths:
+            thumbnail: Image.Image | None = None
+
+            for image_format in image_formats:
+                thumbnail_path: str = get_thumbnail_path(image_path, width, image_format)
+                file_path: str = os.path.join(config.MEDIA_PATH, thumbnail_path)
+
+                if not os.path.exists(file_path):
+                    if thumbnail is None:
+                        height: int = max(1, round(image.height * width / image.width))
+                        thumbnail = image.resize((width, height), Image.Resampling.LANCZOS)
+
+                    # Written under temporary name, so a broken file is not taken for a made one
+                    tmp_path: str = f"{file_path}.{os.getpid()}.part"
+                    thumbnail.save(tmp_path, format=image_format.upper(),
+                                   quality=config.MEDIA_THUMBNAIL_QUALITY)
+                    os.replace(tmp_path, file_path)
+
+                variants[image_format].append(
+                    {"url": f"{config.MEDIA_URL}/{thumbnail_path}", "width": width})
+
+    return variants
@@ -0,0 +1,217 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+import jwt
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from core import config
+from logger import get_logger
+
+py_logger = get_logger("tokens.py")
+
+
+class KeySet:
+    """Signing keys indexed by kid.
+
+    Tokens are signed by the current key and carry its kid in the header, so keys can be rotated:
+    a new key becomes current while old keys still verify tokens issued before.
+    Tokens without kid (issued before keyset) are verified by legacy_key.
+    """
+
+    def __init__(self, keys: dict[str, str] = config.JWT_KEYS, current_kid: str = config.JWT_KID,
+                 legacy_key: str | None = config.JWT_SECRET, algorithm: str = config.JWT_ALGORITHM):
+        self.keys = keys
+        self.current_kid = current_kid
+        self.legacy_key = legacy_key
+        self.algorithm = algorithm
+
+    def get_key(self, kid: str | None) -> str:
+        key = self.keys.get(kid) if kid is not None else self.legacy_key
+        if key is None:
+            raise jwt.exceptions.InvalidTokenError(f"Unknown kid: {kid}")
+
+        return key
+
+    def encode(self, payload: dict) -> str:
+        return jwt.encode(payload, self.keys[self.current_kid], algorithm=self.algorithm,
+                          headers={"kid": self.current_kid})
+
+    def decode(self, token: str) -> dict:
+        kid: str | None = jwt.get_unverified_header(token).get("kid")
+
+        return jwt.decode(token, self.get_key(kid), algorithms=[self.algorithm])
+
+
+class BloomFilter:
+    """Set membership with false positives (at error_rate when holding capacity items) and no false negatives."""
+
+    def __init__(self, capacity: int = config.TOKEN_REVOCATION_BLOOM_CAPACITY, error_rate: float = config.TOKEN_REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing: position i = h1 + i * h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        if item in self:
+            return
+
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Revoked token jti.
+
+    Revocations are kept in Redis (sorted set, jti scored by revoke time), if redis url is set, and mirrored
+    in-process as a bloom filter. Tokens absent from the filter are not revoked, which is checked without I/O.
+    A filter hit is confirmed in Redis. New revocations of other processes are pulled every sync_interval.
+    Without Redis revocations are seen only by the revoking process.
+    """
+    REDIS_KEY = "token:revoked"
+
+    def __init__(self, redis_url: str | None = config.CACHE_REDIS_URL, sync_interval: float = config.TOKEN_REVOCATION_SYNC_SECONDS,
+                 lifetime: int = config.REFRESH_TOKEN_EXPIRES_MINUTES * 60):
+        self.redis: aioredis.Redis | None = aioredis.from_url(
+            redis_url) if redis_url else None
+        self.sync_interval = sync_interval
+        # Tokens live no longer than lifetime, so older revocations are dropped
+        self.lifetime = lifetime
+        self.bloom = BloomFilter()
+        # jti: revoke time. Exact set for the process revocations (used without Redis)
+        self.revoked: dict[str, float] = {}
+        self._synced_at: float | None = None
+        self._sync_checked_at: float = 0
+
+    def _reset_bloom(self) -> None:
+        self.bloom = BloomFilter(self.bloom.capacity)
+        for jti in self.revoked:
+            self.bloom.add(jti)
+
+    def _prune(self, now: float) -> None:
+        expired = [jti for jti, revoked_at in self.revoked.items() if revoked_at < now - self.lifetime]
+        for jti in expired:
+            del self.revoked[jti]
+        if expired and self.redis is None:
+            self._reset_bloom()
+
+    async def sync(self) -> None:
+        now = time.time()
+        if self.redis is None or time.monotonic() - self._sync_checked_at < self.sync_interval:
+            return
+
+        # Full load on start and when the filter is over capacity, new revocations otherwise
+        full = self._synced_at is None or self.bloom.count > self.bloom.capacity
+        # Overlap covers clock skew between hosts
+        since = now - self.lifetime if full else self._synced_at - config.TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS
+        try:
+            jtis: list[bytes] = await self.redis.zrangebyscore(self.REDIS_KEY, since, "+inf")
+        except RedisError:
+            py_logger.error("Error while syncing revoked tokens", exc_info=True)
+            return
+
+        if full:
+            self._reset_bloom()
+        for jti in jtis:
+            self.bloom.add(jti.decode())
+
+        self._synced_at = now
+        self._sync_checked_at = time.monotonic()
+
+    async def revoke(self, jti: str) -> bool:
+        """Returns False if the token is revoked already, by this process or (with Redis) by another one."""
+        now = time.time()
+        self._prune(now)
+        if jti in self.revoked:
+            return False
+        self.revoked[jti] = now
+        self.bloom.add(jti)
+
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    # Only the first of concurrent revocations adds the jti
+                    pipe.zadd(self.REDIS_KEY, {jti: now}, nx=True)
+                    pipe.zremrangebyscore(self.REDIS_KEY, "-inf", now - self.lifetime)
+                    added, _ = await pipe.execute()
+                return added == 1
+            except RedisError:
+                py_logger.error("Error while revoking token", exc_info=True)
+
+        return True
+
+    async def is_revoked(self, jti: str) -> bool:
+        await self.sync()
+
+        if jti not in self.bloom:
+            return False
+
+        if jti in self.revoked or self.redis is None:
+            return jti in self.revoked
+
+        try:
+            return await self.redis.zscore(self.REDIS_KEY, jti) is not None
+        except RedisError:
+            py_logger.error("Error while checking revoked token", exc_info=True)
+            # Bloom filter hit is most likely a revoked token
+            return True
+
+
+class TokenDecoder:
+    """Decodes and verifies tokens with an LRU cache of decoded payloads and revocation check."""
+
+    def __init__(self, keyset: KeySet, revocations: RevocationList, max_entries: int = config.TOKEN_CACHE_MAX_ENTRIES):
+        self.keyset = keyset
+        self.revocations = revocations
+        self.max_entries = max_entries
+        # token: payload
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+
+    def _decode(self, token: str) -> dict:
+        payload = self.entries.get(token)
+
+        if payload is not None:
+            if payload[config.EXP] <= time.time():
+                del self.entries[token]
+                raise jwt.exceptions.ExpiredSignatureError("Signature has expired")
+            self.entries.move_to_end(token)
+            return payload
+
+        payload = self.keyset.decode(token)
+        self.entries[token] = payload
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return payload
+
+    async def decode(self, token: str, token_type: str) -> dict:
+        payload = self._decode(token)
+
+        # Tokens issued before typ claim pass as any type
+        if payload.get(config.TYP, token_type) != token_type:
+            raise jwt.exceptions.InvalidTokenError("Invalid token type")
+
+        if config.JTI in payload and await self.revocations.is_revoked(payload[config.JTI]):
+            raise jwt.exceptions.InvalidTokenError("Token revoked")
+
+        return payload
+
+
+keyset = KeySet()
+revocation_list = RevocationList()
+token_decoder = TokenDecoder(keyset, revocation_list)
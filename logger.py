@@ -1,17 +1,225 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+from core import config
+
+# Id of the request being handled, set by fastapp.middleware.RequestIdMiddleware
+request_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes of every LogRecord, the rest are passed by extra={...}
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One json object per line: time, level, logger, message, request_id, exception and extra fields."""
+
+    def __init__(self):
+        super().__init__()
+        # Records of one second share formatted time, only milliseconds differ
+        self._second: int | None = None
+        self._second_text: str = ""
+        # json.dumps with options makes an encoder per call
+        self._encoder = json.JSONEncoder(default=str, ensure_ascii=False)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        second = int(record.created)
+        if second != self._second:
+            self._second_text = time.strftime(self.default_time_format, self.converter(second))
+            self._second = second
+        return self.default_msec_format % (self._second_text, record.msecs)
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+
+        extra_keys = record.__dict__.keys() - _RECORD_ATTRIBUTES
+        if extra_keys:
+            data.update((key, value) for key, value in record.__dict__.items() if key in extra_keys)
+
+        return self._encoder.encode(data)
+
+
+class ContextFilter(logging.Filter):
+    """Adds request id to records and lets through only sample_rate of debug records."""
+
+    def __init__(self, debug_sample_rate: float = config.LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1 and random.random() >= self.debug_sample_rate:
+            return False
+
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Keeps message and exception apart for JsonFormatter and drops records when queue is full."""
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = config.LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Queue is thread safe, so the handler lock isn't taken
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return bool(rv)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments may change after the call, so message is formatted here, but only for records that pass the level.
+        # Copy is queued as in the stdlib, other handlers of the record get it unchanged
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+
+        self.queue.put_nowait(record)
+
+
+class _LogQueue:
+    """Queue of records written to one file by a background thread.
+
+    The thread takes all waiting records (up to LOG_WRITE_BATCH_SIZE) and writes them with one write and flush.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.formatter = JsonFormatter()
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.handler = _QueueHandler(self.queue)
+        self.handler.addFilter(ContextFilter())
+        self.thread: threading.Thread | None = None
+        self.start()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._write, name=f"log-{self.file_name}", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        # Writes records left in queue
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def restart_after_fork(self) -> None:
+        # Writer thread isn't copied to forked process, records of the parent left in queue belong to it
+        self.queue = queue.SimpleQueue()
+        self.handler.queue = self.queue
+        self.start()
+
+    def _format(self, records: list[logging.LogRecord]) -> list[str]:
+        lines: list[str] = []
+        for record in records:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                self.handler.handleError(record)
+        return lines
+
+    def _write(self) -> None:
+        log_queue = self.queue
+        stream = None
+        stopped = False
+        while not stopped:
+            records: list[logging.LogRecord] = [log_queue.get()]
+            while len(records) < config.LOG_WRITE_BATCH_SIZE:
+                try:
+                    records.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # None is put by stop()
+            stopped = None in records
+            batch = [record for record in records if record is not None]
+            lines = self._format(batch)
+            if not lines:
+                continue
+
+            try:
+                if stream is None:
+                    stream = open(f"{config.LOG_PATH}/{self.file_name}.log", mode='a', encoding="utf-8")
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except OSError:
+                # Whole batch is lost, the error is reported once with its last record
+                self.handler.handleError(batch[-1])
+
+        if stream is not None:
+            stream.close()
+
+
+_log_queues: dict[str, _LogQueue] = {}
+_lock = threading.Lock()
+
+
+def _get_log_queue(file_name: str) -> _LogQueue:
+    with _lock:
+        if file_name not in _log_queues:
+            _log_queues[file_name] = _LogQueue(file_name)
+
+        return _log_queues[file_name]
+
+
+@atexit.register
+def stop_logging() -> None:
+    for log_queue in _log_queues.values():
+        log_queue.stop()
+
+
+def _restart_logging() -> None:
+    for log_queue in _log_queues.values():
+        log_queue.restart_after_fork()
+
+
+os.register_at_fork(after_in_child=_restart_logging)
 
 
 def get_logger(name: str, file_name: str = "main") -> logging.Logger:
+    """Logger writing json lines to logs/<file_name>.log from a background thread.
+
+    Pass arguments to be formatted lazily: py_logger.debug("Getting url: %s", url), so records
+    below LOG_LEVEL cost no formatting.
+    """
     py_logger = logging.getLogger(name)
     if not py_logger.hasHandlers():
-        py_logger.setLevel(logging.DEBUG)
-
-        py_handler = logging.FileHandler(f"logs/{file_name}.log", mode='a')
-        py_formatter = logging.Formatter(
-            "[%(asctime)s][%(name)s][%(levelname)s]: %(message)s")
-
-        py_handler.setFormatter(py_formatter)
-        py_logger.addHandler(py_handler)
+        py_logger.setLevel(config.LOG_LEVEL)
+        py_logger.addHandler(_get_log_queue(file_name).handler)
     return py_logger
 
 
@@ -0,0 +1,63 @@
+import os
+
+# Settings needed to import the app, real values come from .env
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("EMAIL_LOGIN", "test@example.com")
+os.makedirs("logs", exist_ok=True)
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from fastapp import models
+from fastapp.database import SQLALCHEMY_ASYNC_DATABASE_URL
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def db_engine() -> AsyncEngine:
+    """Engine of the test database (POSTGRESQL_* settings) with created tables. Tests are skipped if it's unreachable."""
+    engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+    try:
+        async with engine.connect():
+            pass
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"Test database is not available: {e}")
+
+    async with engine.begin() as connection:
+        # Created by migrations, create_all skips it (create_type=False)
+        await connection.execute(text(
+            "DO $$ BEGIN CREATE TYPE code_type_enum AS ENUM ('email', 'phone_number'); "
+            "EXCEPTION WHEN duplicate_object THEN NULL; END $$"))
+        await connection.run_sync(models.Base.metadata.create_all)
+
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def db_connection(db_engine: AsyncEngine) -> AsyncConnection:
+    # Everything written by the test is rolled back
+    async with db_engine.connect() as connection:
+        transaction = await connection.begin()
+        yield connection
+        await transaction.rollback()
+
+
+def create_test_session(connection: AsyncConnection) -> AsyncSession:
+    # Commits of the session release a savepoint, the outer transaction is kept
+    return AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+
+
+@pytest.fixture
+async def db(db_connection: AsyncConnection) -> AsyncSession:
+    async with create_test_session(db_connection) as session:
+        yield session
+
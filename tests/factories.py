@@ -0,0 +1,25 @@
+"""Rows of the test database."""
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fastapp import models
+
+
+async def seed_catalog(db: AsyncSession, products_count: int, collections_count: int = 2, sizes: tuple[str, ...] = ("S", "M")) -> list[models.Collection]:
+    """Adds collections with products_count products each, every product with a combination per size."""
+    collections: list[models.Collection] = []
+    for collection_number in range(collections_count):
+        collection = models.Collection(vsrap_id=collection_number + 1, vsrap_url=f"/catalog/{collection_number + 1}",
+                                       title=f"Collection {collection_number + 1}")
+        for product_number in range(products_count):
+            vsrap_id = (collection_number + 1) * 100000 + product_number
+            product = models.Product(vsrap_id=vsrap_id, vsrap_url=f"/product/{vsrap_id}", title=f"Hoodie {vsrap_id}",
+                                     price=1000 + product_number, image_url="")
+            product.combinations = [models.Combination(vsrap_id=vsrap_id * 10 + size_number, combination_number=size_number,
+                                                       size=size, price=product.price, product_vsrap_id=vsrap_id)
+                                    for size_number, size in enumerate(sizes)]
+            collection.products.append(product)
+        collections.append(collection)
+
+    db.add_all(collections)
+    await db.flush()
+    return collections
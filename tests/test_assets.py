@@ -0,0 +1,75 @@
+"""Static files: byte ranges and precompressed variants."""
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from fastapp.assets import CachedStaticFiles, build_static, parse_range
+
+CSS = b"body { color: #222; }\n" * 100
+
+
+@pytest.mark.parametrize("range_header, byte_range", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    # Not supported, whole file is sent
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=-", None),
+])
+def test_parse_range(range_header: str, byte_range: tuple[int, int] | None):
+    assert parse_range(range_header, 1000) == byte_range
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1000-", "bytes=500-100", "bytes=-0"])
+def test_parse_unsatisfiable_range(range_header: str):
+    with pytest.raises(ValueError):
+        parse_range(range_header, 1000)
+
+
+@pytest.fixture
+async def client(tmp_path):
+    (tmp_path / "source" / "css").mkdir(parents=True)
+    (tmp_path / "source" / "css" / "main.css").write_bytes(CSS)
+    build_static(str(tmp_path / "source"), str(tmp_path / "build"))
+
+    app = Starlette(routes=[Mount("/static", CachedStaticFiles(directory=str(tmp_path / "build")))])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("accept_encoding, content_encoding", [
+    ("gzip", "gzip"),
+    ("gzip;q=0.5, identity", "gzip"),
+    ("gzip;q=0", None),
+    ("*;q=0, identity", None),
+    ("*", "gzip"),
+    ("*, gzip;q=0, br;q=0", None),
+])
+async def test_accept_encoding(client: httpx.AsyncClient, accept_encoding: str, content_encoding: str | None, monkeypatch):
+    # Brotli variant is made only if brotli is installed
+    monkeypatch.setattr("fastapp.assets.ENCODINGS", (("gzip", ".gz"),))
+    response = await client.get("/static/css/main.css", headers={"Accept-Encoding": accept_encoding})
+
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == content_encoding
+    assert response.content == CSS
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("range_header, status_code, content", [
+    ("bytes=0-3", 206, CSS[:4]),
+    ("bytes=-4", 206, CSS[-4:]),
+    ("bytes=0-1,5-6", 200, CSS),
+    ("bytes=5000-", 416, b""),
+])
+async def test_range_request(client: httpx.AsyncClient, range_header: str, status_code: int, content: bytes):
+    response = await client.get("/static/css/main.css", headers={"Range": range_header, "Accept-Encoding": "gzip"})
+
+    assert response.status_code == status_code
+    assert response.content == content
+    assert "content-encoding" not in response.headers
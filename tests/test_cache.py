@@ -0,0 +1,39 @@
+"""Catalog cache version store: web workers must see version bumps of celery workers. Conditional requests."""
+import pytest
+
+from fastapp import cache
+
+
+def test_version_redis_falls_back_to_broker(monkeypatch):
+    monkeypatch.setattr(cache.config, "CACHE_REDIS_URL", None)
+    monkeypatch.setattr(cache.config, "CELERY_BROKER_URL", "redis://broker:6379/0")
+
+    assert cache.get_version_redis_url() == "redis://broker:6379/0"
+
+    catalog_cache = cache.CatalogCache(redis_url=None, version_redis_url=cache.get_version_redis_url())
+    assert catalog_cache.redis is None
+    assert catalog_cache.version_redis is not None
+    assert catalog_cache.local_ttl == catalog_cache.ttl
+
+
+def test_local_ttl_without_shared_version(monkeypatch):
+    monkeypatch.setattr(cache.config, "CACHE_REDIS_URL", None)
+    monkeypatch.setattr(cache.config, "CELERY_BROKER_URL", "amqp://broker:5672")
+
+    assert cache.get_version_redis_url() is None
+
+    catalog_cache = cache.CatalogCache(redis_url=None, version_redis_url=None, ttl=3600, local_ttl=30)
+    assert catalog_cache.local_ttl == 30
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('"xyz",W/"abc"', True),
+    ("*", True),
+    ('"xyz"', False),
+    ('"abcd"', False),
+])
+def test_if_none_match(if_none_match: str, matches: bool):
+    assert cache.if_none_match_matches(if_none_match, '"abc"') is matches
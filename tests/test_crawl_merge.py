@@ -0,0 +1,76 @@
+"""Crawl merge and notification fan-out on the test database, skipped without it."""
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fastapp import crud, events, models, schemas
+from fastapp.loader import CrawlLoader
+from tests.factories import seed_catalog
+
+
+async def get_out_of_stock_products(db: AsyncSession) -> set[int]:
+    select_stmt = select(models.Combination.product_vsrap_id).where(models.Combination.in_stock == False)
+    return set((await db.scalars(select_stmt)).all())
+
+
+@pytest.mark.anyio
+async def test_vanished_products_out_of_stock(db: AsyncSession):
+    complete_collection, partial_collection = await seed_catalog(db, 3)
+    listed_product = complete_collection.products[0]
+
+    loader = CrawlLoader(db)
+    await loader.start()
+    await loader.add(complete_collection, schemas.CollectionProductCombination(
+        products=[schemas.ProductCreate.model_validate(listed_product)],
+        combinations=[schemas.CombinationCreate.model_validate(combination) for combination in listed_product.combinations]))
+    await loader.merge([complete_collection.id])
+
+    # Products of the collection crawled partially are kept as they are
+    assert await get_out_of_stock_products(db) == {product.vsrap_id for product in complete_collection.products[1:]}
+
+
+@pytest.mark.anyio
+async def test_merge_returns_changed_rows(db: AsyncSession):
+    collection = (await seed_catalog(db, 2, collections_count=1))[0]
+    unchanged_product, changed_product = [schemas.ProductCreate.model_validate(product) for product in collection.products]
+    changed_product.price += 100
+    new_product = schemas.ProductCreate(vsrap_id=900000, vsrap_url="/product/900000", title="Hoodie 900000", price=1000, image_url="")
+
+    loader = CrawlLoader(db)
+    await loader.start()
+    await loader.add(collection, schemas.CollectionProductCombination(products=[unchanged_product, changed_product, new_product]))
+    stats = await loader.merge([])
+
+    assert stats.products_inserted == [new_product.vsrap_id]
+    assert stats.products_updated == [changed_product.vsrap_id]
+    assert stats.combinations_inserted == stats.combinations_updated == []
+
+
+@pytest.mark.anyio
+async def test_notify_marks_only_fanned_out_events(db: AsyncSession, monkeypatch):
+    sent_tasks: list = []
+    monkeypatch.setattr(events.celery_app, "send_task", lambda name, args: sent_tasks.append(args))
+
+    collection = (await seed_catalog(db, 2, collections_count=1))[0]
+    combination, other_combination = collection.products[0].combinations[0], collection.products[1].combinations[0]
+    db.add(models.User(email="user@example.com", is_verified_email=True, password_hash="", combinations=[combination]))
+    await crud.create_combination_events(db, [{"event_key": "restock:1", "type": "restock", "combination_id": combination.id,
+                                              "old_price": None, "new_price": combination.price}])
+    await db.commit()
+
+    real_create_notifications = crud.create_notifications
+
+    async def create_notifications_and_log_event(db: AsyncSession, events_ids: list) -> None:
+        # Event logged by a crawl after the fan-out selected its events
+        await real_create_notifications(db, events_ids)
+        await crud.create_combination_events(db, [{"event_key": "restock:2", "type": "restock", "combination_id": other_combination.id,
+                                                  "old_price": None, "new_price": other_combination.price}])
+
+    monkeypatch.setattr(crud, "create_notifications", create_notifications_and_log_event)
+
+    assert await events.notify_subscribers(db) == 1
+    assert len(sent_tasks) == 1
+
+    notified_at: dict[str, bool] = dict((await db.execute(select(
+        models.CombinationEvent.event_key, models.CombinationEvent.notified_at != None))).all())
+    assert notified_at == {"restock:1": True, "restock:2": False}
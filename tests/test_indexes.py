@@ -0,0 +1,102 @@
+"""Crud queries of the hot paths are planned with indexes: statements are captured while the crud function runs
+and explained with sequential scans disabled, a Seq Scan left in the plan means no index matches the query.
+
+Needs the test database, skipped without it.
+"""
+import datetime
+import json
+import uuid
+from collections.abc import Awaitable, Callable
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from fastapp import crud, models
+from tests.factories import seed_catalog
+
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+def get_seq_scans(plan: dict) -> list[str]:
+    seq_scans: list[str] = []
+    if plan["Node Type"] == "Seq Scan":
+        seq_scans.append(plan["Relation Name"])
+    for subplan in plan.get("Plans", []):
+        seq_scans += get_seq_scans(subplan)
+    return seq_scans
+
+
+async def explain(db: AsyncSession, db_engine: AsyncEngine, crud_call: Callable[[], Awaitable]) -> list[dict]:
+    """Runs crud_call and returns plans of its statements. Every crud function must run at least one statement."""
+    statements: list[tuple[str, tuple]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            statements.append((statement, parameters))
+
+    await db.execute(text("SET LOCAL enable_seqscan = off"))
+    event.listen(db_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        await crud_call()
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    assert statements
+    connection = await db.connection()
+    plans: list[dict] = []
+    for statement, parameters in statements:
+        result = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)).scalar_one()
+        plans.append((json.loads(result) if isinstance(result, str) else result)[0]["Plan"])
+
+    return plans
+
+
+@pytest.fixture
+async def catalog(db: AsyncSession) -> list[models.Collection]:
+    return await seed_catalog(db, 50)
+
+
+@pytest.fixture
+async def user(db: AsyncSession, catalog: list[models.Collection]) -> models.User:
+    users = [models.User(email=f"user{i}@example.com", is_verified_email=i % 2 == 0, phone_number=f"+7900000{i:04}",
+                         password_hash="", expire_datetime=datetime.datetime.now() + datetime.timedelta(days=1))
+             for i in range(50)]
+    for i, user in enumerate(users):
+        user.combinations = [catalog[i % 2].products[i].combinations[0]]
+        user.codes = [models.Code(type="email", code=f"{i:06}", expire_datetime=datetime.datetime.now())]
+    db.add_all(users)
+    await db.flush()
+    return users[0]
+
+
+CRUD_CALLS: dict[str, Callable[[AsyncSession, models.User], Awaitable]] = {
+    "products page": lambda db, user: crud.get_products(db, page=1, page_size=10),
+    "products keyset page": lambda db, user: crud.get_products(db, page_size=10, cursor=(1010, 100010)),
+    "products search": lambda db, user: crud.get_products(db, page_size=10, search_text="hodie"),
+    "products search substring": lambda db, user: crud.get_products(db, page_size=10, search_text="00010"),
+    "collection products keyset page": lambda db, user: crud.get_products_by_collection_vsrap_id(
+        db, [1], page_size=10, cursor=(1010, 100010)),
+    "collection products search": lambda db, user: crud.get_products_by_collection_vsrap_id(
+        db, [1], page_size=10, search_text="hoodie"),
+    "user products": lambda db, user: crud.get_user_products(db, user.id, page_size=10),
+    "user combinations": lambda db, user: crud.get_user_combinations(db, user.id),
+    "remove combination from user": lambda db, user: crud.remove_combination_from_user(db, uuid.uuid4(), user.id),
+    "user by email": lambda db, user: crud.get_user_by_email(db, user.email, is_verified=True),
+    "user by email or phone number": lambda db, user: crud.get_user_by_email_or_by_phone_number(
+        db, user.email, user.phone_number),
+    "code by user email": lambda db, user: crud.get_code_by_user_email(db, "000000", user.email),
+    "code by phone number": lambda db, user: crud.get_code_by_phone_number(db, "000000", user.phone_number),
+    "delete user by email": lambda db, user: crud.delete_user_by_email(db, "unknown@example.com"),
+    "delete user by phone number": lambda db, user: crud.delete_user_by_phone_number(db, "+70000000000"),
+    "delete expired users": lambda db, user: crud.delete_expired_users(db),
+}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("name", list(CRUD_CALLS))
+async def test_crud_uses_indexes(db: AsyncSession, db_engine: AsyncEngine, user: models.User, name: str):
+    plans = await explain(db, db_engine, lambda: CRUD_CALLS[name](db, user))
+
+    for plan in plans:
+        assert get_seq_scans(plan) == [], json.dumps(plan, indent=2)
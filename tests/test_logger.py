@@ -0,0 +1,82 @@
+"""Queued json logging: records are written by the writer thread with request id and exception."""
+import json
+import logging
+
+import logger
+
+
+def read_lines(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_records_written_as_json_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger.config, "LOG_PATH", str(tmp_path))
+    log_queue = logger._LogQueue("test")
+    py_logger = logging.getLogger("test_logger")
+    py_logger.propagate = False
+    py_logger.setLevel(logging.DEBUG)
+    py_logger.addHandler(log_queue.handler)
+
+    args = ["a"]
+    token = logger.request_id_var.set("request-1")
+    try:
+        py_logger.debug("Args: %s", args, extra={"user": 5})
+        # Message is formatted when logged, not when written
+        args.append("b")
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            py_logger.error("Error", exc_info=True)
+    finally:
+        logger.request_id_var.reset(token)
+        py_logger.removeHandler(log_queue.handler)
+
+    log_queue.stop()
+
+    debug_line, error_line = read_lines(tmp_path / "test.log")
+    assert {key: debug_line[key] for key in ("level", "logger", "message", "request_id", "user")} == {
+        "level": "DEBUG", "logger": "test_logger", "message": "Args: ['a']", "request_id": "request-1", "user": 5}
+    assert error_line["message"] == "Error"
+    assert "ValueError: failed" in error_line["exc_info"]
+
+
+def test_full_queue_drops_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger.config, "LOG_PATH", str(tmp_path))
+    log_queue = logger._LogQueue("test")
+    log_queue.stop()
+    log_queue.handler.max_size = 2
+
+    for i in range(3):
+        log_queue.handler.handle(logging.makeLogRecord({"msg": f"record {i}", "levelno": logging.INFO}))
+
+    assert log_queue.queue.qsize() == 2
+    assert log_queue.handler.dropped == 1
+
+
+def test_queued_record_is_a_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger.config, "LOG_PATH", str(tmp_path))
+    log_queue = logger._LogQueue("test")
+    log_queue.stop()
+    record = logging.makeLogRecord({"msg": "Args: %s", "args": ("a",), "levelno": logging.INFO})
+
+    log_queue.handler.handle(record)
+
+    # Other handlers of the record format it themselves
+    assert (record.msg, record.args) == ("Args: %s", ("a",))
+    assert log_queue.queue.get_nowait().msg == "Args: a"
+
+
+def test_write_error_is_reported_with_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger.config, "LOG_PATH", str(tmp_path / "missing"))
+    log_queue = logger._LogQueue("test")
+    log_queue.stop()
+    failed: list = []
+    monkeypatch.setattr(log_queue.handler, "handleError", failed.append)
+    record = logging.makeLogRecord({"msg": "record", "levelno": logging.INFO})
+
+    # Record and the stop sentinel are written in one batch
+    log_queue.queue.put(record)
+    log_queue.queue.put(None)
+    log_queue._write()
+
+    assert failed == [record]
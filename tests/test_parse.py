@@ -0,0 +1,85 @@
+"""Parser backends against saved pages: every backend must return the golden schemas.
+
+Pages are in tests/golden, expected results next to them (<page>.json).
+"""
+import asyncio
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from fastapp.parse import PARSER_BACKENDS, HtmlParser, PageParser, parse_product_price
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+
+
+def read_page(name: str) -> bytes:
+    return (GOLDEN_DIR / name).read_bytes()
+
+
+def read_expected(name: str):
+    return json.loads((GOLDEN_DIR / name).read_text(encoding="utf-8"))
+
+
+@pytest.fixture(params=list(PARSER_BACKENDS))
+def html_parser(request) -> HtmlParser:
+    return PARSER_BACKENDS[request.param]()
+
+
+def test_collections(html_parser: HtmlParser):
+    collections = html_parser.parse_collections(read_page("brands.html"))
+
+    assert [collection.model_dump(mode="json") for collection in collections] == read_expected("brands.json")
+
+
+def test_products_page(html_parser: HtmlParser):
+    products_page = html_parser.parse_products_page(read_page("catalog.html"))
+
+    assert products_page.model_dump(mode="json") == read_expected("catalog.json")
+
+
+def test_product_price(html_parser: HtmlParser):
+    assert html_parser.product_price(read_page("product.html")) == 32900
+    assert html_parser.product_price(read_page("product_without_price.html")) is None
+
+
+def test_backends_are_identical():
+    results = [parser_class().parse_products_page(read_page("catalog.html")).model_dump(mode="json")
+               for parser_class in PARSER_BACKENDS.values()]
+
+    assert all(result == results[0] for result in results)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class IncompleteParser(HtmlParser):
+        def collection_items(self, html: bytes):
+            return iter([])
+
+    with pytest.raises(TypeError, match="product_cards"):
+        IncompleteParser()
+
+
+def parse_in_page_parser(results: multiprocessing.Queue) -> None:
+    page_parser = PageParser(in_process_pool=True, worker_count=1)
+    try:
+        price = asyncio.run(page_parser.parse(parse_product_price, read_page("product.html")))
+        results.put((type(page_parser.executor).__name__, price))
+    finally:
+        page_parser.close()
+
+
+def test_page_parser_pools():
+    page_parser = PageParser(in_process_pool=True, worker_count=1)
+    assert isinstance(page_parser.executor, ProcessPoolExecutor)
+    assert asyncio.run(page_parser.parse(parse_product_price, read_page("product.html"))) == 32900
+    page_parser.close()
+
+    # Celery prefork pool workers are daemonic and can't start a process pool
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=parse_in_page_parser, args=(results,), daemon=True)
+    process.start()
+    process.join(timeout=30)
+
+    assert results.get(timeout=1) == (ThreadPoolExecutor.__name__, 32900)
@@ -0,0 +1,52 @@
+"""Password hashing: verification, rehash of old hashes and unknown users."""
+import hashlib
+
+import pytest
+
+from fastapp.passwords import PasswordHasher
+
+PASSWORD = "password"
+
+
+@pytest.fixture
+def hasher() -> PasswordHasher:
+    # Low cost, hashes of the tests only
+    return PasswordHasher(worker_count=1, n=2 ** 10)
+
+
+@pytest.mark.anyio
+async def test_current_hash_is_not_rehashed(hasher: PasswordHasher):
+    password_hash = await hasher.hash(PASSWORD)
+
+    assert await hasher.verify(PASSWORD, password_hash) == (True, False)
+    assert await hasher.verify("wrong", password_hash) == (False, False)
+
+
+@pytest.mark.anyio
+async def test_lower_cost_hash_needs_rehash(hasher: PasswordHasher):
+    password_hash = await PasswordHasher(worker_count=1, n=2 ** 9).hash(PASSWORD)
+
+    assert await hasher.verify(PASSWORD, password_hash) == (True, True)
+
+
+@pytest.mark.anyio
+async def test_legacy_hash_needs_rehash(hasher: PasswordHasher):
+    legacy_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+
+    assert await hasher.verify(PASSWORD, legacy_hash) == (True, True)
+    assert (await hasher.verify("wrong", legacy_hash))[0] is False
+
+
+@pytest.mark.anyio
+async def test_unknown_user_is_hashed_anyway(hasher: PasswordHasher, monkeypatch):
+    hashed: list[str] = []
+    real_hash = hasher._hash
+
+    def hash_password(password: str) -> str:
+        hashed.append(password)
+        return real_hash(password)
+
+    monkeypatch.setattr(hasher, "_hash", hash_password)
+
+    assert await hasher.verify(PASSWORD, None) == (False, False)
+    assert hashed == [PASSWORD]
@@ -0,0 +1,52 @@
+"""Cached principals are dropped when their users change or are deleted. Needs the test database, skipped without it."""
+import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fastapp import cache, crud, models, schemas
+
+
+@pytest.fixture
+def principal_cache(monkeypatch) -> cache.PrincipalCache:
+    principal_cache = cache.PrincipalCache(redis_url=None)
+    monkeypatch.setattr(crud, "principal_cache", principal_cache)
+    return principal_cache
+
+
+@pytest.fixture
+async def users(db: AsyncSession, principal_cache: cache.PrincipalCache) -> list[models.User]:
+    expired = datetime.datetime.now() - datetime.timedelta(days=1)
+    users = [models.User(email=f"user{i}@example.com", is_verified_email=i == 0, password_hash="", expire_datetime=expired)
+             for i in range(3)]
+    db.add_all(users)
+    await db.flush()
+    for user in users:
+        await principal_cache.set(str(user.id), "jti", schemas.Principal.model_validate(user))
+    return users
+
+
+async def get_cached_users(principal_cache: cache.PrincipalCache, users: list[models.User]) -> list[models.User]:
+    return [user for user in users if await principal_cache.get(str(user.id), "jti") is not None]
+
+
+@pytest.mark.anyio
+async def test_delete_user_invalidates(db: AsyncSession, principal_cache: cache.PrincipalCache, users: list[models.User]):
+    await crud.delete_user_by_email(db, users[1].email)
+
+    assert await get_cached_users(principal_cache, users) == [users[0], users[2]]
+
+
+@pytest.mark.anyio
+async def test_delete_expired_users_invalidates(db: AsyncSession, principal_cache: cache.PrincipalCache, users: list[models.User]):
+    await crud.delete_expired_users(db)
+
+    # Verified user is kept
+    assert await get_cached_users(principal_cache, users) == [users[0]]
+
+
+@pytest.mark.anyio
+async def test_update_user_invalidates(db: AsyncSession, principal_cache: cache.PrincipalCache, users: list[models.User]):
+    await crud.update_user_email(db, users[0], "new@example.com")
+
+    assert await get_cached_users(principal_cache, users) == users[1:]
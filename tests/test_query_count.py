@@ -0,0 +1,112 @@
+"""Statements per request of the catalog routes don't grow with the number of rows (no N+1).
+
+Needs the test database, skipped without it.
+"""
+import contextlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from fastapp import cache, dependencies, models
+from fastapp.api.routes import router
+from fastapp.database import get_db
+from tests.conftest import create_test_session
+from tests.factories import seed_catalog
+
+
+@contextlib.contextmanager
+def count_statements(engine: AsyncEngine):
+    """Collects SELECT statements run by the engine, savepoints of test sessions are left out."""
+    statements: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def app(db_connection: AsyncConnection, monkeypatch) -> FastAPI:
+    # Responses must be built, not taken from the cache of another test
+    monkeypatch.setattr(cache, "catalog_cache", cache.CatalogCache(redis_url=None, version_redis_url=None))
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+
+    async def get_test_db():
+        async with create_test_session(db_connection) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_test_db
+    return app
+
+
+@pytest.fixture
+async def client(app: FastAPI):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("products_count", [2, 20])
+@pytest.mark.parametrize("path, params, expected_statements", [
+    # collections + products
+    ("/api/v1/collection", {}, 2),
+    # products + collections + combinations
+    ("/api/v1/product", {}, 3),
+    ("/api/v1/product", {"collection_vsrap_ids": [1, 2]}, 3),
+    ("/api/v1/product", {"search_text": "hoodie"}, 3),
+])
+async def test_catalog_statements_count(client: httpx.AsyncClient, db: AsyncSession, db_engine: AsyncEngine,
+                                        products_count: int, path: str, params: dict, expected_statements: int):
+    await seed_catalog(db, products_count)
+
+    with count_statements(db_engine) as statements:
+        response = await client.get(path, params=params)
+
+    assert response.status_code == 200
+    assert len(response.json()) > 0
+    assert len(statements) == expected_statements, statements
+
+
+@pytest.mark.anyio
+async def test_next_page_statements_count(client: httpx.AsyncClient, db: AsyncSession, db_engine: AsyncEngine):
+    await seed_catalog(db, 20)
+    response = await client.get("/api/v1/product", params={"page_size": 10})
+
+    with count_statements(db_engine) as statements:
+        response = await client.get("/api/v1/product", params={"page_size": 10, "cursor": response.headers["X-Next-Cursor"]})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+    assert len(statements) == 3, statements
+
+
+@pytest.mark.anyio
+async def test_user_products(app: FastAPI, client: httpx.AsyncClient, db: AsyncSession, db_engine: AsyncEngine):
+    collections = await seed_catalog(db, 3)
+    user = models.User(email="user@example.com", password_hash="")
+    subscribed_combinations = [collections[0].products[1].combinations[0], collections[1].products[0].combinations[1]]
+    user.combinations = subscribed_combinations
+    db.add(user)
+    await db.flush()
+    app.dependency_overrides[dependencies.get_user_id_from_access_token] = lambda: user.id
+
+    with count_statements(db_engine) as statements:
+        response = await client.get("/api/v1/user/products")
+
+    assert response.status_code == 200
+    assert len(statements) == 1, statements
+    products: list[dict] = response.json()
+    assert [product["id"] for product in products] == [str(collections[1].products[0].id), str(collections[0].products[1].id)]
+    assert [combination["vsrap_id"] for product in products for combination in product["combinations"]] == [
+        subscribed_combinations[1].vsrap_id, subscribed_combinations[0].vsrap_id]
+    assert [collection["vsrap_id"] for product in products for collection in product["collections"]] == [2, 1]
@@ -0,0 +1,47 @@
+"""Api routes on an app without database: crud calls are replaced where a route reaches them."""
+import base64
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from fastapp.api.routes import router
+from fastapp.database import get_db
+
+
+@pytest.fixture
+def app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+
+    async def get_test_db():
+        yield None
+
+    app.dependency_overrides[get_db] = get_test_db
+    return app
+
+
+@pytest.fixture
+async def client(app: FastAPI):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cursor", ["%%%notb64", "bm90IGpzb24", "WzFd", "eyJhIjogMX0",
+                                    *[base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+                                      for values in ([True, 1], [1, 2**31], [-2**31 - 1, 1], [1.5, 1])]])
+async def test_invalid_cursor(client: httpx.AsyncClient, cursor: str):
+    # not base64, not json, [1], {"a": 1}, bool, out of int32 range, float
+    response = await client.get("/api/v1/product", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.anyio
+async def test_page_size_over_max(client: httpx.AsyncClient):
+    response = await client.get("/api/v1/product", params={"page_size": 10 ** 6})
+
+    assert response.status_code == 422
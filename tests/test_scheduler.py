@@ -0,0 +1,30 @@
+"""Request limits of the crawl scheduler."""
+import asyncio
+
+import pytest
+
+from fastapp.scheduler import CrawlScheduler
+
+
+@pytest.mark.anyio
+async def test_busy_host_does_not_hold_global_slots():
+    scheduler = CrawlScheduler(max_concurrency=2, max_concurrency_per_host=1)
+    busy_host_released = asyncio.Event()
+    other_host_entered = asyncio.Event()
+
+    async def request_busy_host() -> None:
+        async with scheduler.limit("https://busy.example/page"):
+            await busy_host_released.wait()
+
+    async def request_other_host() -> None:
+        async with scheduler.limit("https://other.example/page"):
+            other_host_entered.set()
+
+    busy_requests = [asyncio.create_task(request_busy_host()) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(request_other_host(), timeout=1)
+    assert other_host_entered.is_set()
+
+    busy_host_released.set()
+    await asyncio.gather(*busy_requests)
@@ -0,0 +1,159 @@
+"""Scraper with a fake http session: retries and completing parsed pages."""
+import asyncio
+import uuid
+
+import aiohttp
+import pytest
+
+from core import config
+from fastapp import images, models, schemas, scrape
+from fastapp.images import ImageDownloader
+from fastapp.parse import PageParser
+from fastapp.scheduler import CrawlScheduler
+from tests.test_parse import read_expected, read_page
+
+
+class FakeContent:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def iter_chunked(self, size: int):
+        for i in range(0, len(self.body), size):
+            await asyncio.sleep(0)
+            yield self.body[i:i + size]
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.status = 200
+        self.headers: dict = {}
+        self.body = body
+        self.content = FakeContent(body)
+
+    def raise_for_status(self) -> None:
+        pass
+
+    async def read(self) -> bytes:
+        return self.body
+
+
+class FakeRequest:
+    def __init__(self, session: "FakeSession", url: str):
+        self.session = session
+        self.url = url
+        self.entered = False
+
+    async def __aenter__(self) -> FakeResponse:
+        self.session.requests.append(self.url)
+        if self.url not in self.session.pages or self.session.failures.get(self.url, 0) > 0:
+            self.session.failures[self.url] = self.session.failures.get(self.url, 0) - 1
+            raise aiohttp.ClientConnectionError(self.url)
+
+        self.entered = True
+        self.session.in_flight += 1
+        self.session.max_in_flight = max(self.session.max_in_flight, self.session.in_flight)
+        return FakeResponse(self.session.pages[self.url])
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self.entered:
+            self.session.in_flight -= 1
+
+
+class FakeSession:
+    """Answers urls of pages with their bodies, other urls and first failures[url] requests fail to connect."""
+
+    def __init__(self, pages: dict[str, bytes] | None = None, failures: dict[str, int] | None = None):
+        self.pages = pages or {}
+        self.failures = failures or {}
+        self.requests: list[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, url: str, headers: dict | None = None) -> FakeRequest:
+        return FakeRequest(self, url)
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    # Backoff delays, sleep(0) of the event loop internals is kept
+    sleeps: list[float] = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay: float, *args) -> None:
+        if delay == 0:
+            return await real_sleep(0, *args)
+        sleeps.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return sleeps
+
+
+@pytest.mark.anyio
+async def test_fetch_gives_up_without_sleep_after_last_try(sleeps: list[float]):
+    session = FakeSession()
+    scraper = scrape.Scraper(session, parser=PageParser(in_process_pool=False))
+
+    assert await scraper.fetch("https://vsrap.shop/brands/") is None
+    assert len(session.requests) == config.SCRAPER_PAGE_LOAD_MAX_TRYINGS
+    assert sleeps == [config.SCRAPER_SLEEP_ON_ERROR] * (config.SCRAPER_PAGE_LOAD_MAX_TRYINGS - 1)
+    assert scraper.stats.failed == 1
+
+
+@pytest.mark.anyio
+async def test_validate_products_page_without_images(sleeps: list[float]):
+    products_page = schemas.ProductsPage.model_validate(read_expected("catalog.json"))
+    session = FakeSession({url: read_page("product.html") for url in products_page.missing_price_urls.values()})
+    scraper = scrape.Scraper(session, parser=PageParser(in_process_pool=False))
+
+    products_combinations = await scraper.validate_products_page(products_page)
+
+    assert session.requests == list(products_page.missing_price_urls.values())
+    assert [product.vsrap_id for product in products_combinations.products] == [
+        product.vsrap_id for product in products_page.products]
+    assert all(product.image_url == "" for product in products_combinations.products)
+
+
+@pytest.mark.anyio
+async def test_image_download_is_retried(sleeps: list[float], tmp_path, monkeypatch):
+    monkeypatch.setattr(images.config, "MEDIA_PATH", str(tmp_path))
+    url = "https://vsrap.shop/upload/iblock/a1/soft-shell.jpg"
+    session = FakeSession({url: b"image"}, failures={url: config.SCRAPER_PAGE_LOAD_MAX_TRYINGS - 1})
+
+    async with ImageDownloader(session) as image_downloader:
+        product_image = await image_downloader.download(url)
+
+    assert product_image.url.endswith(".jpg")
+    assert len(session.requests) == config.SCRAPER_PAGE_LOAD_MAX_TRYINGS
+    assert sleeps == [config.SCRAPER_SLEEP_ON_ERROR] * (config.SCRAPER_PAGE_LOAD_MAX_TRYINGS - 1)
+
+
+@pytest.mark.anyio
+async def test_images_share_host_limit_with_pages(sleeps: list[float], tmp_path, monkeypatch):
+    monkeypatch.setattr(images.config, "MEDIA_PATH", str(tmp_path))
+    image_urls = [f"https://vsrap.shop/upload/{i}.jpg" for i in range(4)]
+    page_url = "https://vsrap.shop/catalog/pants/cargo/"
+    session = FakeSession({page_url: read_page("product.html"), **{url: url.encode() * 100000 for url in image_urls}})
+    scheduler = CrawlScheduler(max_concurrency_per_host=1)
+    scraper = scrape.Scraper(session, scheduler=scheduler, parser=PageParser(in_process_pool=False))
+
+    async with ImageDownloader(session, scheduler=scheduler) as image_downloader:
+        await asyncio.gather(scraper.fetch(page_url), *[image_downloader.download(url) for url in image_urls])
+
+    assert len(session.requests) == 5
+    assert session.max_in_flight == 1
+
+
+@pytest.mark.anyio
+async def test_dropped_products_keep_collection_incomplete(sleeps: list[float]):
+    collection = models.Collection(id=uuid.uuid4(), vsrap_id=1, vsrap_url="https://vsrap.shop/catalog/pants/", title="Pants")
+    scraper = scrape.Scraper(FakeSession(), parser=PageParser(in_process_pool=False))
+    # Price of one product on every page is taken from its page which fails
+    for page in range(1, 4):
+        scraper.session.pages[scraper.get_collection_page_url(collection, page)] = read_page("catalog.html")
+
+    crawled = [products_combinations async for _, products_combinations in scraper.crawl_products([collection])]
+
+    assert [products_combinations.dropped_vsrap_ids for products_combinations in crawled] == [[5002]] * 3
+    crawl = scraper.collection_crawls[collection.id]
+    assert not crawl.complete
+    assert crawl.crawl_state_urls == []
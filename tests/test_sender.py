@@ -0,0 +1,41 @@
+"""SMTP pool with a fake client: connections are reused and dropped after errors."""
+import aiosmtplib
+import pytest
+
+from fastapp import sender
+
+
+class FakeSMTP:
+    def __init__(self, errors: list[Exception]):
+        self.errors = errors
+        self.is_connected = False
+        self.connects = 0
+        self.sent = 0
+
+    async def connect(self) -> None:
+        self.is_connected = True
+        self.connects += 1
+
+    async def send_message(self, msg) -> None:
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent += 1
+
+    def close(self) -> None:
+        self.is_connected = False
+
+
+@pytest.mark.anyio
+async def test_client_is_reconnected_after_any_error():
+    smtp_pool = sender.SMTPPool(size=0, rate_limit=0)
+    client = FakeSMTP([aiosmtplib.SMTPResponseException(451, "Timeout in DATA")])
+    smtp_pool.clients.put_nowait(client)
+    msg = sender.create_email_message("user@example.com", "Restock", "Hoodie is back")
+
+    with pytest.raises(aiosmtplib.SMTPResponseException):
+        await smtp_pool.send_message(msg)
+    assert not client.is_connected
+
+    await smtp_pool.send_message(msg)
+    await smtp_pool.send_message(msg)
+    assert (client.connects, client.sent) == (2, 2)
@@ -0,0 +1,60 @@
+"""Thumbnails of downloaded product images, skipped without Pillow."""
+import io
+import os
+
+import pytest
+
+from core import config
+from fastapp import schemas, scrape
+from fastapp.images import ImageDownloader
+from fastapp.parse import PageParser
+from fastapp.thumbnails import make_thumbnails
+from tests.test_parse import read_expected
+from tests.test_scrape import FakeSession
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def create_image(width: int, height: int) -> bytes:
+    body = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(body, format="PNG")
+    return body.getvalue()
+
+
+def test_thumbnails_are_not_upscaled(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MEDIA_PATH", str(tmp_path))
+    (tmp_path / "product").mkdir()
+    (tmp_path / "product" / "image.png").write_bytes(create_image(300, 150))
+
+    variants = make_thumbnails("product/image.png", widths=(400, 200, 800), formats=("webp", "png", "unknown"))
+
+    assert variants == {image_format: [{"url": f"{config.MEDIA_URL}/product/image_{width}.{image_format}", "width": width}
+                                       for width in (200, 300)]
+                        for image_format in ("webp", "png")}
+    with Image.open(tmp_path / "product" / "image_200.webp") as thumbnail:
+        assert thumbnail.size == (200, 100)
+
+
+@pytest.mark.anyio
+async def test_products_get_image_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MEDIA_PATH", str(tmp_path))
+    products_page = schemas.ProductsPage.model_validate(read_expected("catalog.json"))
+    products_page.missing_price_urls = {}
+    session = FakeSession({url: create_image(300, 300) for url in products_page.image_download_urls.values()})
+    parser = PageParser(in_process_pool=False)
+
+    async with ImageDownloader(session, parser=parser) as image_downloader:
+        scraper = scrape.Scraper(session, parser=parser, images=image_downloader)
+        products_combinations = await scraper.validate_products_page(products_page)
+
+    image_products = [product for product in products_combinations.products if product.vsrap_id in products_page.image_download_urls]
+    assert image_products
+    for product in image_products:
+        # Written to the product table as {format: [{"url": ..., "width": ...}]}, widths ascending
+        image_variants: dict[str, list[dict]] = product.model_dump(mode="json")["image_variants"]
+        assert "webp" in image_variants
+        for image_format, variants in image_variants.items():
+            assert [variant["width"] for variant in variants] == [200, 300]
+            for variant in variants:
+                assert variant["url"].endswith(f"_{variant['width']}.{image_format}")
+                assert os.path.exists(os.path.join(tmp_path, variant["url"].removeprefix(config.MEDIA_URL + "/")))
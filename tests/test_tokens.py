@@ -0,0 +1,168 @@
+"""Token keys, types and revocation, with an in-memory stand-in of the revocations Redis."""
+import time
+
+import jwt
+import pytest
+
+from core import config
+from fastapp import dependencies, exceptions
+from fastapp.tokens import BloomFilter, KeySet, RevocationList, TokenDecoder
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands: list = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    def zadd(self, key: str, mapping: dict[str, float], nx: bool = False) -> None:
+        self.commands.append((self.redis.zadd, key, mapping, nx))
+
+    def zremrangebyscore(self, key: str, min_score, max_score) -> None:
+        self.commands.append((self.redis.zremrangebyscore, key, min_score, max_score))
+
+    async def execute(self) -> list:
+        return [await command(*args) for command, *args in self.commands]
+
+
+class FakeRedis:
+    """Sorted sets of the revocation list, shared by the processes of a test."""
+
+    def __init__(self):
+        self.zsets: dict[str, dict[str, float]] = {}
+        self.zscore_calls: list[str] = []
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    async def zadd(self, key: str, mapping: dict[str, float], nx: bool = False) -> int:
+        zset = self.zsets.setdefault(key, {})
+        added = [member for member in mapping if member not in zset]
+        zset.update({member: score for member, score in mapping.items() if not nx or member in added})
+        return len(added)
+
+    async def zremrangebyscore(self, key: str, min_score, max_score) -> int:
+        zset = self.zsets.get(key, {})
+        removed = [member for member, score in zset.items() if float(min_score) <= score <= float(max_score)]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+
+    async def zrangebyscore(self, key: str, min_score, max_score) -> list[bytes]:
+        return [member.encode() for member, score in self.zsets.get(key, {}).items()
+                if float(min_score) <= score <= float(max_score)]
+
+    async def zscore(self, key: str, member: str) -> float | None:
+        self.zscore_calls.append(member)
+        return self.zsets.get(key, {}).get(member)
+
+
+def create_revocation_list(redis: FakeRedis | None = None) -> RevocationList:
+    revocations = RevocationList(redis_url=None, sync_interval=0)
+    revocations.redis = redis
+    return revocations
+
+
+def create_payload(token_type: str, jti: str = "jti") -> dict:
+    return {config.SUB: "user", config.JTI: jti, config.TYP: token_type, config.EXP: int(time.time()) + 60}
+
+
+def test_keyset_rotation():
+    old_keyset = KeySet({"k1": "secret1"}, "k1", legacy_key="legacy", algorithm="HS256")
+    new_keyset = KeySet({"k1": "secret1", "k2": "secret2"}, "k2", legacy_key="legacy", algorithm="HS256")
+    old_token, new_token = old_keyset.encode({"sub": "user"}), new_keyset.encode({"sub": "user"})
+    legacy_token = jwt.encode({"sub": "user"}, "legacy", algorithm="HS256")
+
+    assert jwt.get_unverified_header(new_token)["kid"] == "k2"
+    # Tokens issued before rotation are still verified
+    for token in (old_token, new_token, legacy_token):
+        assert new_keyset.decode(token) == {"sub": "user"}
+
+    with pytest.raises(jwt.exceptions.InvalidTokenError, match="Unknown kid"):
+        KeySet({"k2": "secret2"}, "k2", legacy_key=None, algorithm="HS256").decode(old_token)
+    with pytest.raises(jwt.exceptions.InvalidTokenError, match="Unknown kid"):
+        KeySet({"k2": "secret2"}, "k2", legacy_key=None, algorithm="HS256").decode(legacy_token)
+
+
+@pytest.mark.anyio
+async def test_token_type_is_enforced():
+    keyset = KeySet({"k1": "secret1"}, "k1", algorithm="HS256")
+    decoder = TokenDecoder(keyset, create_revocation_list())
+    access_token = keyset.encode(create_payload(config.ACCESS_TOKEN_TYPE))
+
+    assert (await decoder.decode(access_token, config.ACCESS_TOKEN_TYPE))[config.SUB] == "user"
+    with pytest.raises(jwt.exceptions.InvalidTokenError, match="Invalid token type"):
+        await decoder.decode(access_token, config.REFRESH_TOKEN_TYPE)
+
+
+@pytest.mark.anyio
+async def test_revoked_token_is_rejected_from_decode_cache():
+    keyset = KeySet({"k1": "secret1"}, "k1", algorithm="HS256")
+    decoder = TokenDecoder(keyset, create_revocation_list())
+    token = keyset.encode(create_payload(config.ACCESS_TOKEN_TYPE))
+    await decoder.decode(token, config.ACCESS_TOKEN_TYPE)
+    assert token in decoder.entries
+
+    assert await decoder.revocations.revoke("jti") is True
+
+    with pytest.raises(jwt.exceptions.InvalidTokenError, match="Token revoked"):
+        await decoder.decode(token, config.ACCESS_TOKEN_TYPE)
+
+
+@pytest.mark.anyio
+async def test_bloom_false_positive_is_checked_in_redis():
+    redis = FakeRedis()
+    revocations = create_revocation_list(redis)
+    await revocations.revoke("revoked")
+    # Filter is loaded from Redis on the first sync
+    await revocations.sync()
+    # Every bit is set, so any jti is a hit
+    revocations.bloom = BloomFilter(capacity=1, error_rate=0.5)
+    revocations.bloom.bits = bytearray(b"\xff" * len(revocations.bloom.bits))
+    revocations.revoked.clear()
+
+    assert await revocations.is_revoked("revoked") is True
+    assert await revocations.is_revoked("not-revoked") is False
+    assert redis.zscore_calls == ["revoked", "not-revoked"]
+
+
+@pytest.mark.anyio
+async def test_revoke_once_across_processes():
+    redis = FakeRedis()
+    first_process, second_process = create_revocation_list(redis), create_revocation_list(redis)
+
+    assert await first_process.revoke("jti") is True
+    assert await first_process.revoke("jti") is False
+    assert await second_process.revoke("jti") is False
+
+
+def use_revocation_list(monkeypatch, revocations: RevocationList) -> None:
+    monkeypatch.setattr(dependencies, "revocation_list", revocations)
+    monkeypatch.setattr(dependencies, "token_decoder", TokenDecoder(dependencies.keyset, revocations))
+
+
+@pytest.mark.anyio
+async def test_refresh_token_works_once(monkeypatch):
+    redis = FakeRedis()
+    first_process = create_revocation_list(redis)
+    # Doesn't see revocations of the first process until the next sync
+    second_process = RevocationList(redis_url=None, sync_interval=3600)
+    second_process.redis = redis
+    await second_process.sync()
+    token_pair = dependencies._create_token_pair("user")
+
+    use_revocation_list(monkeypatch, first_process)
+    new_token_pair = await dependencies.refresh_token_state(token_pair.refresh.token)
+    assert new_token_pair.refresh.payload[config.JTI] != token_pair.refresh.payload[config.JTI]
+    with pytest.raises(jwt.exceptions.InvalidTokenError, match="Token revoked"):
+        await dependencies.decode_access_token(token_pair.access.token)
+
+    # Token passes decoding there, the pair is revoked already in Redis
+    use_revocation_list(monkeypatch, second_process)
+    with pytest.raises(exceptions.AuthFailedException):
+        await dependencies.refresh_token_state(token_pair.refresh.token)